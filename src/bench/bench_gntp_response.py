@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+"""Measure the number of GNTP responses decoded per second.
+
+The ``before`` figure uses the previous decoder which decoded every header
+to ``str``, matched it against an ``if``/``elif`` chain and parsed every
+timestamp with :func:`hiss.utility.parse_datetime`.
+
+Run with ``python src/bench/bench_gntp_response.py``
+"""
+
+import os
+import re
+import sys
+import timeit
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from hiss.handler.gntp.message import Response
+from hiss.utility import parse_datetime
+
+RESPONSE = (b'GNTP/1.0 -OK NONE\r\n'
+            b'Response-Action: NOTIFY\r\n'
+            b'Notification-ID: 4c2e3a1c-29e1-4b11-a4b4-5c3b1d6c7e8f\r\n'
+            b'X-Timestamp: 2014-03-01 12:30:45Z\r\n'
+            b'X-Message-Daemon: Growl/Win\r\n'
+            b'Origin-Machine-Name: OURAGAN\r\n'
+            b'Origin-Software-Name: Growl/Win\r\n'
+            b'Origin-Software-Version: 2.0.9.1\r\n'
+            b'Origin-Platform-Name: Microsoft Windows NT 6.1.7601\r\n'
+            b'Origin-Platform-Version: 6.1.7601.65536\r\n')
+
+HEADER_RE = (r'GNTP\/(?P<version>\d\.\d) (?P<responsetype>\-?[A-Z]+)'
+             r' ((?P<encryptionAlgorithmID>\w+)\:(?P<ivValue>[a-fA-F0-9]+)|NONE)')
+
+FIELDS = {
+    'Response-Action': 'command',
+    'X-Timestamp': 'timestamp',
+    'X-Message-Daemon': 'daemon',
+    'Origin-Machine-Name': 'origin',
+    'Origin-Software-Name': 'origin_software_name',
+    'Origin-Software-Version': 'origin_software_version',
+    'Origin-Platform-Name': 'origin_platform_name',
+    'Origin-Platform-Version': 'origin_platform_version',
+    'Error-Description': 'reason',
+    'Notification-ID': 'nid',
+}
+
+
+def legacy_unmarshal(data):
+    """The decoder as it was before it became table driven."""
+
+    result = {'body': {}}
+    header, data = data.split(b'\r\n', maxsplit=1)
+    m = re.match(HEADER_RE, header.decode('UTF-8'))
+    d = m.groupdict()
+    result['version'] = d['version']
+    result['status'] = d['responsetype'].lstrip('-')
+    if result['status'] == 'OK':
+        result['status_code'] = 0
+
+    for line in [l for l in data.split(b'\r\n') if len(l) != 0]:
+        name, value = line.split(b':', 1)
+        name = name.decode('UTF-8').strip()
+        value = value.decode('UTF-8').strip()
+
+        if name == 'Response-Action':
+            result['command'] = value.lower()
+        elif name in ('X-Timestamp', 'Notification-Callback-Timestamp'):
+            result[FIELDS.get(name, 'callback_timestamp')] = \
+                parse_datetime(value)
+        elif name == 'Error-Code':
+            result['status_code'] = int(value)
+        elif name in FIELDS:
+            result[FIELDS[name]] = value
+        else:
+            result['body'][name] = value
+
+    return result
+
+
+def before():
+    result = legacy_unmarshal(RESPONSE)
+    return result['status'], result['command'], result['nid']
+
+
+def after():
+    response = Response()
+    response.unmarshal(RESPONSE)
+    return response.status, response.command, response.nid
+
+
+def main(number=20000):
+    assert before() == after()
+
+    for name, func in (('before', before), ('after', after)):
+        elapsed = min(timeit.repeat(func, number=number, repeat=3))
+        print('%-6s %10.0f responses/sec' % (name, number / elapsed))
+
+
+if __name__ == '__main__':
+    main()
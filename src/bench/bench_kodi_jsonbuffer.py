@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+"""Measure the number of Kodi JSON-RPC messages split from a TCP stream per
+second.
+
+The stream is a recording of the notifications Kodi sends while a playlist is
+played, interleaved with responses to requests, delivered in 1460 byte
+chunks.
+
+The ``before`` figure uses the previous buffer which walked the stream one
+character at a time and left each message to be decoded with
+:func:`json.loads`. The buffer now returns the decoded messages so the time
+to decode is included in both figures.
+
+Run with ``python src/bench/bench_kodi_jsonbuffer.py``
+"""
+
+import os
+import sys
+import json
+import timeit
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from hiss.handler.kodi.jsonrpc.buffer import JSONBuffer
+
+RECORDING = [
+    '{"jsonrpc":"2.0","method":"Player.OnPlay","params":{"data":{"item":{"id":%(idx)d,"type":"song"},"player":{"playerid":0,"speed":1}},"sender":"xbmc"}}',
+    '{"jsonrpc":"2.0","method":"Player.OnPropertyChanged","params":{"data":{"player":{"playerid":0},"property":{"partymode":false}},"sender":"xbmc"}}',
+    '{"id":"%(idx)d","jsonrpc":"2.0","result":{"item":{"album":"Album \\"%(idx)d\\"","artist":["Artist"],"id":%(idx)d,"label":"Track {%(idx)d}","title":"Track %(idx)d","type":"song"}}}',
+    '{"jsonrpc":"2.0","method":"GUI.OnScreensaverActivated","params":{"data":null,"sender":"xbmc"}}',
+    '{"jsonrpc":"2.0","method":"GUI.OnScreensaverDeactivated","params":{"data":{"shuttingdown":false},"sender":"xbmc"}}',
+    '{"jsonrpc":"2.0","method":"Player.OnPause","params":{"data":{"item":{"id":%(idx)d,"type":"song"},"player":{"playerid":0,"speed":0}},"sender":"xbmc"}}',
+    '{"jsonrpc":"2.0","method":"Player.OnStop","params":{"data":{"end":true,"item":{"id":%(idx)d,"type":"song"}},"sender":"xbmc"}}',
+]
+
+MESSAGE_COUNT = 700
+CHUNK_SIZE = 1460
+
+
+def build_stream():
+    messages = []
+    for idx in range(MESSAGE_COUNT // len(RECORDING)):
+        for message in RECORDING:
+            messages.append(message % {'idx': idx})
+
+    data = ''.join(messages).encode('UTF-8')
+    chunks = [data[pos:pos + CHUNK_SIZE]
+              for pos in range(0, len(data), CHUNK_SIZE)]
+    return messages, chunks
+
+
+class LegacyJSONBuffer(object):
+    """The buffer as it was before it used a regular expression scanner."""
+
+    def __init__(self):
+        self.messsages = []
+
+        self._in_quote = False
+        self._quote_char = ''
+        self._bracket_count = 0
+        self._data = ''
+
+    def append(self, data):
+        if not isinstance(data, str):
+            data = data.decode('UTF-8')
+
+        pos = start = 0
+        end = len(data)
+
+        prev_ch = ''
+
+        while 1:
+            ch = data[pos]
+            if (ch == '"' or ch == "'") and prev_ch != '\\':
+                if not self._in_quote:
+                    self._in_quote = True
+                    self._quote_char = ch
+                elif ch == self._quote_char:
+                    self._in_quote = False
+
+            elif ch == '{':
+                if not self._in_quote:
+                    self._bracket_count += 1
+
+            elif ch == '}':
+                if not self._in_quote:
+                    self._bracket_count -= 1
+
+                    if self._bracket_count == 0:
+                        _data = self._data
+                        _data += data[start:pos+1]
+                        self._data = ''
+                        data = data[pos+1:]
+                        start = 0
+                        end = len(data)
+                        pos = -1
+
+                        self.messsages.append(_data)
+
+                    elif self._bracket_count < 0:
+                        start = pos + 1
+                        self._bracket_count = 0
+
+            prev_ch = ch
+            pos += 1
+
+            if pos == end:
+                break
+
+        self._data += data[start:end]
+
+
+def split(factory, chunks):
+    buf = factory()
+    for chunk in chunks:
+        buf.append(chunk)
+
+    return getattr(buf, 'messages', None) or buf.messsages
+
+
+def split_and_decode(factory, chunks):
+    messages = split(factory, chunks)
+    if factory is LegacyJSONBuffer:
+        messages = [json.loads(m) for m in messages]
+
+    return messages
+
+
+def main(number=5):
+    messages, chunks = build_stream()
+    assert split(LegacyJSONBuffer, chunks) == messages
+    assert split(JSONBuffer, chunks) == [json.loads(m) for m in messages]
+
+    for name, factory in (('before', LegacyJSONBuffer),
+                          ('after', JSONBuffer)):
+        func = lambda: split_and_decode(factory, chunks)
+        elapsed = min(timeit.repeat(func, number=number, repeat=3))
+        print('%-6s %10.0f messages/sec' %
+              (name, len(messages) * number / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+"""Measure the throughput of the SNP request encoder for a registration with
+many notification classes each with a base64 encoded icon.
+
+The ``before`` figure uses the previous encoder which built each command and
+the request by repeated string concatenation.
+
+Run with ``python src/bench/bench_snp_request.py``
+"""
+
+import os
+import sys
+import timeit
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from hiss.handler.snp import Request, snp64
+
+ICON = snp64(os.urandom(16 * 1024))
+CLASSES = 100
+
+
+def build_request():
+    request = Request(version='3.0')
+    request.append('register', app_sig='application/x-vnd-sffjunkie.hiss',
+                   uid='0b57469a-c9dd-451b-8d86-f82ce11ad09f',
+                   title='Benchmark', icon=ICON)
+
+    for idx in range(CLASSES):
+        request.append('addclass', app_sig='application/x-vnd-sffjunkie.hiss',
+                       id=str(idx), name='Class %d' % idx,
+                       text='Notification\r\nclass & number=%d' % idx,
+                       icon=ICON, enabled='1')
+
+    return request
+
+
+def legacy_marshal_command(request, command):
+    """The command encoder as it was before it used a list of segments."""
+
+    data = ''
+
+    names = list(command.parameters.keys())
+    names.sort()
+
+    for name in names:
+        value = command.parameters[name]
+        if isinstance(value, (bytearray, bytes)):
+            data += '%s=%s&' % (name, value.decode('ascii'))
+        else:
+            value = request._escape(request._expand_tuple(value))
+            data += '%s=%s&' % (name, value)
+
+    data = data[:-1]
+    return '%s?%s' % (command.name, data)
+
+
+def legacy_marshal(request):
+    data = 'SNP/3.0 NONE\r\n'
+    for command in request.commands:
+        data += '%s\r\n' % legacy_marshal_command(request, command)
+
+    data += 'END\r\n'
+    return data.encode('UTF-8')
+
+
+def main(number=20):
+    request = build_request()
+    data = request.marshal()
+    assert legacy_marshal(request) == data
+
+    for name, func in (('before', lambda: legacy_marshal(request)),
+                       ('after', request.marshal)):
+        elapsed = min(timeit.repeat(func, number=number, repeat=3))
+        print('%-6s %8.1f requests/sec %8.1f MB/sec' %
+              (name, number / elapsed, len(data) * number / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
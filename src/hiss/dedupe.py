@@ -0,0 +1,107 @@
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+"""Provides a Deduplicator which drops repeats of identical notifications
+sent within a time window.
+"""
+
+import copy
+import time
+import hashlib
+from collections import OrderedDict
+
+__all__ = ['Deduplicator']
+
+DEFAULT_WINDOW = 10.0
+
+
+class Deduplicator(object):
+    """Drop notifications which are identical to one sent within the last
+    ``window`` seconds.
+
+    Notifications are identical if they have the same notifier, notification
+    class, title and text. The first is sent straight away and any repeats
+    within the window are counted and dropped. When ``annotate`` is True
+    the first copy sent after the window has ended has the number of
+    notifications it represents appended to its title e.g. ``Disk full (×12)``
+
+    :param window:   Number of seconds in which repeats are dropped.
+    :type window:    float
+    :param annotate: Append a repeat count to the title of the next copy sent
+    :type annotate:  bool
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, annotate=False):
+        self.window = window
+        self.annotate = annotate
+
+        # Maps content digest -> [window start, repeats dropped]
+        self._seen = OrderedDict()
+
+    def filter(self, notifications):
+        """Return the notifications from ``notifications`` which should be
+        sent.
+
+        :param notifications: Notifications to filter
+        :type notifications:  list of :class:`~hiss.notification.Notification`
+        """
+        now = time.monotonic()
+        self._expire(now)
+
+        accepted = []
+        for notification in notifications:
+            key = self._key(notification)
+            entry = self._seen.get(key)
+
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                continue
+
+            if entry is not None and entry[1] and self.annotate:
+                notification = self._annotate(notification, entry[1] + 1)
+
+            self._seen[key] = [now, 0]
+            self._seen.move_to_end(key)
+            accepted.append(notification)
+
+        return accepted
+
+    def repeats(self, notification):
+        """Return the number of repeats of ``notification`` dropped in the
+        current window."""
+
+        entry = self._seen.get(self._key(notification))
+        if entry is None:
+            return 0
+        else:
+            return entry[1]
+
+    def _expire(self, now):
+        # Entries are kept for a second window so that the count of dropped
+        # repeats is still available when the next copy arrives.
+        expired = now - 2 * self.window
+        while self._seen:
+            key, entry = next(iter(self._seen.items()))
+            if entry[0] > expired:
+                break
+
+            del self._seen[key]
+
+    def _key(self, notification):
+        notifier = notification.notifier
+        if notifier is not None:
+            signature = notifier.signature
+        else:
+            signature = ''
+
+        content = '\0'.join(str(value) for value in (signature,
+                                                     notification.class_id,
+                                                     notification.title,
+                                                     notification.text))
+        return hashlib.sha1(content.encode('UTF-8')).digest()
+
+    def _annotate(self, notification, count):
+        notification = copy.copy(notification)
+        notification.title = '%s (×%d)' % (notification.title or '', count)
+        return notification
@@ -0,0 +1,251 @@
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+"""Provides a Dispatcher which runs the requests a
+:class:`~hiss.notifier.Notifier` sends to its targets with a bounded number
+of requests in flight.
+"""
+
+import heapq
+import asyncio
+from itertools import count
+from functools import partial
+from collections import deque
+
+from hiss.notification import NotificationPriority
+
+__all__ = ['Dispatcher']
+
+DEFAULT_LIMIT = 64
+DEFAULT_TARGET_LIMIT = 4
+DEFAULT_STARVATION_TIMEOUT = 5.0
+
+
+class Dispatcher(object):
+    """Run requests to targets with limits on how many run at once.
+
+    Jobs are pulled from the iterable passed to :meth:`run` only when a slot
+    is free so the coroutine for a request is not created until it can
+    start.
+
+    Jobs waiting for a slot are shared between all calls to :meth:`run` and
+    are started in order of priority and then in the order they were queued.
+    A job which has waited longer than ``starvation_timeout`` is started
+    before any higher priority job so that low priority notifications are
+    still sent when the queue is busy.
+
+    :param limit:         Maximum number of requests in flight.
+    :type limit:          int
+    :param target_limit:  Maximum number of requests in flight to a single
+                          target or ``None`` for no limit.
+    :type target_limit:   int
+    :param scheme_limits: Maximum number of requests in flight per target
+                          scheme e.g. ``{'snp': 16}``
+    :type scheme_limits:  dict
+    :param starvation_timeout: Number of seconds after which a queued job
+                               is started regardless of its priority.
+    :type starvation_timeout:  float
+    :param loop:          :mod:`asyncio` event loop to use.
+    :type loop:           :class:`asyncio.BaseEventLoop`
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT,
+                 target_limit=DEFAULT_TARGET_LIMIT,
+                 scheme_limits=None,
+                 starvation_timeout=DEFAULT_STARVATION_TIMEOUT,
+                 loop=None):
+        if limit < 1:
+            raise ValueError('limit must be at least 1')
+
+        self.limit = limit
+        self.target_limit = target_limit
+        self.scheme_limits = scheme_limits or {}
+        self.starvation_timeout = starvation_timeout
+        self.loop = loop
+
+        self._running = 0
+        self._in_flight = {}
+        self._by_priority = []
+        self._by_age = deque()
+        self._sequence = count()
+
+    @asyncio.coroutine
+    def run(self, jobs, result_handler=None):
+        """Run jobs returning a list of their results in the order they
+        completed.
+
+        :param jobs:           Iterable of ``(target, job, priority)`` tuples
+                               where ``job`` is a callable which returns the
+                               coroutine to run and ``priority`` is a
+                               :class:`~hiss.notification.NotificationPriority`
+        :type jobs:            iterable
+        :param result_handler: Callable which is passed each result as it
+                               arrives.
+        :type result_handler:  callable
+        """
+        jobs = iter(jobs)
+        exhausted = False
+        pending = set()
+        results = []
+
+        try:
+            while True:
+                # Only ``limit`` jobs from each call are queued at a time so
+                # that a large batch does not get pulled into memory.
+                while not exhausted and len(pending) < self.limit:
+                    try:
+                        target, job, priority = next(jobs)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    pending.add(self._enqueue(target, job, priority))
+
+                if not pending:
+                    break
+
+                done, pending = yield from asyncio.wait(pending,
+                    return_when=asyncio.FIRST_COMPLETED)
+
+                for future in done:
+                    result = future.result()
+                    results.append(result)
+                    if result_handler is not None:
+                        result_handler(result)
+        finally:
+            for future in pending:
+                future.cancel()
+
+        return results
+
+    def __len__(self):
+        """The number of jobs waiting for a free slot."""
+
+        return sum(1 for item in self._by_age if not item.done)
+
+    def _enqueue(self, target, job, priority):
+        if isinstance(priority, NotificationPriority):
+            priority = priority.value
+
+        item = _QueueItem(target, job, priority, next(self._sequence),
+                          self._time(), asyncio.Future(loop=self.loop))
+        item.future.add_done_callback(partial(self._cancelled, item))
+
+        heapq.heappush(self._by_priority, item)
+        self._by_age.append(item)
+        self._schedule()
+        return item.future
+
+    def _schedule(self):
+        while self._running < self.limit:
+            item = self._next_item()
+            if item is None:
+                break
+
+            self._start(item)
+
+    def _next_item(self):
+        while self._by_age and self._by_age[0].done:
+            self._by_age.popleft()
+
+        starved = self._time() - self.starvation_timeout
+        for item in self._by_age:
+            if item.queued > starved:
+                break
+
+            if not item.done and self._available(item.target):
+                return item
+
+        held = []
+        found = None
+        while self._by_priority:
+            item = heapq.heappop(self._by_priority)
+            if item.done:
+                continue
+
+            if self._available(item.target):
+                found = item
+                break
+
+            held.append(item)
+
+        for item in held:
+            heapq.heappush(self._by_priority, item)
+
+        return found
+
+    def _available(self, target):
+        if self.target_limit is not None:
+            if self._in_flight.get(self._key(target), 0) >= self.target_limit:
+                return False
+
+        scheme_limit = self.scheme_limits.get(target.scheme)
+        if scheme_limit is not None:
+            if self._in_flight.get(target.scheme, 0) >= scheme_limit:
+                return False
+
+        return True
+
+    def _start(self, item):
+        self._running += 1
+        for key in (self._key(item.target), item.target.scheme):
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+        item.task = asyncio.async(item.job(), loop=self.loop)
+        item.task.add_done_callback(partial(self._finished, item))
+
+    def _finished(self, item, task):
+        self._running -= 1
+        for key in (self._key(item.target), item.target.scheme):
+            in_flight = self._in_flight[key] - 1
+            if in_flight:
+                self._in_flight[key] = in_flight
+            else:
+                del self._in_flight[key]
+
+        if not item.future.done():
+            if task.cancelled():
+                item.future.cancel()
+            elif task.exception() is not None:
+                item.future.set_exception(task.exception())
+            else:
+                item.future.set_result(task.result())
+
+        self._schedule()
+
+    def _cancelled(self, item, future):
+        if future.cancelled() and item.task is not None:
+            item.task.cancel()
+
+    def _key(self, target):
+        return repr(target)
+
+    def _time(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        return self.loop.time()
+
+
+class _QueueItem(object):
+    __slots__ = ('target', 'job', 'priority', 'sequence', 'queued',
+                 'future', 'task')
+
+    def __init__(self, target, job, priority, sequence, queued, future):
+        self.target = target
+        self.job = job
+        self.priority = priority
+        self.sequence = sequence
+        self.queued = queued
+        self.future = future
+        self.task = None
+
+    @property
+    def done(self):
+        """True once the job has been started or is no longer wanted."""
+        return self.task is not None or self.future.cancelled()
+
+    def __lt__(self, other):
+        return (-self.priority, self.sequence) < \
+               (-other.priority, other.sequence)
@@ -11,12 +11,81 @@ import asyncio
 import logging
 import traceback
 
+from hiss.resource import Resource
+from hiss.utility import prime_local_hosts
+from hiss.handler.pool import ConnectionPool
+from hiss.handler.ratelimit import RateLimiter
+
+# Notifications for a target are collected for this many seconds before being
+# sent as a single request when batching is enabled.
+DEFAULT_BATCH_WINDOW = 0.01
+
+# The maximum number of notifications sent in a single request
+DEFAULT_BATCH_SIZE = 16
+
 
 class AIOHandler():
     """Notification handler base class for :mod:`asyncio`."""
     
     def __init__(self, loop=None):
         self.loop = loop
+        self.pool = None
+        self.rate_limiter = RateLimiter(loop=loop)
+
+        self.batch_window = None
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self._batches = {}
+
+    def use_pool(self, **kwargs):
+        """Keep connections to targets open between requests.
+
+        Keyword arguments are passed to the
+        :class:`~hiss.handler.pool.ConnectionPool` constructor.
+        """
+        if self.pool is not None:
+            self.pool.close()
+
+        self.pool = ConnectionPool(self.connect, loop=self.loop, **kwargs)
+
+    def use_rate_limit(self, rate, burst=1):
+        """Limit the rate at which requests are sent to each target.
+
+        Requests above the rate are held until they can be sent. The rate for
+        a target is reduced automatically if the target reports that it is
+        being flooded.
+
+        :param rate:  Requests per second for each target or ``None`` to only
+                      limit targets which report flooding.
+        :type rate:   float
+        :param burst: Number of requests which can be sent before the rate
+                      applies.
+        :type burst:  int
+        """
+        self.rate_limiter = RateLimiter(rate, burst, loop=self.loop)
+
+    def use_batching(self, window=DEFAULT_BATCH_WINDOW,
+                     size=DEFAULT_BATCH_SIZE):
+        """Send notifications for the same target together.
+
+        Notifications are held for up to ``window`` seconds, or until ``size``
+        notifications are waiting, and then passed to the protocol's
+        ``notify_batch`` method to be sent to the target in a single request.
+        Only handlers whose protocols provide ``notify_batch`` support
+        batching.
+
+        When notifications are sent with :meth:`hiss.notifier.Notifier.notify`
+        the dispatcher's ``target_limit`` also limits the number of
+        notifications which can be waiting in a batch for each target so
+        ``size`` should not be larger than it.
+
+        :param window: Number of seconds to wait for further notifications
+                       or ``None`` to turn batching off.
+        :type window:  float
+        :param size:   Maximum number of notifications in a request.
+        :type size:    int
+        """
+        self.batch_window = window
+        self.batch_size = size
 
     @asyncio.coroutine
     def connect(self, target, factory=None):
@@ -42,10 +111,59 @@ class AIOHandler():
         (_transport, protocol) = yield from self.loop.create_connection(factory,
             target.host, target.port)
 
+        # Setting the target decides whether it is remote
+        yield from prime_local_hosts(self.loop)
         protocol.target = target
 
         return protocol
 
+    @asyncio.coroutine
+    def acquire(self, target):
+        """Return a protocol connected to ``target``, from the connection
+        pool if one is in use.
+
+        :param target: The target to connect to
+        :type target:  :class:`~hiss.target.Target`
+        """
+        if self.pool is None:
+            protocol = yield from self.connect(target)
+        else:
+            target.handler = self
+            target.port = self.port
+            protocol = yield from self.pool.acquire(target)
+
+        return protocol
+
+    def release(self, protocol):
+        """Return a protocol obtained from :meth:`acquire` once a request has
+        completed."""
+
+        if self.pool is not None:
+            self.pool.release(protocol)
+
+    def discard(self, protocol):
+        """Close a protocol obtained from :meth:`acquire` whose request
+        failed instead of returning it to the pool."""
+
+        if self.pool is not None:
+            protocol.connection_lost_handler = None
+
+        close = getattr(protocol, 'close', None)
+        if close is not None:
+            close()
+
+    def close(self):
+        """Close any pooled connections."""
+
+        if self.pool is not None:
+            self.pool.close()
+
+    def not_registered(self, response):
+        """Return True if ``response`` shows that the target does not have
+        the notifier registered."""
+
+        return False
+
     @asyncio.coroutine
     def register(self, notifier, target, **kwargs):
         """Connect to a target and register the notifier.
@@ -57,13 +175,10 @@ class AIOHandler():
         """
 
         if 'register' in self.capabilities:
-            try:
-                protocol = yield from self.connect(target)
-            except:
-                return self._connect_exception(sys.exc_info())
+            icons = [info.icon for info in notifier.notification_classes.values()]
+            yield from self._load_resources(notifier.icon, *icons)
 
-            response = yield from protocol.register(notifier, **kwargs)
-            response['handler'] = self.__name__
+            response = yield from self._send(target, 'register', notifier, **kwargs)
             return response
         else:
             return self._unsupported()
@@ -78,13 +193,14 @@ class AIOHandler():
         :type target:        :class:`~hiss.target.Target`
         """
 
-        try:
-            protocol = yield from self.connect(target)
-        except:
-            return self._connect_exception(sys.exc_info())
+        yield from self._load_resources(notification.icon)
+
+        if self.batch_window is None:
+            response = yield from self._send(target, 'notify', notification,
+                                             notification.notifier)
+        else:
+            response = yield from self._add_to_batch(notification, target)
 
-        response = yield from protocol.notify(notification, notification.notifier)
-        response['handler'] = self.__name__
         return response
 
     @asyncio.coroutine
@@ -98,13 +214,7 @@ class AIOHandler():
         """
 
         if 'unregister' in self.capabilities:
-            try:
-                protocol = yield from self.connect(target)
-            except:
-                return self._connect_exception(sys.exc_info())
-
-            response = yield from protocol.unregister(notifier)
-            response['handler'] = self.__name__
+            response = yield from self._send(target, 'unregister', notifier)
             return response
         else:
             return self._unsupported()
@@ -120,13 +230,7 @@ class AIOHandler():
         """
 
         if 'show' in self.capabilities:
-            try:
-                protocol = yield from self.connect(target)
-            except:
-                return self._connect_exception(sys.exc_info())
-
-            response = yield from protocol.show(uid)
-            response['handler'] = self.__name__
+            response = yield from self._send(target, 'show', uid)
             return response
         else:
             return self._unsupported()
@@ -142,13 +246,7 @@ class AIOHandler():
         """
 
         if 'hide' in self.capabilities:
-            try:
-                protocol = yield from self.connect(target)
-            except:
-                return self._connect_exception(sys.exc_info())
-
-            response = yield from protocol.hide(uid)
-            response['handler'] = self.__name__
+            response = yield from self._send(target, 'hide', uid)
             return response
         else:
             return self._unsupported()
@@ -164,13 +262,7 @@ class AIOHandler():
         """
 
         if 'isvisible' in self.capabilities:
-            try:
-                protocol = yield from self.connect(target)
-            except:
-                return self._connect_exception(sys.exc_info())
-
-            response = yield from protocol.isvisible(uid)
-            response['handler'] = self.__name__
+            response = yield from self._send(target, 'isvisible', uid)
             return response
         else:
             return self._unsupported()
@@ -191,6 +283,123 @@ class AIOHandler():
         else:
             return self._unsupported()
 
+    @asyncio.coroutine
+    def _send(self, target, command, *args, **kwargs):
+        """Call the protocol method named ``command`` on a connection to
+        ``target``"""
+
+        yield from self.rate_limiter.acquire(target)
+
+        try:
+            protocol = yield from self.acquire(target)
+        except:
+            return self._connect_exception(sys.exc_info())
+
+        try:
+            response = yield from self._call(protocol, command, args, kwargs)
+        except ConnectionError:
+            if self.pool is None:
+                return self._connect_exception(sys.exc_info())
+
+            # The target may have closed a pooled connection whilst it was
+            # idle so retry once on a new connection.
+            logging.debug('Handler: Retrying %s on new connection' % command)
+            try:
+                protocol = yield from self.pool.connect(target)
+                response = yield from self._call(protocol, command, args,
+                                                 kwargs)
+            except ConnectionError:
+                return self._connect_exception(sys.exc_info())
+
+        self.release(protocol)
+        self._feedback(target, response)
+        response['handler'] = self.__name__
+        return response
+
+    def _add_to_batch(self, notification, target):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        key = repr(target)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = _Batch(target)
+            batch.timer = self.loop.call_later(self.batch_window,
+                                               self._flush, key)
+            self._batches[key] = batch
+
+        waiter = asyncio.Future(loop=self.loop)
+        batch.notifications.append(notification)
+        batch.waiters.append(waiter)
+
+        if len(batch.notifications) >= self.batch_size:
+            self._flush(key)
+
+        return waiter
+
+    def _flush(self, key):
+        batch = self._batches.pop(key, None)
+        if batch is not None:
+            batch.timer.cancel()
+            asyncio.async(self._send_batch(batch), loop=self.loop)
+
+    @asyncio.coroutine
+    def _send_batch(self, batch):
+        try:
+            response = yield from self._send(batch.target, 'notify_batch',
+                                             batch.notifications)
+        except Exception as exc:
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+            return
+
+        # A failure to connect returns a single response for the whole batch
+        results = response.pop('results', None)
+        for idx, waiter in enumerate(batch.waiters):
+            if results is None:
+                result = dict(response)
+            else:
+                result = results[idx]
+                result['handler'] = self.__name__
+
+            if not waiter.done():
+                waiter.set_result(result)
+
+    @asyncio.coroutine
+    def _call(self, protocol, command, args, kwargs):
+        """Call the protocol method named ``command`` discarding the protocol
+        if the call fails so that a broken connection is not reused or left
+        open."""
+
+        try:
+            response = yield from getattr(protocol, command)(*args, **kwargs)
+        except BaseException:
+            self.discard(protocol)
+            raise
+
+        return response
+
+    @asyncio.coroutine
+    def _load_resources(self, *resources):
+        """Load the data for any :class:`~hiss.resource.Resource` in
+        ``resources`` so that marshalling a request does not block reading
+        it."""
+
+        loads = [resource.load() for resource in resources
+                 if isinstance(resource, Resource)]
+        if loads:
+            results = yield from asyncio.gather(*loads, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logging.debug('Handler: Unable to load resource %s' % result)
+
+    def _feedback(self, target, response):
+        """Adjust the rate limit for ``target`` based on a response."""
+
+        if response.get('status') == 'OK':
+            self.rate_limiter.accepted(target)
+
     def _connect_exception(self, exc_info):
         response = {
             'handler': self.__name__,
@@ -207,3 +416,13 @@ class AIOHandler():
             'reason': 'Unsupported',
         }
         return response
+
+
+class _Batch(object):
+    __slots__ = ('target', 'notifications', 'waiters', 'timer')
+
+    def __init__(self, target):
+        self.target = target
+        self.notifications = []
+        self.waiters = []
+        self.timer = None
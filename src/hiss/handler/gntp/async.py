@@ -5,12 +5,34 @@
 import asyncio
 import logging
 from pprint import pformat
+from functools import partial
+from collections import OrderedDict
 
+from hiss.exception import MarshalError
 from hiss.handler.aio import AIOHandler
 from hiss.handler.gntp import GNTP_DEFAULT_PORT
 from .message import (RegisterRequest, UnregisterRequest,
                       NotifyRequest, SubscribeRequest,
-                      Response)
+                      ResponseParser)
+
+# Maximum number of requests in flight on a pipelined connection before
+# further requests are sent on a pooled connection.
+DEFAULT_PIPELINE_DEPTH = 8
+
+# Maximum number of resource identifiers remembered for each target
+DEFAULT_DELIVERED_RESOURCES = 256
+
+# Number of seconds to wait for the response to a request
+DEFAULT_RESPONSE_TIMEOUT = 30.0
+
+# Error codes returned when the application or notification type has not
+# been registered.
+UNKNOWN_APPLICATION = 401
+UNKNOWN_NOTIFICATION = 402
+
+# Maximum number of notifications on a connection waiting for a callback.
+# When more are sent the oldest stop waiting for their callback.
+MAX_PENDING_CALLBACKS = 1024
 
 
 class GNTPHandler(AIOHandler):
@@ -24,20 +46,173 @@ class GNTPHandler(AIOHandler):
         self.port = GNTP_DEFAULT_PORT
         self.factory = lambda: GNTPProtocol()
         self.capabilities = ['register', 'subscribe']
+        self.use_pool()
+
+        self.delivered_resources = None
+
+        self.pipeline_depth = None
+        self._sessions = {}
+
+    def use_pipelining(self, depth=DEFAULT_PIPELINE_DEPTH):
+        """Send the requests for a target over a single connection which is
+        kept open.
+
+        Requests are written without waiting for the responses to earlier
+        requests and the responses are matched to their requests by
+        Notification-ID or the order they arrive in. Callbacks for
+        notifications arrive on the same connection and are passed to the
+        notifier's :meth:`~hiss.notifier.Notifier.events_received` method.
+
+        :param depth: Maximum number of requests in flight on the connection
+                      or ``None`` to turn pipelining off.
+        :type depth:  int
+        """
+        self.pipeline_depth = depth
+
+    def use_resource_cache(self, size=DEFAULT_DELIVERED_RESOURCES):
+        """Only send references to resources, such as icons, which have
+        already been delivered to a target.
+
+        Use this with receivers which cache ``x-growl-resource://`` data. If a
+        target returns an error for a request which was sent without some
+        resource data then all the resources are sent with the next request.
+
+        :param size: Number of resource identifiers to remember per target.
+        :type size:  int
+        """
+        self.delivered_resources = DeliveredResources(size)
+
+    @asyncio.coroutine
+    def acquire(self, target):
+        """Augment the :meth:`hiss.handler.Handler.acquire` to return the
+        shared connection to ``target`` when pipelining is turned on and to
+        pass on the resources already delivered to the target."""
+
+        if self.pipeline_depth is None:
+            protocol = yield from super().acquire(target)
+            protocol.delivered_resources = self.delivered_resources
+            return protocol
+
+        key = repr(target)
+        session = self._sessions.get(key)
+        if session is not None and session.done() and \
+                (session.exception() is not None or
+                 not session.result().is_connected):
+            session = None
+
+        if session is None:
+            session = asyncio.async(self._open_session(key, target),
+                                    loop=self.loop)
+            self._sessions[key] = session
+
+        try:
+            protocol = yield from asyncio.shield(session)
+        except:
+            if self._sessions.get(key) is session:
+                del self._sessions[key]
+            raise
+
+        if protocol.in_flight >= self.pipeline_depth:
+            protocol = yield from super().acquire(target)
+
+        protocol.delivered_resources = self.delivered_resources
+        return protocol
+
+    def release(self, protocol):
+        """Augment the :meth:`hiss.handler.Handler.release` to keep
+        pipelined connections out of the pool."""
+
+        if not protocol.pipelined:
+            super().release(protocol)
+
+    def discard(self, protocol):
+        """Augment the :meth:`hiss.handler.Handler.discard` to leave
+        pipelined connections open for the other requests sharing them."""
+
+        if not protocol.pipelined:
+            super().discard(protocol)
+
+    def not_registered(self, response):
+        return response.get('status_code') in (UNKNOWN_APPLICATION,
+                                               UNKNOWN_NOTIFICATION)
+
+    def close(self):
+        """Close pooled and pipelined connections."""
+
+        super().close()
+
+        for session in self._sessions.values():
+            if session.done() and session.exception() is None:
+                session.result().close()
+            else:
+                session.cancel()
+
+        self._sessions.clear()
+
+    @asyncio.coroutine
+    def _open_session(self, key, target):
+        protocol = yield from self.connect(target)
+        protocol.pipelined = True
+        protocol.connection_lost_handler = partial(self._session_lost, key)
+        return protocol
+
+    def _session_lost(self, key, protocol):
+        session = self._sessions.get(key)
+        if session is not None and session.done() and \
+                session.exception() is None and session.result() is protocol:
+            del self._sessions[key]
 
 
 class GNTPProtocol(asyncio.Protocol):
     def __init__(self):
+        self.delivered_resources = None
         self._target = None
-        self._buffer = None
+        self._parser = None
+        self._transport = None
         self.use_encryption = False
         self.use_hash = False
+        self.reusable = True
+        self.pipelined = False
+        self.connection_lost_handler = None
+        self.response_timeout = DEFAULT_RESPONSE_TIMEOUT
+        # Maps Notification-ID, or the waiter itself for requests without
+        # one, to (command, waiter) in the order the requests were sent.
+        self._waiters = OrderedDict()
+        self._callback_notifiers = OrderedDict()
 
     def connection_made(self, transport):
         self.response = None
-        self._buffer = bytearray()
+        self._parser = ResponseParser()
         self._transport = transport
 
+    def connection_lost(self, exc):
+        self._transport = None
+
+        waiters = [waiter for _command, waiter in self._waiters.values()]
+        self._waiters.clear()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(
+                    ConnectionError('Connection to %s lost' % self.target))
+
+        self._callback_notifiers.clear()
+
+        if self.connection_lost_handler is not None:
+            self.connection_lost_handler(self)
+
+    @property
+    def is_connected(self):
+        return self._transport is not None
+
+    @property
+    def in_flight(self):
+        """The number of requests waiting for a response."""
+        return len(self._waiters)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+
     @property
     def target(self):
         return self._target
@@ -49,57 +224,144 @@ class GNTPProtocol(asyncio.Protocol):
             self.use_hash = True
 
     def send_request(self, request, target):
+        """Send a request to the target.
+
+        :returns: A :class:`asyncio.Future` which will receive the response.
+        """
         if target.password is not None and (self.use_hash or self.use_encryption):
             request.password = target.password.encode('UTF-8')
             request.use_hash = self.use_hash
             request.use_encryption = self.use_encryption
 
-        request_data = request.marshal()
-        self._transport.write(request_data)
+        if self._transport is None:
+            raise ConnectionError('Connection to %s lost' % self.target)
+
+        if self.delivered_resources is not None and request.identifiers:
+            request.omit_identifiers = self.delivered_resources.known(target)
+
+        segments = request.marshal_segments()
+
+        # Responses are matched to requests by Notification-ID where the
+        # response has one, otherwise to the oldest request for the same
+        # command as error responses do not include the Notification-ID.
+        waiter = asyncio.Future()
+        key = request.body.get('Notification-ID')
+        if key is None:
+            key = waiter
+        self._waiters[key] = (request.command.lower(), waiter)
+
+        if self.response_timeout is not None:
+            handle = asyncio.get_event_loop().call_later(
+                self.response_timeout, self._timed_out, key, waiter)
+            waiter.add_done_callback(lambda f: handle.cancel())
+
+        if self.delivered_resources is not None and request.identifiers:
+            waiter.add_done_callback(partial(self._resources_sent,
+                                             target, request))
+
+        self._transport.writelines(segments)
+        return waiter
+
+    def _resources_sent(self, target, request, waiter):
+        if waiter.cancelled() or waiter.exception() is not None:
+            return
+
+        ids = [i['Identifier'] for i in request.identifiers]
+        if waiter.result()['status'] == 'OK':
+            self.delivered_resources.add(target, ids)
+        elif request.omit_identifiers:
+            # The target may no longer have the data we left out
+            self.delivered_resources.forget(target)
 
     @asyncio.coroutine
-    def _wait_for_response(self):
-        while True:
-            if self.response is not None:
-                return
-            else:
-                yield from asyncio.sleep(0.1)
+    def _wait_for_response(self, waiter):
+        self.response = yield from waiter
+        return self.response
 
-    def data_received(self, data):
-        self._buffer.extend(data)
+    def _timed_out(self, key, waiter):
+        entry = self._waiters.get(key)
+        if entry is not None and entry[1] is waiter:
+            del self._waiters[key]
+
+        if not waiter.done():
+            waiter.set_exception(asyncio.TimeoutError(
+                'No response from %s' % self.target))
+
+    def _resolve(self, nid, command, result):
+        if nid is None:
+            nid = self._oldest(command)
+
+        entry = self._waiters.pop(nid, None)
+        if entry is None:
+            logging.debug('GNTPProtocol: Unexpected response %s' % result)
+            return
 
-        callback_response = None
-        items = [i for i in self._buffer.split(b'\r\n\r\n') if len(i) > 0]
-        if len(items) > 1:
-            response_data = items[0]
-            callback_data = items[1]
+        _command, waiter = entry
+        if not waiter.done():
+            waiter.set_result(result)
 
-            callback_response = Response()
-            callback_response.unmarshal(callback_data)
+    def _oldest(self, command):
+        """Return the key of the oldest request waiting for a response to
+        ``command`` or of any request if ``command`` is empty."""
+
+        for key, (request_command, _waiter) in self._waiters.items():
+            if not command or request_command == command:
+                return key
+
+        return None
+
+    def data_received(self, data):
+        # When requests are pipelined several responses, and the callbacks
+        # for earlier notifications, can arrive in the same chunk of data.
+        try:
+            responses = self._parser.feed(data)
+        except MarshalError as exc:
+            # The stream can no longer be trusted so close the connection
+            # which fails any requests waiting for a response.
+            logging.error('%s: %s' % (self.__class__.__name__, exc))
+            if self._transport is not None:
+                self._transport.close()
+            return
+
+        callbacks = OrderedDict()
+        for response in responses:
+            if response.status == 'CALLBACK':
+                cb_result = {}
+                cb_result['nid'] = getattr(response, 'nid', None)
+                cb_result['status'] = response.callback_status
+                cb_result['timestamp'] = response.callback_timestamp
+                callbacks[cb_result['nid']] = cb_result
+
+        for response in responses:
+            if response.status == 'CALLBACK':
+                continue
+
+            result = {}
+            result['command'] = response.command
+            result['handler'] = 'GNTP'
+            result['status'] = response.status
+            result['status_code'] = getattr(response, 'status_code', None)
+            result['timestamp'] = getattr(response, 'timestamp', None)
+            result['target'] = str(self.target)
+            if response.status =='ERROR':
+                result['reason'] = getattr(response, 'reason', '')
+
+            nid = getattr(response, 'nid', None)
+            if nid in callbacks:
+                result['callback'] = callbacks.pop(nid)
+                self._callback_notifiers.pop(nid, None)
+
+            self._resolve(nid, response.command, result)
+
+        for cb_result in callbacks.values():
+            self._callback_received(cb_result)
+
+    def _callback_received(self, cb_result):
+        notifier = self._callback_notifiers.pop(cb_result['nid'], None)
+        if notifier is None:
+            logging.debug('GNTPProtocol: Unexpected callback %s' % cb_result)
         else:
-            response_data = items[0]
-
-        response = Response()
-        response.unmarshal(response_data)
-
-        result = {}
-        result['command'] = response.command
-        result['handler'] = 'GNTP'
-        result['status'] = response.status
-        result['status_code'] = response.status_code
-        result['timestamp'] = response.timestamp
-        result['target'] = str(self.target)
-        if response.status =='ERROR':
-            result['reason'] = response.reason
-
-        if callback_response is not None:
-            cb_result = {}
-            cb_result['nid'] = callback_response.nid
-            cb_result['status'] = callback_response.callback_status
-            cb_result['timestamp'] = callback_response.callback_timestamp
-            result['callback'] = cb_result
-
-        self.response = result
+            asyncio.async(notifier.events_received([cb_result]))
 
     @asyncio.coroutine
     def register(self, notifier):
@@ -110,20 +372,20 @@ class GNTPProtocol(asyncio.Protocol):
         """
 
         request = RegisterRequest(notifier)
-        self.send_request(request, self.target)
-        yield from self._wait_for_response()
-        logging.debug(pformat(self.response))
-        return self.response
+        waiter = self.send_request(request, self.target)
+        response = yield from self._wait_for_response(waiter)
+        logging.debug(pformat(response))
+        return response
 
     @asyncio.coroutine
     def unregister(self, notifier):
         """Unregister the notifier from the target"""
 
         request = UnregisterRequest(notifier)
-        self.send_request(request, self.target)
-        yield from self._wait_for_response()
-        logging.debug(pformat(self.response))
-        return self.response
+        waiter = self.send_request(request, self.target)
+        response = yield from self._wait_for_response(waiter)
+        logging.debug(pformat(response))
+        return response
 
     @asyncio.coroutine
     def notify(self, notification, notifier):
@@ -133,11 +395,21 @@ class GNTPProtocol(asyncio.Protocol):
         :type notification: :class:`~hiss.notification.Notification`
         """
 
+        # Growl keeps the connection open to deliver the callback so it
+        # cannot be used for any further requests unless the callbacks are
+        # being demultiplexed from a pipelined connection.
+        if notification.callback is not None:
+            self._callback_notifiers[notification.uid] = notifier
+            if len(self._callback_notifiers) > MAX_PENDING_CALLBACKS:
+                self._callback_notifiers.popitem(last=False)
+            if not self.pipelined:
+                self.reusable = False
+
         request = NotifyRequest(notification, notifier)
-        self.send_request(request, self.target)
-        yield from self._wait_for_response()
-        logging.debug(pformat(self.response))
-        return self.response
+        waiter = self.send_request(request, self.target)
+        response = yield from self._wait_for_response(waiter)
+        logging.debug(pformat(response))
+        return response
 
     @asyncio.coroutine
     def subscribe(self, notifier, signatures):
@@ -153,7 +425,44 @@ class GNTPProtocol(asyncio.Protocol):
         self._async_handler = notifier._handler
 
         request = SubscribeRequest(notifier)
-        self.send_request(request, self.target)
-        yield from self._wait_for_response()
-        logging.debug(pformat(self.response))
-        return self.response
+        waiter = self.send_request(request, self.target)
+        response = yield from self._wait_for_response(waiter)
+        logging.debug(pformat(response))
+        return response
+
+
+class DeliveredResources(object):
+    """Remembers the identifiers of the resources each target has received.
+
+    :param size: Number of identifiers to remember per target.
+    :type size:  int
+    """
+
+    def __init__(self, size=DEFAULT_DELIVERED_RESOURCES):
+        self.size = size
+        self._targets = {}
+
+    def known(self, target):
+        """Return a frozenset of the identifiers ``target`` has received."""
+
+        ids = self._targets.get(target.address)
+        if ids is None:
+            return frozenset()
+
+        return frozenset(ids)
+
+    def add(self, target, ids):
+        """Record that ``target`` has received the resources ``ids``"""
+
+        delivered = self._targets.setdefault(target.address, OrderedDict())
+        for uid in ids:
+            delivered.pop(uid, None)
+            delivered[uid] = None
+
+        while len(delivered) > self.size:
+            delivered.popitem(last=False)
+
+    def forget(self, target):
+        """Forget all the resources delivered to ``target``"""
+
+        self._targets.pop(target.address, None)
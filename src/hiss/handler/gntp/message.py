@@ -1,5 +1,6 @@
 import logging
 import re
+import hashlib
 from binascii import unhexlify
 from datetime import datetime
 from os import urandom
@@ -21,6 +22,10 @@ class Request(object):
         self.sections = []
         self.identifiers = []
 
+        self.omit_identifiers = frozenset()
+        """Identifiers whose data the receiver already has. Only references
+        to them are sent."""
+
         self.use_hash = False
         self.use_encryption = False
 
@@ -30,6 +35,21 @@ class Request(object):
     def marshal(self, encoding='UTF-8'):
         """marshal the request ready to send over the wire."""
 
+        self._prepare()
+        return bytearray().join(self._marshal_segments(encoding))
+
+    def marshal_segments(self, encoding='UTF-8'):
+        """Marshal the request into a list of buffers which can be sent using
+        :meth:`asyncio.WriteTransport.writelines`.
+
+        Headers are returned as :class:`bytes` and resource data as
+        :class:`memoryview` objects over the resource's data so that large
+        icons are not copied for each request.
+        """
+        self._prepare()
+        return self._marshal_segments(encoding)
+
+    def _prepare(self):
         if self.use_hash or self.use_encryption:
             if self.password is None:
                 raise MarshalError('Password required to generate hash for marshaling of request.',
@@ -48,6 +68,7 @@ class Request(object):
 
             self._encryption = (ENCRYPTION_ALGORITHM, iv)
 
+    def _marshal_segments(self, encoding):
         header = 'GNTP/%s %s' % (self.version, self.command)
         if self._encryption is not None:
             header += ' %s:%s' % self._encryption
@@ -58,47 +79,48 @@ class Request(object):
             header += ' %s:%s.%s' % self._hash
 
         header += '\r\n'
-        data = bytearray(header.encode(encoding))
 
-        body_data = bytearray()
-        for name, value in iter(sorted(self.body.items())):
-            body_data.extend(('%s: %s\r\n' % (name, value)).encode(encoding))
-
-        body_data.extend(('\r\n').encode(encoding))
-
-        if self._encryption is not None:
-            body_data = self._encrypt(body_data)
+        # Adjacent header text is joined into a single segment and each
+        # resource's data becomes a segment of its own.
+        segments = []
+        pending = [header.encode(encoding)]
 
-        data.extend(body_data)
+        lines = ['%s: %s\r\n' % item for item in sorted(self.body.items())]
+        lines.append('\r\n')
+        pending.append(self._encode_section(lines, encoding))
 
         for section in self.sections:
-            section_data = bytearray()
+            lines = []
             for name, value in section.items():
                 if isinstance(value, self._IdReference):
-                    section_data.extend(('%s: x-growl-resource//%s\r\n' % (name, str(value))).encode(encoding))
+                    lines.append('%s: x-growl-resource//%s\r\n' % (name, str(value)))
                 else:
-                    section_data.extend(('%s: %s\r\n' % (name, value)).encode(encoding))
-
-            section_data.extend(('\r\n').encode(encoding))
-
-            if self._encryption is not None:
-                section_data = self._encrypt(section_data)
+                    lines.append('%s: %s\r\n' % (name, value))
 
-            data.extend(section_data)
+            lines.append('\r\n')
+            pending.append(self._encode_section(lines, encoding))
 
         for identifier in self.identifiers:
-            identifier_data = bytearray()
-            identifier_data.extend(('Identifier: %s\r\n' % identifier['Identifier']).encode(encoding))
-            idata = identifier['Data']
-            identifier_data.extend(('Length: %d\r\n\r\n' % len(idata)).encode(encoding))
+            if identifier['Identifier'] in self.omit_identifiers:
+                continue
 
+            idata = identifier['Data']
             if self._encryption is not None:
                 idata = self._encrypt(idata)
 
-            identifier_data.extend(idata)
-            identifier_data.extend(('\r\n\r\n').encode(encoding))
+            pending.append(('Identifier: %s\r\nLength: %d\r\n\r\n' %
+                            (identifier['Identifier'], len(idata))).encode(encoding))
+            segments.append(b''.join(pending))
+            segments.append(memoryview(idata))
+            pending = [b'\r\n\r\n']
+
+        segments.append(b''.join(pending))
+        return segments
 
-            data.extend(identifier_data)
+    def _encode_section(self, lines, encoding):
+        data = ''.join(lines).encode(encoding)
+        if self._encryption is not None:
+            data = bytes(self._encrypt(data))
 
         return data
 
@@ -164,15 +186,24 @@ class Request(object):
         else:
             raise MarshalError('Response.unmarshal: Invalid GNTP message')
 
-    def _add_resource(self, key, resource):
-        uid = resource.uid
-        data = resource.data
-        self.body[key] = 'x-growl-resource://%s' % uid
-
-        identifier = {}
-        identifier['Identifier'] = uid
-        identifier['Data'] = data
-        self.identifiers.append(identifier)
+    def _add_resource(self, key, resource, section=None):
+        # Identifiers are the MD5 of the data, as suggested by the GNTP
+        # specification, so that the same data is only sent once per request
+        # and receivers can recognise data they have already cached.
+        uid = resource.encoded('md5', _md5)
+        if uid is None:
+            # The data could not be loaded so the resource is left out
+            return
+
+        if section is None:
+            section = self.body
+        section[key] = 'x-growl-resource://%s' % uid
+
+        if self.identifier_data(uid) is None:
+            identifier = {}
+            identifier['Identifier'] = uid
+            identifier['Data'] = resource.data
+            self.identifiers.append(identifier)
 
     def _unmarshal_section(self, lines, info):
         for line in lines:
@@ -208,11 +239,92 @@ class Request(object):
             return self.reference
 
 
+def _decode_str(value):
+    return value.strip().decode('UTF-8')
+
+
+def _decode_lower(value):
+    return _decode_str(value).lower()
+
+
+def _decode_int(value):
+    return int(value)
+
+
+def _decode_datetime(value):
+    m = _TIMESTAMP.match(value.strip())
+    if m is not None:
+        return datetime(*[int(part) for part in m.groups()])
+
+    # Formats other than the one Growl sends
+    return parse_datetime(_decode_str(value))
+
+
+def _decode_body(lines):
+    body = {}
+    for name, value in lines:
+        name = _decode_str(name)
+        value = _decode_str(value)
+
+        if name not in body:
+            body[name] = value
+        else:
+            if not isinstance(body[name], list):
+                body[name] = [body[name]]
+
+            body[name].append(value)
+
+    return body
+
+
+class _LazyHeader(object):
+    """Attribute whose value is decoded from the raw header value the first
+    time it is read. The decoded value then replaces the descriptor in the
+    instance's dictionary.
+    """
+
+    def __init__(self, name, decode):
+        self.name = name
+        self.decode = decode
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        try:
+            value = instance._raw[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+        value = self.decode(value)
+        instance.__dict__[self.name] = value
+        return value
+
+
 class Response(object):
     """GNTP/1.0 -(OK|ERROR|CALLBACK) <encryptionAlgoritm>
     <body>: <value>
     """
 
+    command = _LazyHeader('command', _decode_lower)
+    timestamp = _LazyHeader('timestamp', _decode_datetime)
+    daemon = _LazyHeader('daemon', _decode_str)
+    origin = _LazyHeader('origin', _decode_str)
+    origin_software_name = _LazyHeader('origin_software_name', _decode_str)
+    origin_software_version = _LazyHeader('origin_software_version', _decode_str)
+    origin_platform_name = _LazyHeader('origin_platform_name', _decode_str)
+    origin_platform_version = _LazyHeader('origin_platform_version', _decode_str)
+    status_code = _LazyHeader('status_code', _decode_int)
+    reason = _LazyHeader('reason', _decode_str)
+    notifier_name = _LazyHeader('notifier_name', _decode_str)
+    nid = _LazyHeader('nid', _decode_str)
+    callback_status = _LazyHeader('callback_status', _decode_str)
+    callback_context = _LazyHeader('callback_context', _decode_str)
+    callback_context_type = _LazyHeader('callback_context_type', _decode_str)
+    callback_timestamp = _LazyHeader('callback_timestamp', _decode_datetime)
+    ttl = _LazyHeader('ttl', _decode_int)
+    body = _LazyHeader('body', _decode_body)
+
     def __init__(self, version=GNTP_BASE_VERSION):
         self.version = version
         """The GNTP protocol version number of this response"""
@@ -221,6 +333,9 @@ class Response(object):
         self.command = ''
         self.body = {}
 
+        # Undecoded header values keyed by attribute name
+        self._raw = {}
+
         self.use_hash = False
         self.use_encryption = False
         self._hash = None
@@ -266,92 +381,62 @@ class Response(object):
         return data
 
     def unmarshal(self, data):
-        """Unmarshal data received over the wire into a valid response"""
+        """Unmarshal data received over the wire into a valid response.
+
+        Header values are kept as bytes and only decoded when the attribute
+        they set is first read.
+        """
 
         if self._encryption is not None and not PY_CRYPTO:
             raise MarshalError('Unable to decrypt message. PyCrypto not available')
 
-        header, data = data.split(b'\r\n', maxsplit=1)
+        header, data = bytes(data).split(b'\r\n', maxsplit=1)
 
-        header_re = ('GNTP\/(?P<version>\d\.\d) (?P<responsetype>\-?[A-Z]+)'
-                     ' ((?P<encryptionAlgorithmID>\w+)\:(?P<ivValue>[a-fA-F0-9]+)|NONE)')
-        m = re.match(header_re, header.decode('UTF-8'))
-        if m is not None:
-            d = m.groupdict()
-            self.version = d['version']
-            self.status = d['responsetype'].lstrip('-')
+        m = _RESPONSE_LINE.match(header)
+        if m is None:
+            return
 
-            if self.status == 'OK':
-                self.status_code = 0
+        version, status, algorithm, iv = m.groups()
+        self.version = version.decode('ascii')
+        self.status = status.decode('ascii')
 
-            if d['encryptionAlgorithmID'] is None:
-                self.use_encryption = False
-                self._encryption = None
+        if algorithm is None:
+            self.use_encryption = False
+            self._encryption = None
+        else:
+            self.use_encryption = True
+            self._encryption = (algorithm.decode('ascii'), iv.decode('ascii'))
+            data = self._decrypt(data)
+
+        raw = self._raw
+        body = []
+        for line in data.split(b'\r\n'):
+            if len(line) == 0:
+                continue
+
+            name, sep, value = line.partition(b':')
+            if not sep:
+                logging.debug('hiss.handler.GNTP.Response.unmarshal - Error splitting %s' % line)
+                raise ValueError('Invalid header line %r' % line)
+
+            name = name.strip()
+            attr = _RESPONSE_HEADERS.get(name)
+            if attr is not None:
+                raw[attr] = value
             else:
-                self.use_encryption = True
-                self._encryption = (d['encryptionAlgorithmID'],
-                                   d['ivValue'])
-                data = self._decrypt(data)
+                body.append((name, value))
 
-            for line in [l for l in data.split(b'\r\n') if len(l) != 0]:
-                try:
-                    name, value = line.split(b':', 1)
-                    name = name.decode('UTF-8').strip()
-                    value = value.decode('UTF-8').strip()
-
-                    # All
-                    if name == 'Response-Action':
-                        self.command = value.lower()
-
-                    elif name == 'X-Timestamp':
-                        self.timestamp = parse_datetime(value)
-                    elif name == 'X-Message-Daemon':
-                        self.daemon = value
-                    elif name == 'Origin-Machine-Name':
-                        self.origin = value
-                    elif name == 'Origin-Software-Name':
-                        self.origin_software_name = value
-                    elif name == 'Origin-Software-Version':
-                        self.origin_software_version = value
-                    elif name == 'Origin-Platform-Name':
-                        self.origin_platform_name = value
-                    elif name == 'Origin-Platform-Version':
-                        self.origin_platform_version = value
-
-                    elif name == 'Error-Code':
-                        self.status_code = int(value)
-                    elif name == 'Error-Description':
-                        self.reason = value
-
-                    # Notify
-                    elif name == 'Application-Name':
-                        self.notifier_name = value
-                    elif name == 'Notification-ID':
-                        self.nid = value
-                    elif name == 'Notification-Callback-Result':
-                        self.callback_status = value
-                    elif name == 'Notification-Callback-Context':
-                        self.callback_context = value
-                    elif name == 'Notification-Callback-Context-Type':
-                        self.callback_context_type = value
-                    elif name == 'Notification-Callback-Timestamp':
-                        self.callback_timestamp = parse_datetime(value)
-
-                    # Subscribe
-                    elif name == 'Subscription-TTL':
-                        self.ttl = int(value)
-
-                    else:
-                        if name not in self.body:
-                            self.body[name] = value
-                        else:
-                            if not isinstance(self.body[name], list):
-                                self.body[name] = [self.body[name]]
+        # Remove any values set before unmarshalling so that the raw values
+        # are decoded when the attributes are read.
+        for attr in raw:
+            self.__dict__.pop(attr, None)
 
-                            self.body[name].append(value)
-                except ValueError:
-                    logging.debug('hiss.handler.GNTP.Response.unmarshal - Error splitting %s' % line)
-                    raise
+        if body:
+            raw['body'] = body
+            self.__dict__.pop('body', None)
+
+        if self.status == 'OK' and 'status_code' not in raw:
+            self.status_code = 0
 
     def _encrypt(self, data):
         pass
@@ -378,6 +463,11 @@ class RegisterRequest(Request):
             section['Notification-Name'] = info.name
             section['Notification-Enabled'] = info.enabled
 
+            if isinstance(info.icon, Icon):
+                self._add_resource('Notification-Icon', info.icon, section)
+            elif info.icon is not None:
+                section['Notification-Icon'] = info.icon
+
             self.sections.append(section)
 
 
@@ -430,3 +520,90 @@ class UnregisterRequest(Request):
         self.command = 'REGISTER'
         self.body['Application-Name'] = notifier.name
         self.body['Notifications-Count'] = 0
+
+
+def _md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+_RESPONSE_LINE = re.compile(br'GNTP/(\d\.\d) -?([A-Z]+) (?:(\w+):([a-fA-F0-9]+)|NONE)')
+_TIMESTAMP = re.compile(br'(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d)Z?$')
+
+# Maps a response header name to the attribute it sets
+_RESPONSE_HEADERS = {
+    b'Response-Action': 'command',
+    b'X-Timestamp': 'timestamp',
+    b'X-Message-Daemon': 'daemon',
+    b'Origin-Machine-Name': 'origin',
+    b'Origin-Software-Name': 'origin_software_name',
+    b'Origin-Software-Version': 'origin_software_version',
+    b'Origin-Platform-Name': 'origin_platform_name',
+    b'Origin-Platform-Version': 'origin_platform_version',
+    b'Error-Code': 'status_code',
+    b'Error-Description': 'reason',
+    b'Application-Name': 'notifier_name',
+    b'Notification-ID': 'nid',
+    b'Notification-Callback-Result': 'callback_status',
+    b'Notification-Callback-Context': 'callback_context',
+    b'Notification-Callback-Context-Type': 'callback_context_type',
+    b'Notification-Callback-Timestamp': 'callback_timestamp',
+    b'Subscription-TTL': 'ttl',
+}
+
+
+class ResponseParser(object):
+    """Incremental parser which splits a stream of data into
+    :class:`Response` objects.
+
+    Each byte is scanned once however the data is split between calls to
+    :meth:`feed` and the data for complete responses is discarded.
+    """
+
+    TERMINATOR = b'\r\n\r\n'
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scan = 0
+
+    def feed(self, data):
+        """Add ``data`` to the stream returning a list of the responses it
+        completes.
+
+        :raises MarshalError: If a response cannot be unmarshalled. The
+                              invalid response is discarded.
+        """
+
+        buf = self._buffer
+        buf.extend(data)
+
+        responses = []
+        start = 0
+        end = buf.find(self.TERMINATOR, self._scan)
+        while end != -1:
+            if end > start:
+                response = Response()
+                try:
+                    response.unmarshal(bytes(buf[start:end]))
+                except Exception as exc:
+                    # Discard the invalid response so that it is not parsed
+                    # again by the next call.
+                    del buf[:end + 4]
+                    self._scan = 0
+                    raise MarshalError('Invalid GNTP response: %s' % exc,
+                                       'ResponseParser.feed')
+
+                responses.append(response)
+
+            start = end + 4
+            end = buf.find(self.TERMINATOR, start)
+
+        if start:
+            del buf[:start]
+
+        # Resume scanning where a terminator split across reads could begin
+        self._scan = max(0, len(buf) - 3)
+        return responses
+
+    def __len__(self):
+        """The number of bytes waiting for the end of a response."""
+        return len(self._buffer)
@@ -11,7 +11,7 @@ import aiohttp
 import json
 from urllib.parse import quote_plus
 
-from .jsonrpc.message import RPCRequest
+from .jsonrpc.message import RPCRequest, RPCResponse, RPCBatch
 
 from hiss.resource import Icon
 from hiss.handler.aio import AIOHandler
@@ -25,7 +25,11 @@ class KodiError(Exception):
 
 
 class KodiHandler(AIOHandler):
-    """:class:`~hiss.handler.Handler` sub-class for Kodi notifications"""
+    """:class:`~hiss.handler.Handler` sub-class for Kodi notifications
+
+    Call :meth:`use_batching` to send notifications for the same host as a
+    single JSON-RPC batch request.
+    """
 
     __name__ = 'Kodi'
 
@@ -43,7 +47,7 @@ class KodiHandler(AIOHandler):
 
         Overrides the :class:`~hiss.handler.Handler`\'s version.
         """
-        protocol = XBMCProtocol()
+        protocol = KodiProtocol()
 
         target.handler = self
         target.port = self.port
@@ -75,30 +79,73 @@ class KodiProtocol(asyncio.Protocol):
         return response
 
     @asyncio.coroutine
-    def _send_request(self, request, target):
-        request_data = request.marshal()
+    def notify_batch(self, notifications):
+        """Send a list of notifications in a single JSON-RPC batch request.
 
-        auth = (target.username, target.password)
+        The result for each notification is returned under the ``results``
+        key in the same order as ``notifications``.
 
-        client = aiohttp.HttpClient([(target.host, target.port)], method='POST',
-                                    path='/jsonrpc')
-        headers = {'Content-Type': 'application/json'}
+        :param notifications: Notifications to send
+        :type notifications:  list of :class:`~hiss.notification.Notification`
+        """
+
+        batch = RPCBatch([_NotificationRequest(n) for n in notifications])
 
         result = {}
         try:
-            http_response = yield from client.request(headers=headers, data=request_data, auth=auth)
-            if http_response.status == 200:
-                response_data = yield from http_response.read()
-                http_response.close()
+            status, data = yield from self._post(batch.marshal(), self.target)
+        except Exception as exc:
+            result['status'] = 'ERROR'
+            result['reason'] = exc.args[0]
+            result['target'] = str(self.target)
+            return result
+
+        if data is None:
+            result['status'] = 'ERROR'
+            result['reason'] = status
+            result['target'] = str(self.target)
+            return result
+
+        results = []
+        for response in batch.unmarshal(data):
+            command_result = {}
+            if isinstance(response, RPCResponse):
+                command_result['status'] = response.result
+                if response.result == 'OK':
+                    command_result['status_code'] = 0
+            elif response is None:
+                command_result['status'] = 'ERROR'
+                command_result['reason'] = 'No response received'
+            else:
+                command_result['status'] = 'ERROR'
+                command_result['reason'] = str(response)
 
-                data = json.loads(response_data.decode('UTF-8'))
+            command_result['target'] = str(self.target)
+            results.append(command_result)
+
+        failed = [r for r in results if r['status'] != 'OK']
+        if failed:
+            result = dict(failed[0])
+        else:
+            result = dict(results[0])
+
+        result['results'] = results
+        return result
+
+    @asyncio.coroutine
+    def _send_request(self, request, target):
+        result = {}
+        try:
+            status, data = yield from self._post(request.marshal(), target)
+            if data is not None:
+                data = json.loads(data.decode('UTF-8'))
 
                 result['status'] = data['result']
                 if data['result'] == 'OK':
                     result['status_code'] = 0
             else:
                 result['status'] = 'ERROR'
-                result['reason'] = http_response.reason
+                result['reason'] = status
 
         except Exception as exc:
             result['status'] = 'ERROR'
@@ -107,6 +154,26 @@ class KodiProtocol(asyncio.Protocol):
         result['target'] = str(self.target)
         return result
 
+    @asyncio.coroutine
+    def _post(self, request_data, target):
+        """POST data to the Kodi JSON-RPC endpoint on ``target`` returning
+        a tuple of the HTTP reason and the response body or ``None`` if the
+        request was not successful."""
+
+        auth = (target.username, target.password)
+
+        client = aiohttp.HttpClient([(target.host, target.port)], method='POST',
+                                    path='/jsonrpc')
+        headers = {'Content-Type': 'application/json'}
+
+        http_response = yield from client.request(headers=headers, data=request_data, auth=auth)
+        if http_response.status == 200:
+            response_data = yield from http_response.read()
+            http_response.close()
+            return http_response.reason, response_data
+        else:
+            return http_response.reason, None
+
 
 class _NotificationRequest(RPCRequest):
     def __init__(self, notification):
@@ -115,14 +182,23 @@ class _NotificationRequest(RPCRequest):
                          title=notification.title,
                          message=notification.text)
 
+        image = None
         if notification.icon is not None:
             if isinstance(notification.icon, Icon):
-                image = notification.icon.data
+                # Kodi can fetch icons from web servers itself so only
+                # icons from elsewhere need to be sent inline.
+                if notification.icon.source.startswith(('http://', 'https://')):
+                    image = notification.icon.source
+                else:
+                    data = notification.icon.base64
+                    if data is not None:
+                        image = data.decode('ascii')
             elif notification.icon.startswith('image://'):
                 image = quote_plus('image://%s' % notification.icon[8:])
             else:
                 image = notification.icon
 
+        if image is not None:
             self.append('image', image)
 
         if notification.timeout != -1:
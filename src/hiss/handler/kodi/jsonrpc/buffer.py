@@ -1,67 +1,138 @@
 # Copyright (c) 2014 Simon Kennedy <sffjunkie+code@gmail.com>.
 
+import re
+import json
+import codecs
+import logging
+
+# Characters which change the state of the scanner outside and inside strings
+_STRUCTURE = re.compile(r'[{}"]')
+_STRING = re.compile(r'["\\]')
+
+
 class JSONBuffer(object):
-    """A buffer for JSONRPC messages.
-    
-    If a result handler is provided then it will be called with the list
-    of messages whenever a complete message is received.
+    """A buffer which splits a stream of data into JSONRPC messages.
+
+    Each message is decoded directly from the stream using
+    :meth:`json.JSONDecoder.raw_decode`. When the end of a message has not
+    been received yet the rest of it is found with a brace scanner which
+    skips directly to the next brace or quote so that the message is only
+    decoded once it is complete.
+
+    Complete messages are added to :attr:`messages` as decoded JSON objects.
     """
     def __init__(self):
-        self.messsages = []
-        
-        self._in_quote = False
-        self._quote_char = ''
-        self._bracket_count = 0
-        self._data = ''
-        
+        self.messages = []
+
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('UTF-8')()
+
+        # The parts of an incomplete message and the scanner state
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
     def append(self, data):
         """Append a string or a UTF-8 encoded string"""
-        
+
         if not isinstance(data, str):
-            data = data.decode('UTF-8')
-            
-        pos = start = 0
+            data = self._text_decoder.decode(data)
+
+        pos = 0
+        if self._parts:
+            end = self._scan(data, 0)
+            if end == -1:
+                self._parts.append(data)
+                return
+
+            self._parts.append(data[:end])
+            self._loads(''.join(self._parts))
+            self._parts = []
+            pos = end
+
+        while True:
+            start = data.find('{', pos)
+            if start == -1:
+                # Data outside a message is ignored
+                return
+
+            try:
+                message, pos = self._decoder.raw_decode(data, start)
+            except ValueError:
+                # Either the rest of the message has not arrived yet or the
+                # message is invalid.
+                self._depth = 0
+                self._in_string = False
+                self._escape = False
+
+                pos = self._scan(data, start)
+                if pos == -1:
+                    self._parts.append(data[start:])
+                    return
+
+                logging.debug('JSONBuffer: Invalid message %s' %
+                              data[start:pos])
+                continue
+
+            self.messages.append(message)
+
+    def __len__(self):
+        """The number of characters of an incomplete message in the
+        buffer."""
+        return sum(len(part) for part in self._parts)
+
+    def _loads(self, data):
+        try:
+            self.messages.append(json.loads(data))
+        except ValueError:
+            logging.debug('JSONBuffer: Invalid message %s' % data)
+
+    def _scan(self, data, pos):
+        """Scan ``data`` from ``pos`` for the end of the current message
+        returning the position after its closing brace or -1 if the message
+        continues past the end of ``data``."""
+
+        depth = self._depth
+        in_string = self._in_string
         end = len(data)
 
-        prev_ch = ''
-
-        while 1:
-            ch = data[pos]
-            if (ch == '"' or ch == "'") and prev_ch != '\\':
-                if not self._in_quote:
-                    self._in_quote = True
-                    self._quote_char = ch
-                elif ch == self._quote_char:
-                    self._in_quote = False
-
-            elif ch == '{':
-                if not self._in_quote:
-                    self._bracket_count += 1
-            
-            elif ch == '}':
-                if not self._in_quote:
-                    self._bracket_count -= 1
-                    
-                    if self._bracket_count == 0:
-                        _data = self._data
-                        _data += data[start:pos+1]
-                        self._data = ''
-                        data = data[pos+1:]
-                        start = 0
-                        end = len(data)
-                        pos = -1
-
-                        self.messsages.append(_data)
-
-                    elif self._bracket_count < 0:
-                        start = pos + 1
-                        self._bracket_count = 0
-                        
-            prev_ch = ch
+        if self._escape and pos < end:
+            self._escape = False
             pos += 1
-            
-            if pos == end:
-                break
-            
-        self._data += data[start:end]
-    
\ No newline at end of file
+
+        while pos < end:
+            if in_string:
+                m = _STRING.search(data, pos)
+                if m is None:
+                    break
+
+                pos = m.end()
+                if m.group() == '"':
+                    in_string = False
+                elif pos == end:
+                    # The character the backslash escapes is in the next data
+                    self._escape = True
+                else:
+                    pos += 1
+            else:
+                m = _STRUCTURE.search(data, pos)
+                if m is None:
+                    break
+
+                pos = m.end()
+                ch = m.group()
+                if ch == '{':
+                    depth += 1
+                elif ch == '}':
+                    depth -= 1
+                    if depth == 0:
+                        self._in_string = False
+                        self._depth = 0
+                        return pos
+                else:
+                    in_string = True
+
+        self._depth = depth
+        self._in_string = in_string
+        return -1
@@ -1,14 +1,23 @@
 # Copyright (c) 2014 Simon Kennedy <sffjunkie+code@gmail.com>.
 
 import asyncio
+import logging
 import aiohttp
 from functools import partial
 
-from mogul.jsonrpc import buffer
-from mogul.jsonrpc.message import RPCRequest, RPCResponse, RPCMessageError
+from hiss.handler.kodi.jsonrpc import buffer
+from hiss.handler.kodi.jsonrpc.message import (RPCRequest, RPCResponse,
+                                               RPCBatch, RPCMessageError,
+                                               RPCRequestError)
 
 __all__ = ['RPCClient']
 
+# Number of seconds to wait before reconnecting to receive notifications after
+# the connection is lost. The delay doubles after each failed attempt up to
+# RECONNECT_MAX_DELAY.
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+
 
 class RPCClient():
     """An asyncio JSON RPC client.
@@ -22,8 +31,15 @@ class RPCClient():
         path (str): The path to send the request to; (http only)
         username (str): User name to authenticate with; (http only)
         password (str): Password to authenticate with; (http only)
-        notification_handler (coroutine): A coroutine which receives RPCResponse
+        notification_handler (coroutine): A coroutine which receives RPCRequest
             notifications (tcp only)
+
+    When using 'tcp' all requests are multiplexed over a single connection
+    and any number of them can be waiting for a response at once. If the
+    connection is lost the requests waiting for a response fail with a
+    :class:`ConnectionError` and the next request reconnects. When a
+    notification handler is provided the client reconnects straight away so
+    that notifications continue to be received.
     """
     def __init__(self, host,
                  port=8080,
@@ -46,6 +62,9 @@ class RPCClient():
         self.notification_handler = notification_handler
         
         self._tcp_protocol = None
+        self._tcp_connecting = None
+        self._reconnect_delay = RECONNECT_DELAY
+        self._closed = False
         self._namespace_cache = {}
         
         self.loop = asyncio.get_event_loop()
@@ -69,9 +88,54 @@ class RPCClient():
 
         return response
     
+    @asyncio.coroutine
+    def batch(self, requests, method=None):
+        """Send a list of RPC requests as a single JSON-RPC 2.0 batch.
+        
+        Args:
+            requests (list of :class:`RPCRequest`): The requests to send.
+            
+        Returns:
+            list: The response to each request in the same order as
+            ``requests``. Each item is an :class:`RPCResponse`, the
+            :class:`RPCRequestError` for the request or None if no response
+            was received.
+        """
+        if isinstance(requests, RPCBatch):
+            batch = requests
+        else:
+            batch = RPCBatch(requests)
+
+        method = method or self.method
+        if method == 'http':
+            data = yield from self._post(batch.marshal(),
+                                         batch.expects_response)
+            if data:
+                batch.unmarshal(data)
+            else:
+                batch.responses = [None] * len(batch)
+        elif method == 'tcp':
+            protocol = yield from self._get_tcp_protocol()
+            yield from protocol.send_batch(batch)
+
+        return batch.responses
+
+    @asyncio.coroutine
+    def connect(self):
+        """Open the TCP connection to the host.
+
+        Requests open the connection when needed so this only needs to be
+        called to start receiving notifications before the first request.
+        """
+        self._closed = False
+        protocol = yield from self._get_tcp_protocol()
+        return protocol
+
     def close(self):
+        self._closed = True
         if self._tcp_protocol:
-            self._tcp_protocol._transport.close()
+            self._tcp_protocol.close()
+            self._tcp_protocol = None
     
     @asyncio.coroutine
     def _send_http_request(self, request, *args, **kwargs):
@@ -84,9 +148,23 @@ class RPCClient():
             None: No response received.
             :class:`RPCResponse`: The response from the host.
         """
-        request_data = request.marshal()
-        
-        path = kwargs.get('path', self.path)
+        body = yield from self._post(request.marshal(),
+                                     not request.notification,
+                                     kwargs.get('path', self.path))
+
+        if body is None:
+            return None
+
+        response = RPCResponse()
+        response.unmarshal(body)
+        return response.result
+
+    @asyncio.coroutine
+    def _post(self, request_data, expects_response=True, path=None):
+        """POST data to the host returning the body of the response or None
+        if no response is expected or the request failed."""
+
+        path = path or self.path
         
         url = 'http://{}:{}{}'.format(self.host, self.port, path)
         
@@ -106,25 +184,19 @@ class RPCClient():
                                        auth=auth,
                                        loop=self.loop)
         
-        if request.notification:
-            return None
+        if self.timeout == -1:
+            http_response = yield from http_request
         else:
-            if self.timeout == -1:
-                http_response = yield from http_request
-            else:
-                http_response = yield from asyncio.wait_for(http_request,
-                                                            self.timeout)
-            
-            if http_response.status == 200:
-                body = yield from http_response.read()
-                
-                response = RPCResponse()
-                response.unmarshal(body)
-                result = response.result
-            else:
-                result = None
-                
-            return result
+            http_response = yield from asyncio.wait_for(http_request,
+                                                        self.timeout)
+
+        if expects_response and http_response.status == 200:
+            body = yield from http_response.read()
+        else:
+            body = None
+            http_response.close()
+
+        return body
     
     @asyncio.coroutine
     def _send_tcp_request(self, request, *args, **kwargs):
@@ -133,24 +205,72 @@ class RPCClient():
         Args:
             request (:class:`RPCRequest`): The request to send.
         """
-        if not self._tcp_protocol:
-            factory = lambda: _TCPProtocol(self.timeout,
-                                           self.notification_handler)
-            
-            coro = self.loop.create_connection(factory,
-                self.host, self.port)
-            
-            if self.timeout == -1:
-                (_t, protocol) = yield from coro
-            else:
-                (_t, protocol) = yield from asyncio.wait_for(coro,
-                                                             self.timeout)
-            
-            self._tcp_protocol = protocol
-
+        protocol = yield from self._get_tcp_protocol()
         response = yield from protocol.send(request)
         return response
 
+    @asyncio.coroutine
+    def _get_tcp_protocol(self):
+        """Return the connected protocol, connecting if necessary.
+
+        Requests made while the connection is being opened wait for the same
+        connection.
+        """
+        protocol = self._tcp_protocol
+        if protocol is not None and protocol.is_connected:
+            return protocol
+
+        connecting = self._tcp_connecting
+        if connecting is None or connecting.done():
+            connecting = asyncio.async(self._connect_tcp(), loop=self.loop)
+            self._tcp_connecting = connecting
+
+        # Shielded so that a cancelled request does not cancel the connection
+        # the other requests are waiting for.
+        protocol = yield from asyncio.shield(connecting)
+        return protocol
+
+    @asyncio.coroutine
+    def _connect_tcp(self):
+        factory = lambda: _TCPProtocol(self.timeout,
+                                       self.notification_handler,
+                                       loop=self.loop)
+
+        coro = self.loop.create_connection(factory, self.host, self.port)
+
+        if self.timeout == -1:
+            (_t, protocol) = yield from coro
+        else:
+            (_t, protocol) = yield from asyncio.wait_for(coro, self.timeout)
+
+        protocol.connection_lost_handler = self._tcp_connection_lost
+        self._tcp_protocol = protocol
+        self._reconnect_delay = RECONNECT_DELAY
+        return protocol
+
+    def _tcp_connection_lost(self, protocol):
+        if self._tcp_protocol is protocol:
+            self._tcp_protocol = None
+
+        if self.notification_handler is not None and not self._closed:
+            self.loop.call_later(self._reconnect_delay, self._reconnect)
+
+    def _reconnect(self):
+        if self._closed or self._tcp_protocol is not None:
+            return
+
+        def connected(future):
+            if future.cancelled() or future.exception() is not None:
+                logging.debug('RPCClient: Unable to reconnect to %s:%d' %
+                              (self.host, self.port))
+                delay = self._reconnect_delay
+                self._reconnect_delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                if not self._closed:
+                    self.loop.call_later(delay, self._reconnect)
+
+        task = asyncio.async(self._get_tcp_protocol(), loop=self.loop)
+        task.add_done_callback(connected)
+
     def __getattr__(self, namespace):
         if namespace in self._namespace_cache:
             return self._namespace_cache[namespace]
@@ -184,14 +304,37 @@ class RPCClient():
 
 
 class _TCPProtocol(asyncio.Protocol):
-    """Send JSONRPC messages using the TCP _transport"""
+    """Send JSONRPC messages using the TCP _transport
+
+    Responses are matched to requests by their id so any number of requests
+    can be waiting for a response. Messages from the host which are not
+    responses are passed to the notification handler.
+    """
     
-    def __init__(self, timeout=-1, notification_handler=None):
-        self.responses = None
-        self.notifications = None
+    def __init__(self, timeout=-1, notification_handler=None, loop=None):
+        self.connection_lost_handler = None
 
         self._timeout = timeout
         self._notification_handler = notification_handler
+        self._loop = loop
+        self._waiters = {}
+        self._buffer = None
+        self._transport = None
+
+    @property
+    def is_connected(self):
+        """True if the connection to the host is still open."""
+        return self._transport is not None
+
+    @property
+    def in_flight(self):
+        """The number of requests waiting for a response."""
+        return len(self._waiters)
+
+    def close(self):
+        """Close the connection to the host."""
+        if self._transport is not None:
+            self._transport.close()
     
     @asyncio.coroutine
     def send(self, request):
@@ -200,53 +343,140 @@ class _TCPProtocol(asyncio.Protocol):
         Args:
             request (:class:`RPCRequest`): The request to send.
         """
+        if self._transport is None:
+            raise ConnectionError('Connection to host lost')
+
         request_data = request.marshal()
         
-        self._transport.write(request_data)
-        
         if request.notification:
+            self._transport.write(request_data)
             return None
         else:
-            response = yield from self._wait_for_response(request.uid)
+            waiter = asyncio.Future(loop=self._loop)
+            self._waiters[request.uid] = waiter
+            self._transport.write(request_data)
+
+            response = yield from self._wait_for_response(request.uid, waiter)
             return response
     
-    def connection_made(self, transport):
-        self.responses = {}
-        self.notifications = []
+    @asyncio.coroutine
+    def send_batch(self, batch):
+        """Send a batch of requests.
+
+        The host replies with an array of responses. The buffer splits the
+        array into the individual responses which are matched to the
+        requests by id the same way as responses to single requests.
         
+        Args:
+            batch (:class:`RPCBatch`): The batch to send.
+        """
+        if self._transport is None:
+            raise ConnectionError('Connection to host lost')
+
+        request_data = batch.marshal()
+
+        waits = []
+        for request in batch.requests:
+            if not request.notification:
+                waiter = asyncio.Future(loop=self._loop)
+                self._waiters[request.uid] = waiter
+                waits.append(self._wait_for_response(request.uid, waiter))
+
+        self._transport.write(request_data)
+
+        results = []
+        if waits:
+            results = yield from asyncio.gather(*waits,
+                                                return_exceptions=True)
+
+        results = iter(results)
+        batch.responses = []
+        for request in batch.requests:
+            if request.notification:
+                batch.responses.append(None)
+                continue
+
+            result = next(results)
+            if isinstance(result, (RPCResponse, RPCRequestError)):
+                batch.responses.append(result)
+            elif isinstance(result, RPCMessageError):
+                batch.responses.append(None)
+            else:
+                raise result
+
+        return batch.responses
+    
+    def connection_made(self, transport):
         self._buffer = buffer.JSONBuffer()
         self._transport = transport
+
+    def connection_lost(self, exc):
+        self._transport = None
+
+        waiters = self._waiters
+        self._waiters = {}
+        for waiter in waiters.values():
+            if not waiter.done():
+                waiter.set_exception(ConnectionError('Connection to host lost'))
+
+        if self.connection_lost_handler is not None:
+            self.connection_lost_handler(self)
         
     def data_received(self, data):
         self._buffer.append(data)
+
+        messages = self._buffer.messages
+        self._buffer.messages = []
+        for message in messages:
+            self._dispatch(message)
+
+    def _dispatch(self, data):
+        """Pass a response to the request waiting for it or a notification
+        to the notification handler."""
+
+        if 'method' in data:
+            self._notify(data)
+            return
+
+        message = RPCResponse()
+        try:
+            message.unmarshal(data)
+        except RPCRequestError as exc:
+            waiter = self._waiters.pop(message.uid, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(exc)
+            return
+        except RPCMessageError as exc:
+            waiter = self._waiters.pop(data.get('id'), None)
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(exc)
+            else:
+                logging.debug('_TCPProtocol: Invalid message %s' % data)
+            return
+
+        waiter = self._waiters.pop(message.uid, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(message)
+
+    def _notify(self, data):
+        message = RPCRequest()
+        try:
+            message.unmarshal(data)
+        except RPCMessageError:
+            logging.debug('_TCPProtocol: Invalid notification %s' % data)
+            return
+
+        if self._notification_handler is not None:
+            asyncio.async(self._notification_handler(message), loop=self._loop)
     
     @asyncio.coroutine
-    def _wait_for_data(self, uid):
-        while True:
-            for data in self._buffer.messsages:
-                try:
-                    message = RPCResponse()
-                    message.unmarshal(data)
-                    
-                    self.responses[message.uid] = message
-                    
-                # If there's an error unmarshaling a Response then we
-                # need to try to unmarshall as a notification Request
-                except RPCMessageError:
-                    message = RPCRequest()
-                    message.unmarshal(message)
-                    self.notifications.append(message)
-                    
-            del self._buffer.messages[:]
-            yield from asyncio.sleep(0.1)
-    
-    @asyncio.coroutine
-    def _wait_for_response(self, uid):
-        while True:
-            response = self.responses.pop(uid, None)
-            if response:
-                return response
+    def _wait_for_response(self, uid, waiter):
+        try:
+            if self._timeout == -1:
+                response = yield from waiter
             else:
-                yield from asyncio.sleep(0.1)
-    
+                response = yield from asyncio.wait_for(waiter, self._timeout)
+        finally:
+            self._waiters.pop(uid, None)
 
+        return response
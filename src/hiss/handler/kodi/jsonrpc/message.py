@@ -5,7 +5,7 @@ import uuid
 
 from ..jsonrpc import RPCError
 
-__all__ = ['RPCMessageError', 'RPCRequest', 'RPCResponse']
+__all__ = ['RPCMessageError', 'RPCRequest', 'RPCResponse', 'RPCBatch']
 
 
 class RPCMessageError(RPCError):
@@ -129,16 +129,20 @@ class RPCRequest(object):
         """Initialise the command with data from over the wire
         
         :param data: The data to initialise the command with.
-        :type data: string
+        :type data: string, bytes or a decoded JSON object
         """
         
         if len(data) == 0:
             raise RPCMessageError('Empty JSON data received.')
         
-        if isinstance(data, (bytes, bytearray)):
-            data = data.decode('UTF-8')
-            
-        data = json.loads(data)
+        if isinstance(data, dict):
+            # Already decoded e.g. by a JSONBuffer
+            data = dict(data)
+        else:
+            if isinstance(data, (bytes, bytearray)):
+                data = data.decode('UTF-8')
+
+            data = json.loads(data)
         
         if 'jsonrpc' in data:
             self.version = data.pop('jsonrpc')
@@ -217,16 +221,21 @@ class RPCResponse(object):
         """Initialise the response with data from over the wire
         
         :param data:   The data to initialise the command with.
-        :type data:    string
+        :type data:    string, bytes or a decoded JSON object
         """
         if len(data) == 0:
             raise RPCMessageError('Empty JSON data received.')
         
-        if isinstance(data, (bytes, bytearray)):
-            data = data.decode('UTF-8')
-            
-        data = json.loads(data)
+        if isinstance(data, dict):
+            # Already decoded e.g. by a JSONBuffer
+            data = dict(data)
+        else:
+            if isinstance(data, (bytes, bytearray)):
+                data = data.decode('UTF-8')
 
+            data = json.loads(data)
+
+        self.uid = data.pop('id', None)
         self.result = data.pop('result', None)
         self.error = data.pop('error', None)
         
@@ -240,10 +249,93 @@ class RPCResponse(object):
             data = self.error.get('data', None)
             raise RPCRequestError(self.error['message'], self.error['code'], data)
 
-        self.uid = data.pop('id')
-        
         if 'jsonrpc' in data:
             self.version = data['jsonrpc']
         else:
             self.version = data.get('version', '1.0')
 
+
+class RPCBatch(object):
+    def __init__(self, requests=None):
+        """A list of requests sent together as a JSON-RPC 2.0 batch
+        
+        :param requests: The requests to send
+        :type requests:  list of :class:`RPCRequest`
+        """
+        
+        self.requests = list(requests or [])
+        self.responses = []
+        """The response to each request in the same order as
+        :attr:`requests` once the batch response has been unmarshalled.
+        Each item is an :class:`RPCResponse`, the :class:`RPCRequestError`
+        returned for the request or ``None`` if no response was received."""
+
+    def __len__(self):
+        return len(self.requests)
+
+    def __repr__(self):
+        return 'RPCBatch: %d requests' % len(self.requests)
+
+    def append(self, request):
+        """Append a request to the batch
+        
+        :param request: The request to append
+        :type request:  :class:`RPCRequest`
+        """
+        self.requests.append(request)
+
+    @property
+    def expects_response(self):
+        """True if any of the requests is not a notification"""
+        return any(not request.notification for request in self.requests)
+
+    def marshal(self):
+        """Convert the requests to a JSON array ready to be sent over the
+        wire"""
+        
+        if len(self.requests) == 0:
+            raise RPCMessageError('RPCBatch.marshal: No requests in batch.')
+        
+        return b'[' + b','.join(r.marshal() for r in self.requests) + b']'
+
+    def unmarshal(self, data):
+        """Split a batch response into the responses for each request
+        matching them by id.
+        
+        :param data:   The data received
+        :type data:    string, bytes or a decoded JSON array
+        """
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('UTF-8')
+            
+        if isinstance(data, str):
+            if len(data) == 0:
+                raise RPCMessageError('Empty JSON data received.')
+            
+            data = json.loads(data)
+        
+        # A request which could not be processed at all returns a single
+        # error response instead of an array.
+        if isinstance(data, dict):
+            data = [data]
+        
+        responses = {}
+        for item in data:
+            response = RPCResponse()
+            try:
+                response.unmarshal(item)
+            except RPCRequestError as exc:
+                response = exc
+            except RPCMessageError:
+                continue
+            
+            responses[item.get('id')] = response
+        
+        self.responses = []
+        for request in self.requests:
+            if request.notification:
+                self.responses.append(None)
+            else:
+                self.responses.append(responses.get(request.uid))
+        
+        return self.responses
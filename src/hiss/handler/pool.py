@@ -0,0 +1,198 @@
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+"""Provides a pool of idle connections which handlers can use to avoid
+connecting to a target for every request.
+"""
+
+import asyncio
+import logging
+from collections import deque
+
+__all__ = ['ConnectionPool']
+
+DEFAULT_MIN_IDLE = 0
+DEFAULT_MAX_IDLE = 4
+DEFAULT_IDLE_TIMEOUT = 60.0
+
+
+class ConnectionPool(object):
+    """A pool of idle protocol instances keyed by
+    :attr:`Target.address <hiss.target.Target.address>`
+
+    :param connect:      Coroutine which connects to a target and returns the
+                         protocol handling the connection.
+    :type connect:       asyncio coroutine
+    :param min_idle:     The number of idle connections to keep open per
+                         address even when they have timed out.
+    :type min_idle:      int
+    :param max_idle:     The maximum number of idle connections to keep open
+                         per address.
+    :type max_idle:      int
+    :param idle_timeout: Number of seconds after which an idle connection
+                         is closed.
+    :type idle_timeout:  float
+    :param loop:         :mod:`asyncio` event loop to use.
+    :type loop:          :class:`asyncio.BaseEventLoop`
+    """
+
+    def __init__(self, connect,
+                 min_idle=DEFAULT_MIN_IDLE,
+                 max_idle=DEFAULT_MAX_IDLE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 loop=None):
+        if min_idle > max_idle:
+            raise ValueError('min_idle must not be greater than max_idle')
+
+        self.min_idle = min_idle
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.loop = loop
+
+        self._connect = connect
+        self._idle = {}
+        self._targets = {}
+        self._evict_handle = None
+
+    @asyncio.coroutine
+    def acquire(self, target):
+        """Return a connected protocol for ``target``.
+
+        An idle connection is returned if a healthy one is available for the
+        target's address, otherwise a new connection is made.
+
+        :param target: The target to connect to
+        :type target:  :class:`~hiss.target.Target`
+        """
+        idle = self._idle.get(target.address)
+        while idle:
+            protocol, _released = idle.pop()
+            if self._healthy(protocol):
+                protocol.target = target
+                logging.debug('ConnectionPool: Reusing connection to %s' % target)
+                return protocol
+            else:
+                self._close(protocol)
+
+        protocol = yield from self.connect(target)
+        return protocol
+
+    @asyncio.coroutine
+    def connect(self, target):
+        """Make a new connection to ``target`` which will be tracked by the
+        pool once released."""
+
+        protocol = yield from self._connect(target)
+        protocol.connection_lost_handler = self._connection_lost
+        self._targets[target.address] = target
+        return protocol
+
+    def release(self, protocol):
+        """Return a protocol to the pool once a request has completed.
+
+        Protocols which are no longer connected or which cannot be reused
+        are closed instead of being added to the idle list.
+        """
+        if not self._healthy(protocol):
+            self._close(protocol)
+            return
+
+        idle = self._idle.setdefault(protocol.target.address, deque())
+        if len(idle) >= self.max_idle:
+            self._close(protocol)
+            return
+
+        idle.append((protocol, self._time()))
+        self._schedule_eviction()
+
+    @asyncio.coroutine
+    def fill(self, target):
+        """Open connections to ``target`` until :attr:`min_idle` connections
+        are available."""
+
+        idle = self._idle.setdefault(target.address, deque())
+        while len(idle) < self.min_idle:
+            protocol = yield from self.connect(target)
+            if not self._healthy(protocol):
+                self._close(protocol)
+                break
+
+            self.release(protocol)
+
+    def evict(self):
+        """Close connections which have been idle for longer than
+        :attr:`idle_timeout` seconds, keeping at least :attr:`min_idle`
+        connections per address."""
+
+        self._evict_handle = None
+        expired = self._time() - self.idle_timeout
+
+        for idle in self._idle.values():
+            # Connections are appended as they are released so the oldest
+            # are always at the left hand end.
+            while len(idle) > self.min_idle and idle[0][1] <= expired:
+                protocol, _released = idle.popleft()
+                self._close(protocol)
+
+        if any(len(idle) > self.min_idle for idle in self._idle.values()):
+            self._schedule_eviction()
+
+    def close(self):
+        """Close all idle connections."""
+
+        if self._evict_handle is not None:
+            self._evict_handle.cancel()
+            self._evict_handle = None
+
+        for idle in self._idle.values():
+            while idle:
+                protocol, _released = idle.pop()
+                self._close(protocol)
+
+        self._idle.clear()
+
+    def __len__(self):
+        return sum(len(idle) for idle in self._idle.values())
+
+    def _connection_lost(self, protocol):
+        """Remove a protocol whose connection has been lost from the idle
+        list and reconnect if the address has fallen below :attr:`min_idle`
+        """
+
+        address = protocol.target.address
+        idle = self._idle.get(address)
+        if not idle:
+            return
+
+        for item in list(idle):
+            if item[0] is protocol:
+                idle.remove(item)
+                break
+        else:
+            return
+
+        if len(idle) < self.min_idle:
+            logging.debug('ConnectionPool: Reconnecting to %s' % protocol.target)
+            asyncio.async(self.fill(self._targets[address]), loop=self._loop())
+
+    def _healthy(self, protocol):
+        return protocol.is_connected and protocol.reusable
+
+    def _close(self, protocol):
+        protocol.connection_lost_handler = None
+        protocol.close()
+
+    def _schedule_eviction(self):
+        if self._evict_handle is None:
+            self._evict_handle = self._loop().call_later(self.idle_timeout,
+                                                         self.evict)
+
+    def _time(self):
+        return self._loop().time()
+
+    def _loop(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        return self.loop
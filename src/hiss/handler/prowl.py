@@ -9,10 +9,13 @@ import asyncio
 import aiohttp
 import xml.dom.minidom
 
-from hiss.handler.aio import Handler
+from hiss.handler.aio import AIOHandler
 
+# Returned when the API limit for our IP address has been exceeded
+API_LIMIT_EXCEEDED = 406
 
-class ProwlHandler(Handler):
+
+class ProwlHandler(AIOHandler):
     """:class:`~hiss.handler.Handler` sub-class for Prowl notifications"""
 
     __name__ = 'Prowl'
@@ -38,6 +41,21 @@ class ProwlHandler(Handler):
         protocol.loop = self.loop
         return protocol
 
+    def _feedback(self, target, response):
+        """Spread the remaining API calls over the time until the limit
+        resets."""
+
+        if response.get('status_code') == API_LIMIT_EXCEEDED:
+            self.rate_limiter.flooded(target)
+            return
+
+        if response.get('remaining'):
+            self.rate_limiter.quota(target,
+                                    int(response['remaining']),
+                                    int(response['resetdate']))
+
+        super()._feedback(target, response)
+
 
 class ProwlProtocol(asyncio.Protocol):
     """Prowl HTTP Protocol."""
@@ -88,6 +106,8 @@ class ProwlProtocol(asyncio.Protocol):
             if http_response.status == 200:
                 result['status'] = 'OK'
                 result['status_code'] = 0
+                result['remaining'] = response.remaining
+                result['resetdate'] = response.resetdate
             else:
                 result['status'] = 'ERROR'
                 result['status_code'] = response.status_code
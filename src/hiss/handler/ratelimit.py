@@ -0,0 +1,203 @@
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+"""Provides per target rate limiting for handlers using token buckets whose
+rates adapt to feedback from the target.
+"""
+
+import time
+import asyncio
+import logging
+
+__all__ = ['RateLimiter', 'TokenBucket']
+
+# Rate in requests per second used when a target which is not rate limited
+# tells us it is being flooded.
+FLOODING_RATE = 5.0
+
+# Multiplier applied to the rate each time a target reports flooding.
+FLOODING_BACKOFF = 0.5
+
+# The slowest rate a target can be reduced to by flooding replies.
+MINIMUM_RATE = 0.1
+
+# Multiplier applied to a reduced rate for each successful request.
+RECOVERY_FACTOR = 1.05
+
+
+class TokenBucket(object):
+    """A token bucket which queues callers until a token is available.
+
+    :param rate:  Number of tokens added per second or ``None`` for no limit
+    :type rate:   float
+    :param burst: Maximum number of tokens which can accumulate.
+    :type burst:  int
+    :param loop:  :mod:`asyncio` event loop to use.
+    :type loop:   :class:`asyncio.BaseEventLoop`
+    """
+
+    def __init__(self, rate=None, burst=1, loop=None):
+        self.rate = rate
+        """The current rate which may have been reduced by feedback"""
+
+        self.configured_rate = rate
+        """The rate the bucket recovers to after being reduced"""
+
+        self.burst = burst
+        self.loop = loop
+
+        self._tokens = float(burst)
+        self._updated = None
+        self._paused_until = 0
+
+    @asyncio.coroutine
+    def acquire(self):
+        """Wait until a token is available and take it.
+
+        Tokens are reserved when a caller arrives so callers are released
+        in the order they called.
+        """
+        delay = self.reserve()
+        if delay > 0:
+            yield from asyncio.sleep(delay)
+
+    def reserve(self):
+        """Take a token returning the number of seconds until it can be
+        used."""
+
+        now = self._time()
+        delay = max(0, self._paused_until - now)
+        if self.rate is None:
+            return delay
+
+        self._refill(now)
+        self._tokens -= 1
+        if self._tokens < 0:
+            delay = max(delay, -self._tokens / self.rate)
+
+        return delay
+
+    def throttle(self):
+        """Reduce the rate after the target reported it is being flooded."""
+
+        if self.rate is None:
+            self.set_rate(FLOODING_RATE)
+        else:
+            self.set_rate(max(MINIMUM_RATE, self.rate * FLOODING_BACKOFF))
+
+        self._tokens = min(self._tokens, 0)
+
+    def recover(self):
+        """Move a reduced rate back towards the configured rate."""
+
+        if self.rate is None or self.rate == self.configured_rate:
+            return
+
+        rate = self.rate * RECOVERY_FACTOR
+        if self.configured_rate is not None:
+            rate = min(rate, self.configured_rate)
+        elif rate >= FLOODING_RATE:
+            rate = None
+
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """Change the current rate keeping the tokens accumulated so far."""
+
+        now = self._time()
+        if self.rate is not None:
+            self._refill(now)
+        else:
+            self._updated = now
+
+        self.rate = rate
+
+    def pause(self, seconds):
+        """Hold all callers for ``seconds``"""
+
+        self._paused_until = max(self._paused_until, self._time() + seconds)
+
+    def _refill(self, now):
+        if self._updated is not None:
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _time(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        return self.loop.time()
+
+
+class RateLimiter(object):
+    """Maintains a :class:`TokenBucket` for each target a handler sends to.
+
+    :param rate:  Requests per second allowed to each target or ``None`` for
+                  no limit until a target reports it is being flooded.
+    :type rate:   float
+    :param burst: Number of requests which can be sent to a target before
+                  the rate applies.
+    :type burst:  int
+    :param loop:  :mod:`asyncio` event loop to use.
+    :type loop:   :class:`asyncio.BaseEventLoop`
+    """
+
+    def __init__(self, rate=None, burst=1, loop=None):
+        self.rate = rate
+        self.burst = burst
+        self.loop = loop
+
+        self._buckets = {}
+
+    @asyncio.coroutine
+    def acquire(self, target):
+        """Wait until a request can be sent to ``target``"""
+
+        yield from self.bucket(target).acquire()
+
+    def bucket(self, target):
+        """Return the :class:`TokenBucket` for ``target``"""
+
+        key = repr(target)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, self.loop)
+            self._buckets[key] = bucket
+
+        return bucket
+
+    def flooded(self, target):
+        """Reduce the rate for ``target`` after it reported flooding."""
+
+        bucket = self.bucket(target)
+        bucket.throttle()
+        logging.debug('RateLimiter: %s flooded, rate reduced to %.2f/s' % \
+                      (target, bucket.rate))
+
+    def accepted(self, target):
+        """Record a request accepted by ``target``"""
+
+        key = repr(target)
+        if key in self._buckets:
+            self._buckets[key].recover()
+
+    def quota(self, target, remaining, reset):
+        """Spread the requests remaining in a target's quota over the time
+        until the quota resets.
+
+        :param remaining: Number of requests remaining
+        :type remaining:  int
+        :param reset:     UNIX timestamp at which the quota resets.
+        :type reset:      float
+        """
+        bucket = self.bucket(target)
+        seconds = max(0, reset - time.time())
+
+        if remaining <= 0:
+            bucket.pause(seconds)
+        elif seconds > 0:
+            rate = remaining / seconds
+            if bucket.configured_rate is None or rate < bucket.configured_rate:
+                bucket.set_rate(rate)
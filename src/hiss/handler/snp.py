@@ -2,12 +2,13 @@
 #
 # Part of 'hiss' the asynchronous notification library
 
+import time
 import asyncio
 import base64
 import logging
 import warnings
 from pprint import pformat
-from collections import namedtuple
+from collections import namedtuple, deque
 from os import urandom
 from binascii import unhexlify
 from operator import attrgetter
@@ -63,6 +64,24 @@ SNARL_STATUS = {
 # The following error codes do not constitute a failed response
 ACCEPTABLE_ERRORS = [203, 204]
 
+# Returned when Snarl is receiving notifications faster than it can handle
+FLOODING = 208
+
+# Returned when the notifier is not registered with Snarl
+NOT_REGISTERED = 202
+
+# Returned when Snarl does not understand a request which may mean the version
+# of Snarl has changed since the version information was cached.
+UNKNOWN_COMMAND = 102
+BAD_PACKET = 107
+
+# Number of seconds the versions returned by a host are cached for
+VERSION_CACHE_TTL = 3600.0
+
+# Maximum number of bytes of an incomplete response which are buffered before
+# the connection is closed.
+MAX_RESPONSE_SIZE = 1024 * 1024
+
 EVENT_MAPPING = {
     '304': 0,
     '303': 1,
@@ -87,8 +106,43 @@ BOOL_MAPPING = {
 
 
 SNPCommand = namedtuple('SNPCommand', 'name parameters')
+
+# Maximum number of parameter orders remembered by _parameter_order
+PARAMETER_ORDER_CACHE_SIZE = 256
+
+_parameter_orders = {}
+
+
+def _parameter_order(command_name, parameters):
+    """Return the parameter names of a command sorted into the order they are
+    sent.
+
+    The protocol builds the parameters for each type of command in the same
+    way so the sorted order is remembered for each command name and set of
+    parameter names.
+    """
+
+    key = (command_name, tuple(parameters))
+    order = _parameter_orders.get(key)
+    if order is None:
+        if len(_parameter_orders) >= PARAMETER_ORDER_CACHE_SIZE:
+            _parameter_orders.clear()
+
+        order = sorted(parameters)
+        _parameter_orders[key] = order
+
+    return order
+
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        return value.encode('UTF-8')
+    return value
+
+
 SNPResult = namedtuple('SNPResult', 'command status_code reason')
 
+
 class SNPError(HissError):
     pass
 
@@ -105,6 +159,7 @@ class SNPHandler(AIOHandler):
         self.factory = lambda: SNPProtocol()
         self.async_factory = lambda: SNPSubscriptionProtocol()
         self.capabilities = ['register', 'unregister', 'subscribe', 'show', 'hide']
+        self.use_pool()
 
     @asyncio.coroutine
     def connect(self, target, factory=None):
@@ -112,25 +167,121 @@ class SNPHandler(AIOHandler):
         :meth:`get_version` method."""
 
         protocol = yield from super().connect(target, factory)
+        yield from self._get_version(protocol, target)
+        return protocol
 
-        if not hasattr(target, 'api_version'):
-            response = yield from protocol.get_version()
-            target.api_version = int(response.result.decode('UTF-8'))
-            target.protocol_version = response.max_version
+    @asyncio.coroutine
+    def acquire(self, target):
+        """Augment the :meth:`hiss.handler.Handler.acquire` to call the
+        :meth:`get_version` method when a pooled connection is used for a
+        new target."""
 
+        protocol = yield from super().acquire(target)
+        yield from self._get_version(protocol, target)
         return protocol
 
+    def not_registered(self, response):
+        return response.get('status_code') == NOT_REGISTERED
+
+    def _feedback(self, target, response):
+        """Reduce the rate to a target when Snarl reports it is flooded."""
+
+        status_code = response.get('status_code')
+        if status_code == FLOODING:
+            self.rate_limiter.flooded(target)
+        elif status_code in (UNKNOWN_COMMAND, BAD_PACKET):
+            # Find the version again in case Snarl has been changed, asking
+            # for it with the base version of the protocol.
+            _version_cache.invalidate(target.address)
+            if hasattr(target, 'api_version'):
+                del target.api_version
+            target.protocol_version = ''
+        else:
+            super()._feedback(target, response)
+
+    @asyncio.coroutine
+    def _get_version(self, protocol, target):
+        if not hasattr(target, 'api_version'):
+            versions = _version_cache.get(target.address)
+            if versions is None:
+                response = yield from protocol.get_version()
+                versions = (int(response.result.decode('UTF-8')),
+                            response.max_version)
+                _version_cache.set(target.address, versions)
+
+            target.api_version, target.protocol_version = versions
+
+
+class _VersionCache(object):
+    """The ``(api_version, protocol_version)`` returned by each host:port
+    shared by all handlers so that the version is only requested once per
+    host rather than once per :class:`~hiss.target.Target`."""
+
+    def __init__(self, ttl=VERSION_CACHE_TTL):
+        self.ttl = ttl
+        self._versions = {}
+
+    def get(self, address):
+        entry = self._versions.get(address)
+        if entry is None:
+            return None
+
+        versions, expires = entry
+        if time.monotonic() > expires:
+            del self._versions[address]
+            return None
+
+        return versions
+
+    def set(self, address, versions):
+        self._versions[address] = (versions, time.monotonic() + self.ttl)
+
+    def invalidate(self, address):
+        self._versions.pop(address, None)
+
+    def clear(self):
+        self._versions.clear()
+
+
+_version_cache = _VersionCache()
+
 
 class SNPBaseProtocol(asyncio.Protocol):
     def __init__(self):
         self._target = None
-        self._buffer = None
+        self._parser = None
+        self._transport = None
+        self.reusable = True
+        self.connection_lost_handler = None
+        self._waiters = deque()
 
     def connection_made(self, transport):
         self.response = None
-        self._buffer = bytearray()
+        self._parser = ResponseParser()
         self._transport = transport
 
+    def connection_lost(self, exc):
+        self._transport = None
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(
+                    ConnectionError('Connection to %s lost' % self.target))
+
+        if self.connection_lost_handler is not None:
+            self.connection_lost_handler(self)
+
+    @property
+    def is_connected(self):
+        """True if the connection to the target is still open."""
+        return self._transport is not None
+
+    def close(self):
+        """Close the connection to the target."""
+        if self._transport is not None:
+            self._transport.close()
+
     @property
     def target(self):
         """The :class:`hiss.target.Target` to send/receive notifications."""
@@ -178,8 +329,8 @@ class SNPBaseProtocol(asyncio.Protocol):
             request.append(command)
 
         data = request.marshal()
-        self._transport.write(data)
-        yield from self._wait_for_response()
+        waiter = self._write(data)
+        yield from self._wait_for_response(waiter)
         return self.response
 
     @asyncio.coroutine
@@ -190,13 +341,77 @@ class SNPBaseProtocol(asyncio.Protocol):
             responses.append(response)
         return responses
 
+    def _parse(self, data):
+        """Return the complete responses in the data received so far."""
+
+        version = self.target.protocol_version
+        try:
+            frames = self._parser.feed(data, version)
+        except MarshalError as exc:
+            logging.error('%s: %s' % (self.__class__.__name__, exc))
+            self._parser.clear()
+            self.close()
+            return []
+
+        responses = []
+        for frame in frames:
+            response = Response(version)
+            response.unmarshal(frame)
+            responses.append(response)
+
+        return responses
+
+    def _write(self, data):
+        """Write data to the target returning a :class:`asyncio.Future` which
+        receives the response.
+
+        SNP responses carry no request identifier so they are matched to
+        requests in the order the requests were sent.
+        """
+        if self._transport is None:
+            raise ConnectionError('Connection to %s lost' % self.target)
+
+        waiter = asyncio.Future()
+        self._waiters.append(waiter)
+        self._transport.write(data)
+        return waiter
+
     @asyncio.coroutine
-    def _wait_for_response(self):
-        while True:
-            if self.response is not None:
-                return
+    def _wait_for_response(self, waiter):
+        self.response = yield from waiter
+        return self.response
+
+    def _resolve(self, response):
+        if not self._waiters:
+            return False
+
+        waiter = self._waiters.popleft()
+        if not waiter.done():
+            waiter.set_result(response)
+
+        return True
+
+    def _build_command_result(self, command, snp_result):
+        """Build the result for a single command in a multi-command
+        request."""
+
+        result = self._build_result(command)
+        result['result'] = snp_result
+
+        if snp_result is None:
+            result['status'] = 'ERROR'
+            result['status_code'] = None
+            result['reason'] = 'No result returned for command'
+        else:
+            result['status_code'] = snp_result.status_code
+            if snp_result.status_code == 0 or \
+                    snp_result.status_code in ACCEPTABLE_ERRORS:
+                result['status'] = 'OK'
             else:
-                yield from asyncio.sleep(0.1)
+                result['status'] = 'ERROR'
+                result['reason'] = snp_result.reason
+
+        return result
 
     def _build_result(self, command):
         result = {}
@@ -226,27 +441,10 @@ class SNPProtocol(SNPBaseProtocol):
         super().__init__()
 
     def data_received(self, data):
-        self._buffer.extend(data)
-
-        version = self.target.protocol_version
-        if version == '2.0':
-            end_of_response_marker = b'\r\n'
-        else:
-            end_of_response_marker = b'END\r\n'
-
-        end = self._buffer.find(end_of_response_marker)
-        if end != -1:
-            if version == '2.0':
-                data = self._buffer[:end]
-                del self._buffer[:end + 2]
-            else:
-                data = self._buffer[:end + 3]
-                del self._buffer[:end + 5]
-
-            response = Response()
-            response.version = version
-            response.unmarshal(data)
-            self.response = response
+        for response in self._parse(data):
+            if not self._resolve(response):
+                logging.debug('SNPProtocol: Unexpected response %r' %
+                              response.body)
 
     @asyncio.coroutine
     def register(self, async_notifier, **kwargs):
@@ -303,6 +501,57 @@ class SNPProtocol(SNPBaseProtocol):
         logging.debug(pformat(result))
         return result
 
+    @asyncio.coroutine
+    def notify_batch(self, notifications):
+        """Send a list of notifications to our target in a single request.
+
+        The result for each notification is returned under the ``results``
+        key in the same order as ``notifications``. Targets which only
+        support SNP 2.0 are sent the notifications one at a time.
+
+        :param notifications: Notifications to send
+        :type notifications:  list of :class:`hiss.Notification`
+        """
+
+        assert self.target.protocol_version != ''
+
+        if self.target.protocol_version != '3.0':
+            results = []
+            for notification in notifications:
+                result = yield from self.notify(notification,
+                                                notification.notifier)
+                results.append(result)
+
+            result = dict(max(results, key=lambda r: r['status_code'] or 0))
+            result['results'] = results
+            return result
+
+        for notification in notifications:
+            if notification.sound is not None:
+                warnings.warn(('Sending notifications using sounds has been '
+                               'deprecated since Snarl 2.3'))
+
+        request_info = _NotifyBatchRequestInfo(notifications, self.target)
+        yield from self.send_request(request_info)
+
+        command_results = self.response.result
+        if not isinstance(command_results, list):
+            command_results = [command_results]
+
+        results = []
+        for idx in range(len(notifications)):
+            if idx < len(command_results):
+                snp_result = command_results[idx]
+            else:
+                snp_result = None
+
+            results.append(self._build_command_result('notify', snp_result))
+
+        result = self._build_result('notify')
+        result['results'] = results
+        logging.debug(pformat(result))
+        return result
+
     @asyncio.coroutine
     def add_action(self, notification):
         raise NotImplementedError
@@ -369,30 +618,15 @@ class SNPSubscriptionProtocol(SNPBaseProtocol):
         super().__init__()
 
     def data_received(self, data):
-        self._buffer.extend(data)
-
-        version = self.target.protocol_version
-        if version == '2.0':
-            end_of_response_marker = b'\r\n'
-            end_of_response_marker_len = 2
-        else:
-            end_of_response_marker = b'END\r\n'
-            end_of_response_marker_len = 5
-
-        responses = []
-        end = self._buffer.find(end_of_response_marker)
-        while end != -1:
-            data = self._buffer[:end + (end_of_response_marker_len - 2)]
-            del self._buffer[:end + end_of_response_marker_len]
-
-            response = Response(version)
-            response.unmarshal(data)
-            responses.append(response)
+        events = []
+        for response in self._parse(data):
+            # The first response is the reply to the subscribe request
+            if not self._resolve(response):
+                events.append(response)
 
-            end = self._buffer.find(end_of_response_marker)
-
-        # Deliver the responses
-        asyncio.async(self._async_handler(responses))
+        # Only schedule delivery when a complete event has arrived
+        if events and self._async_handler is not None:
+            asyncio.async(self._async_handler(events))
 
     @asyncio.coroutine
     def subscribe(self, async_notifier, signatures=None):
@@ -496,59 +730,60 @@ class Request(object):
                                 'Request.unmarshal')
 
     def _marshal_20(self):
-        data = self._marshal_command(self.commands[0]).encode('UTF-8')
-        data = b'snp://' + data + b'\r\n'
-        return data
+        return b'snp://' + self._marshal_command(self.commands[0]) + b'\r\n'
 
     def _marshal_30(self):
-        data = 'SNP/3.0'
+        header = 'SNP/3.0'
         if self.password != '':
             if self.use_encryption:
-                data += ' %s' % self._encryption
+                header += ' %s' % self._encryption
             else:
-                data += ' NONE'
+                header += ' NONE'
 
             if self.use_hash:
-                data += ' %s' % str(self._hash)
+                header += ' %s' % str(self._hash)
         else:
-            data += 'NONE'
-
-        data += '\r\n'
+            header += 'NONE'
 
+        # The request is built from a list of segments joined once at the end
+        # so that large values, such as icons, are only copied once.
+        segments = [header.encode('UTF-8'), b'\r\n']
         for command in self.commands:
-            data += '%s\r\n' % self._marshal_command(command)
+            self._command_segments(command, segments)
+            segments.append(b'\r\n')
 
-        data += 'END\r\n'
-        return data.encode('UTF-8')
+        segments.append(b'END\r\n')
+        return b''.join(segments)
 
     def _marshal_command(self, command):
-        if len(command.parameters) == 0:
-            return command.name
-        else:
-            data = ''
-
-            names = list(command.parameters.keys())
-            names.sort()
-
-            for name in names:
-                value = command.parameters[name]
-                if isinstance(value, list):
-                    for item in value:
-                        item = self._escape(self._expand_tuple(item))
-                        data += '%s=%s&' % (name, item)
-                elif isinstance(value, (bytearray, bytes)):
-                    data += '%s=%s&' % (name, value.decode('ascii'))
-                else:
-                    value = self._escape(self._expand_tuple(value))
-                    data += '%s=%s&' % (name, value)
-
-            data = data[:-1]
-
-            if len(data) > 0:
-                data = '%s?%s' % (command.name, data)
-                return data
+        return b''.join(self._command_segments(command, []))
+
+    def _command_segments(self, command, segments):
+        """Append the segments of the encoded ``command`` to ``segments``"""
+
+        segments.append(_to_bytes(command.name))
+        parameters = command.parameters
+        if len(parameters) == 0:
+            return segments
+
+        segments.append(b'?')
+        for key in _parameter_order(command.name, parameters):
+            value = parameters[key]
+            key = _to_bytes(key) + b'='
+
+            if isinstance(value, list):
+                for item in value:
+                    item = self._escape(self._expand_tuple(item))
+                    segments.extend((key, item.encode('UTF-8'), b'&'))
+            elif isinstance(value, (bytearray, bytes)):
+                segments.extend((key, value, b'&'))
             else:
-                return command.name
+                value = self._escape(self._expand_tuple(value))
+                segments.extend((key, value.encode('UTF-8'), b'&'))
+
+        # Remove the trailing '&' or, if there were no values, the '?'
+        segments.pop()
+        return segments
 
     def _unmarshal_20(self, data):
         data = data[6:].strip(b'\r\n')
@@ -725,7 +960,7 @@ class Response(object):
             value = value.decode('UTF-8').strip()
 
             if key == b'result':
-                command, status_code, reason = value.split(' ')
+                command, status_code, reason = value.split(' ', 2)
                 status_code = int(status_code)
                 results.append(SNPResult(command, status_code, reason))
             elif key in ATTR_MAPPING:
@@ -767,6 +1002,86 @@ class Response(object):
         pass
 
 
+class ResponseParser(object):
+    """Incremental parser which splits a stream of data into the data for
+    each SNP response.
+
+    The stream is scanned from where the previous call to :meth:`feed` stopped
+    and consumed data is only discarded once it makes up at least half of the
+    buffer so that each byte is scanned and moved a constant number of times.
+
+    :param max_size: Maximum number of bytes of an incomplete response to
+                     buffer.
+    :type max_size:  int
+    """
+
+    def __init__(self, max_size=MAX_RESPONSE_SIZE):
+        self.max_size = max_size
+        self._buffer = bytearray()
+        self._start = 0
+        self._scan = 0
+
+    def feed(self, data, version=SNP_DEFAULT_VERSION):
+        """Add ``data`` to the stream returning a list containing the data for
+        each response it completes.
+
+        :param data:    Data received
+        :type data:     bytes
+        :param version: SNP version of the responses. Version 2.0 responses
+                        are a single line and version 3.0 responses end with
+                        an ``END`` line.
+        :type version:  str
+        :raises MarshalError: If more than :attr:`max_size` bytes are
+                              received without the end of a response.
+        """
+
+        if version == '2.0':
+            marker = b'\r\n'
+        else:
+            marker = b'END\r\n'
+
+        buf = self._buffer
+        buf.extend(data)
+
+        frames = []
+        start = self._start
+        end = buf.find(marker, self._scan)
+        while end != -1:
+            # Version 3.0 responses are passed on including the 'END'
+            frames.append(bytes(buf[start:end + len(marker) - 2]))
+            start = end + len(marker)
+            end = buf.find(marker, start)
+
+        if start == len(buf):
+            del buf[:]
+            start = 0
+        elif start * 2 >= len(buf):
+            del buf[:start]
+            start = 0
+
+        self._start = start
+
+        # Resume scanning where a marker split across reads could begin
+        self._scan = max(start, len(buf) - len(marker) + 1)
+
+        if len(buf) - start > self.max_size:
+            raise MarshalError('SNP response exceeds %d bytes' % self.max_size,
+                               'ResponseParser.feed')
+
+        return frames
+
+    def clear(self):
+        """Discard any buffered data."""
+
+        del self._buffer[:]
+        self._start = 0
+        self._scan = 0
+
+    def __len__(self):
+        """The number of bytes waiting for the end of a response."""
+        return len(self._buffer) - self._start
+
+
 class _VersionRequestInfo(object):
     def __init__(self):
         self.commands = [('version', {})]
@@ -788,8 +1103,9 @@ class _RegisterRequestInfo(object):
         icon = async_notifier.icon
         if icon is not None:
             if isinstance(icon, Icon):
-                data = snp64(icon.data)
-                parameters['icon-phat64'] = data
+                data = icon.encoded('snp64', snp64)
+                if data is not None:
+                    parameters['icon-phat64'] = data
             else:
                 parameters['icon'] = icon
 
@@ -805,8 +1121,9 @@ class _RegisterRequestInfo(object):
 
             if info.icon is not None:
                 if isinstance(info.icon, Icon):
-                    data = snp64(icon.data)
-                    parameters['icon-base64'] = data
+                    data = info.icon.encoded('snp64', snp64)
+                    if data is not None:
+                        parameters['icon-base64'] = data
                 else:
                     parameters['icon'] = info.icon
 
@@ -854,8 +1171,9 @@ class _NotifyRequestInfo(object):
 
         if notification.icon is not None:
             if isinstance(notification.icon, Icon):
-                data = snp64(notification.icon.data)
-                parameters['icon-base64'] = data
+                data = notification.icon.encoded('snp64', snp64)
+                if data is not None:
+                    parameters['icon-base64'] = data
             else:
                 if notification.icon == '':
                     icon = async_notifier.icon
@@ -899,6 +1217,16 @@ class _NotifyRequestInfo(object):
         self.commands.append(('notify', parameters))
 
 
+class _NotifyBatchRequestInfo(object):
+    def __init__(self, notifications, target):
+        self.commands = []
+
+        for notification in notifications:
+            request_info = _NotifyRequestInfo(notification,
+                                              notification.notifier, target)
+            self.commands.extend(request_info.commands)
+
+
 class _AddActionRequestInfo(object):
     def __init__(self, async_notifier, target, notification, command, label):
         self.commands = []
@@ -974,13 +1302,9 @@ class _SubscribeRequestInfo(object):
 
 
 def snp64(data):
-    data = bytearray(base64.b64encode(data))
-    data = data.replace(b'\r\n', b'#')
-
-    # Replace trailing = with %
-    pos = -1
-    while data[pos] == 61:
-        data[pos] = 37
-        pos -= 1
+    """Encode data as base64 with the trailing ``=`` padding replaced by
+    ``%`` as Snarl requires."""
 
-    return data
+    data = base64.b64encode(data)
+    stripped = data.rstrip(b'=')
+    return stripped + b'%' * (len(data) - len(stripped))
@@ -5,12 +5,15 @@
 import uuid
 import asyncio
 import logging
+from functools import partial
 from itertools import product
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from collections.abc import MutableMapping
 
+from hiss.dispatch import Dispatcher
 from hiss.target import Target
 from hiss.exception import NotifierError
-from hiss.notification import Notification
+from hiss.notification import Notification, NotificationPriority
 
 from hiss.handler.gntp.async import GNTPHandler
 from hiss.handler.snp import SNPHandler
@@ -45,20 +48,33 @@ class Notifier(object):
     :type async_handler:  asyncio coroutine
     :param loop:      :mod:`asyncio` event loop to use.
     :type loop:       :class:`asyncio.BaseEventLoop`
+    :param dispatcher: Dispatcher which limits the number of requests in
+                       flight when sending to many targets.
+    :type dispatcher:  :class:`~hiss.dispatch.Dispatcher`
+    :param deduplicator: Deduplicator used to drop repeated notifications
+                         or ``None`` to send every notification.
+    :type deduplicator:  :class:`~hiss.dedupe.Deduplicator`
+    :param registration_cache: Cache used to skip registering with targets
+                               which already have this notifier registered
+                               or ``None`` to always register.
+    :type registration_cache:  :class:`~hiss.registration.RegistrationCache`
     """
     #TODO: standardised icon and sound handling between handler types
     def __init__(self, name, signature,
                  icon=None, sound=None,
                  asynchronous=True,
                  handlers=(None, None),
-                 loop=None):
+                 loop=None,
+                 dispatcher=None,
+                 deduplicator=None,
+                 registration_cache=None):
         self.name = name
         self.signature = signature
         self.icon = icon
         self.sound = sound
         self.asynchronous = asynchronous
 
-        self.notification_classes = {}
+        self.notification_classes = NotificationRegistry()
         self.targets = TargetList()
 
         if asynchronous and handlers[0] and not asyncio.iscoroutinefunction(handlers[0]):
@@ -76,6 +92,12 @@ class Notifier(object):
                 self.loop = loop
         self.loop = None
 
+        if dispatcher is None:
+            dispatcher = Dispatcher(loop=self.loop)
+        self.dispatcher = dispatcher
+        self.deduplicator = deduplicator
+        self.registration_cache = registration_cache
+
         self._handlers = {}
         self._notifications = {}
 
@@ -108,10 +130,7 @@ class Notifier(object):
         ni = NotificationInfo(name, title, text, icon, sound, enabled)
 
         if class_id is None or class_id in self.notification_classes:
-            if len(self.notification_classes) == 0:
-                class_id = 1
-            else:
-                class_id = max(self.notification_classes.keys()) + 1
+            class_id = self.notification_classes.allocate_id()
 
         self.notification_classes[class_id] = ni
 
@@ -159,7 +178,10 @@ class Notifier(object):
                                  str(class_id))
             registration_info = self.notification_classes[class_id]
         elif name != '':
-            registration_info = self.find_notification(name)
+            class_id = self.notification_classes.find_id(name)
+            if class_id is None:
+                raise NotifierError('Notification name %s not found.' % name)
+            registration_info = self.notification_classes[class_id]
         else:
             raise NotifierError('Either a class id or name must be specified.',
                                 'hiss.notifier.Notifier')
@@ -172,7 +194,7 @@ class Notifier(object):
         if text is USE_REGISTERED:
             text = registration_info.text
 
-        if icon is None:
+        if icon is USE_REGISTERED:
             if registration_info.icon is not None:
                 icon = registration_info.icon
             else:
@@ -192,19 +214,23 @@ class Notifier(object):
         return n
 
     def find_notification(self, name):
-        for value in self.notification_classes.values():
-            if value.name == name:
-                return value
+        class_id = self.notification_classes.find_id(name)
+        if class_id is None:
+            raise NotifierError('Notification name %s not found.' % name)
 
-        raise NotifierError('Notification name %s not found.' % name)
+        return self.notification_classes[class_id]
 
     @asyncio.coroutine
-    def add_target(self, targets):
+    def add_target(self, targets, groups=None):
         """Add a single target or list of targets to the known targets
         and connects to them
 
         :param targets: The Target or list of Targets to add.
         :type targets:  :class:`~hiss.target.Target`
+        :param groups:  Group name or list of group names to tag the targets
+                        with. The name of a group can then be passed as the
+                        ``targets`` argument to the other methods.
+        :type groups:   str or list of str
         :returns:       Result dict or list of dict if more than one target added.
         """
         if isinstance(targets, Target):
@@ -240,13 +266,15 @@ class Notifier(object):
                     result['reason'] = 'Unable to connect to target'
                 else:
                     result['status'] = 'OK'
-                    self.targets.append(tr.target)
+                    self.targets.append(tr.target, groups)
 
                 results.append(result)
         else:
-            self.targets.append(target)
-            results = [dict(target=target,
-                            status='OK')]
+            results = []
+            for target in targets:
+                self.targets.append(target, groups)
+                results.append(dict(target=target,
+                                    status='OK'))
 
         if len(results) == 1:
             return results[0]
@@ -265,26 +293,22 @@ class Notifier(object):
         logging.log(logging.DEBUG, message)
 
     @asyncio.coroutine
-    def register(self, targets=None):
+    def register(self, targets=None, force=False):
         """Register this notifier with the target specified.
 
         :param targets: The target or targets to register with or ``None``
                         to register with all known target
         :type targets:  :class:`~hiss.target.Target`,
                         [:class:`~hiss.target.Target`] or ``None``
+        :param force:   Register even if the registration cache shows the
+                        target already has this notifier registered.
+        :type force:    bool
         """
-        targets = self.targets.valid_targets(targets)
-
-        wait_for = []
-        for target in targets:
-            wait_for.append(target.handler.register(self, target))
-
-        done, _pending = yield from asyncio.wait(wait_for)
+        jobs, _count = self._register_jobs(targets, force)
+        done = yield from self.dispatcher.run(jobs)
 
         results = []
-        for task in done:
-            result = task.result()
-
+        for result in done:
             response = {}
             response.update(result)
             results.append(response)
@@ -303,28 +327,16 @@ class Notifier(object):
         :param targets:       The targets to send the notification to. If no
                               targets is specified then the notification will
                               be sent to all known targets.
-        :type targets:        :class:`hiss.target.Target` or ``None``
+        :type targets:        :class:`hiss.target.Target`, list of
+                              :class:`hiss.target.Target`, a group name or
+                              ``None``
         """
-        if isinstance(notifications, Notification):
-            notifications = [notifications]
-
-        for notification in notifications:
-            notification.notifier = self
-
-        targets = self.targets.valid_targets(targets)
-
-        wait_for = []
-        combos = product(notifications, targets)
-        for notification, target in combos:
-            wait_for.append(target.handler.notify(notification, target))
-
-        done, _pending = yield from asyncio.wait(wait_for)
+        jobs, _count = self._notify_jobs(notifications, targets)
+        done = yield from self.dispatcher.run(jobs)
 
         #TODO: Handling of sticky notifications for show/hide
         responses = []
-        for task in done:
-            result = task.result()
-
+        for result in done:
             response = {}
             response.update(result)
             responses.append(response)
@@ -358,6 +370,42 @@ class Notifier(object):
         else:
             return responses
 
+    def register_iter(self, targets=None, force=False):
+        """Register this notifier with targets, returning an iterator of
+        coroutines which produce each target's response as it arrives.
+
+        Takes the same arguments as :meth:`register`.
+        """
+        jobs, count = self._register_jobs(targets, force)
+        return self._iter_results(jobs, count)
+
+    def notify_iter(self, notifications, targets=None):
+        """Send notifications to targets, returning an iterator of coroutines
+        which produce each target's response as soon as it arrives rather than
+        waiting for the slowest target. ::
+
+            for next_response in notifier.notify_iter(notifications):
+                response = yield from next_response
+
+        Takes the same arguments as :meth:`notify`.
+        """
+        jobs, count = self._notify_jobs(notifications, targets)
+        return self._iter_results(jobs, count)
+
+    def subscribe_iter(self, signatures=[], targets=None):
+        """Subscribe to notifications from a list of signatures, returning an
+        iterator of coroutines which produce each target's response as it
+        arrives.
+
+        Takes the same arguments as :meth:`subscribe`.
+        """
+        targets = self.targets.valid_targets(targets)
+        jobs = ((target,
+                 partial(target.handler.subscribe, self, signatures, target),
+                 NotificationPriority.normal)
+                for target in targets)
+        return self._iter_results(jobs, len(targets))
+
     @asyncio.coroutine
     def unregister(self, targets=None):
         """Unregister this notifier with all targets
@@ -367,10 +415,24 @@ class Notifier(object):
                         will be registered with all known targets
         :type targets:  :class:`hiss.Target` or ``None``
         """
+        if self.registration_cache is not None:
+            for target in self.targets.valid_targets(targets):
+                self.registration_cache.forget(target, self.signature)
+
         for handler in self._handlers.values():
             if handler.capabilities['unregister']:
                 handler.unregister(targets, notifier=self)
 
+    def close(self):
+        """Close the connections of the handlers created by this notifier
+        and save any changes to the registration cache."""
+
+        for handler in self._handlers.values():
+            handler.close()
+
+        if self.registration_cache is not None:
+            self.registration_cache.flush()
+
     @asyncio.coroutine
     def show(self, uid):
         """If ``uid`` is in the list of current notifications then show it."""
@@ -413,6 +475,96 @@ class Notifier(object):
         if self._async_handler:
             yield from self._async_handler(events)
 
+    def _register_jobs(self, targets, force=False):
+        targets = self.targets.valid_targets(targets)
+
+        jobs = ((target, partial(self._register_target, target, force),
+                 NotificationPriority.normal)
+                for target in targets)
+        return jobs, len(targets)
+
+    @asyncio.coroutine
+    def _register_target(self, target, force):
+        cache = self.registration_cache
+        if cache is not None and not force and \
+                cache.is_registered(target, self):
+            response = {
+                'handler': target.handler.__name__,
+                'command': 'register',
+                'status': 'OK',
+                'target': str(target),
+                'cached': True,
+            }
+            return response
+
+        response = yield from target.handler.register(self, target)
+        if cache is not None and response.get('status') == 'OK':
+            cache.record(target, self)
+
+        return response
+
+    @asyncio.coroutine
+    def _notify_target(self, notification, target):
+        response = yield from target.handler.notify(notification, target)
+
+        cache = self.registration_cache
+        if cache is not None and target.handler.not_registered(response):
+            # The target has lost the registration the cache says it has,
+            # e.g. because the receiver has been restarted.
+            cache.forget(target, self.signature)
+            registered = yield from self._register_target(target, True)
+            if registered.get('status') == 'OK':
+                response = yield from target.handler.notify(notification,
+                                                            target)
+
+        return response
+
+    def _notify_jobs(self, notifications, targets):
+        if isinstance(notifications, Notification):
+            notifications = [notifications]
+        else:
+            notifications = list(notifications)
+
+        for notification in notifications:
+            notification.notifier = self
+
+        if self.deduplicator is not None:
+            notifications = self.deduplicator.filter(notifications)
+
+        targets = self.targets.valid_targets(targets)
+
+        # The product is consumed lazily by the dispatcher so requests are
+        # only created when there is a free slot to send them.
+        combos = product(notifications, targets)
+        jobs = ((target, partial(self._notify_target, notification, target),
+                 notification.priority)
+                for notification, target in combos)
+        return jobs, len(notifications) * len(targets)
+
+    def _iter_results(self, jobs, count):
+        results = asyncio.Queue()
+        task = asyncio.async(self.dispatcher.run(jobs, results.put_nowait))
+
+        for _ in range(count):
+            yield self._next_result(results, task)
+
+    @asyncio.coroutine
+    def _next_result(self, results, task):
+        if results.empty() and task.done():
+            # Raises the exception which stopped the dispatcher
+            task.result()
+
+        getter = asyncio.async(results.get())
+        done, _pending = yield from asyncio.wait([getter, task],
+            return_when=asyncio.FIRST_COMPLETED)
+
+        if getter in done:
+            return getter.result()
+
+        getter.cancel()
+        task.result()
+        return results.get_nowait()
+
     @asyncio.coroutine
     def _handler(self, responses):
         logging.debug(responses)
@@ -422,36 +574,155 @@ class Notifier(object):
         return str(uuid.uuid4())
 
 
+class NotificationRegistry(MutableMapping):
+    """Mapping of class id to :class:`NotificationInfo` with an index of the
+    class ids by notification name.
+
+    Class ids are allocated in increasing order and are not reused when a
+    class is removed.
+    """
+
+    def __init__(self):
+        self._classes = {}
+        self._by_name = {}
+        self._next_id = 1
+
+    def __getitem__(self, class_id):
+        return self._classes[class_id]
+
+    def __setitem__(self, class_id, info):
+        old = self._classes.get(class_id)
+        if old is not None and old.name != info.name:
+            self._unindex(class_id)
+            old = None
+
+        self._classes[class_id] = info
+
+        # A class replaced under the same name keeps its place in the index
+        if old is None:
+            self._by_name.setdefault(info.name, []).append(class_id)
+
+        if isinstance(class_id, int) and class_id >= self._next_id:
+            self._next_id = class_id + 1
+
+    def __delitem__(self, class_id):
+        self._unindex(class_id)
+        del self._classes[class_id]
+
+    def __iter__(self):
+        return iter(self._classes)
+
+    def __len__(self):
+        return len(self._classes)
+
+    def allocate_id(self):
+        """Return the next unused class id."""
+
+        return self._next_id
+
+    def find_id(self, name):
+        """Return the id of the first class added with the notification
+        ``name`` or ``None`` if there is no class with that name."""
+
+        class_ids = self._by_name.get(name)
+        if class_ids:
+            return class_ids[0]
+        else:
+            return None
+
+    def _unindex(self, class_id):
+        name = self._classes[class_id].name
+        class_ids = self._by_name[name]
+        class_ids.remove(class_id)
+        if not class_ids:
+            del self._by_name[name]
+
+
 class TargetList(object):
+    """An ordered set of targets which can be tagged with group names.
+
+    Membership tests, removal and selecting the targets in a group do not
+    depend on the number of targets in the list.
+    """
+
     def __init__(self):
-        self.targets = []
+        # Maps target -> set of group names
+        self._targets = OrderedDict()
 
-    def __contains__(self, target):
-        for t in self.targets:
-            if target == t:
-                return True
+        # Maps group name -> targets in the group
+        self._groups = {}
+
+    @property
+    def targets(self):
+        """A list of the targets in the order they were added."""
+        return list(self._targets)
 
-        return False
+    def __contains__(self, target):
+        return target in self._targets
 
     def __iter__(self):
-        return self.targets.__iter__()
+        return iter(self._targets)
+
+    def __len__(self):
+        return len(self._targets)
+
+    def append(self, target, groups=None):
+        """Add a target
 
-    def append(self, target):
-        self.targets.append(target)
+        :param target: The target to add
+        :type target:  :class:`~hiss.target.Target`
+        :param groups: Group name or list of group names to tag the target
+                       with.
+        :type groups:  str or list of str
+        """
+        if target not in self._targets:
+            self._targets[target] = set()
+
+        if groups:
+            self.tag(target, groups)
 
     def remove(self, target):
-        index_to_delete = -1
-        for idx, t in enumerate(self.targets):
-            if target == t:
-                index_to_delete = idx
-                break
+        groups = self._targets.pop(target, None)
+        if groups is None:
+            return
+
+        for group in groups:
+            members = self._groups[group]
+            del members[target]
+            if not members:
+                del self._groups[group]
 
-        if index_to_delete != -1:
-            del self.targets[index_to_delete]
+    def tag(self, target, groups):
+        """Add a target to one or more groups.
+
+        :param target: A target in the list
+        :type target:  :class:`~hiss.target.Target`
+        :param groups: Group name or list of group names
+        :type groups:  str or list of str
+        """
+        if isinstance(groups, str):
+            groups = [groups]
+
+        tags = self._targets[target]
+        for group in groups:
+            tags.add(group)
+            self._groups.setdefault(group, OrderedDict())[target] = None
+
+    def group(self, name):
+        """Return a list of the targets tagged with the group ``name``"""
+
+        return list(self._groups.get(name, ()))
 
     def valid_targets(self, target_or_targets):
+        """Return the known targets from ``target_or_targets``
+
+        :param target_or_targets: A target, a list of targets, a group name
+                                  or ``None`` for all targets.
+        """
         if target_or_targets is None:
             target_or_targets = self.targets
+        elif isinstance(target_or_targets, str):
+            target_or_targets = self.group(target_or_targets)
         else:
             target_or_targets = self._known_targets(target_or_targets)
 
@@ -460,12 +731,8 @@ class TargetList(object):
     def _known_targets(self, target_or_targets):
         """Filter out unknown target_or_targets"""
 
-        if isinstance(target_or_targets, Target) and target_or_targets in self.targets:
-            return [target_or_targets]
-
-        _targets = []
-        for target in target_or_targets:
-            if target in self.targets:
-                _targets.append(target)
+        if isinstance(target_or_targets, Target):
+            target_or_targets = [target_or_targets]
 
-        return _targets
+        return [target for target in target_or_targets
+                if target in self._targets]
@@ -0,0 +1,164 @@
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+"""Provides a RegistrationCache which remembers which notifiers have been
+registered with which targets so that unchanged registrations are not sent
+again.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+
+from hiss.resource import Icon
+
+__all__ = ['RegistrationCache', 'fingerprint']
+
+# Number of seconds to wait after a change before writing the cache to disk
+# so that registering with many targets results in a single write.
+SAVE_DELAY = 1.0
+
+
+class RegistrationCache(object):
+    """Cache of the registrations sent to targets keyed by target and
+    notifier signature.
+
+    A registration is only sent again when the notifier's name, icon or
+    notification classes have changed since it was last sent to the target.
+
+    :param path:    File to persist the cache to or ``None`` to only keep it
+                    in memory.
+    :type path:     str
+    :param max_age: Number of seconds after which a registration is sent
+                    again even if it has not changed or ``None`` to keep
+                    registrations until they change.
+    :type max_age:  float
+    :param loop:    :mod:`asyncio` event loop to use.
+    :type loop:     :class:`asyncio.BaseEventLoop`
+    """
+
+    def __init__(self, path=None, max_age=None, loop=None):
+        self.path = path
+        self.max_age = max_age
+        self.loop = loop
+
+        # Maps 'target signature' -> [fingerprint, time registered]
+        self._entries = {}
+        self._save_handle = None
+
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def is_registered(self, target, notifier):
+        """Return True if ``notifier`` has been registered with ``target``
+        and has not changed since."""
+
+        entry = self._entries.get(self._key(target, notifier.signature))
+        if entry is None:
+            return False
+
+        if self.max_age is not None and time.time() - entry[1] > self.max_age:
+            return False
+
+        return entry[0] == fingerprint(notifier)
+
+    def record(self, target, notifier):
+        """Record a successful registration of ``notifier`` with
+        ``target``"""
+
+        key = self._key(target, notifier.signature)
+        self._entries[key] = [fingerprint(notifier), time.time()]
+        self._changed()
+
+    def forget(self, target, signature):
+        """Remove the registration of the notifier with ``signature`` from
+        ``target``"""
+
+        if self._entries.pop(self._key(target, signature), None) is not None:
+            self._changed()
+
+    def clear(self):
+        """Remove all registrations."""
+
+        self._entries.clear()
+        self._changed()
+
+    def load(self):
+        """Read the cache from :attr:`path`"""
+
+        try:
+            with open(self.path, 'r', encoding='UTF-8') as fp:
+                self._entries = json.load(fp)
+        except (OSError, ValueError):
+            logging.debug('RegistrationCache: Unable to load %s' % self.path)
+            self._entries = {}
+
+    def save(self):
+        """Write the cache to :attr:`path`"""
+
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+
+        if self.path is None:
+            return
+
+        # Write to a temporary file and then replace the cache so that a
+        # crash part way through does not leave a truncated file.
+        tmp_path = '%s.tmp' % self.path
+        with open(tmp_path, 'w', encoding='UTF-8') as fp:
+            json.dump(self._entries, fp)
+
+        os.replace(tmp_path, self.path)
+
+    def flush(self):
+        """Write any changes which are waiting to be saved to :attr:`path`
+        straight away."""
+
+        if self._save_handle is not None:
+            self.save()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _changed(self):
+        if self.path is None or self._save_handle is not None:
+            return
+
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        self._save_handle = self.loop.call_later(SAVE_DELAY, self.save)
+
+    def _key(self, target, signature):
+        return '%r %s' % (target, signature)
+
+
+def fingerprint(notifier):
+    """Return a digest of the parts of a notifier sent when registering."""
+
+    digest = hashlib.sha1()
+
+    def update(*values):
+        for value in values:
+            if isinstance(value, Icon):
+                # Avoid fetching the data for icons given by URL
+                if isinstance(value._data, (bytes, bytearray)):
+                    value = hashlib.sha1(value._data).hexdigest()
+                else:
+                    value = value.source
+
+            digest.update(repr(value).encode('UTF-8'))
+            digest.update(b'\0')
+
+    update(notifier.signature, notifier.name, notifier.icon, notifier.sound)
+
+    for class_id in sorted(notifier.notification_classes, key=str):
+        info = notifier.notification_classes[class_id]
+        update(class_id, *info)
+
+    return digest.hexdigest()
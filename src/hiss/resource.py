@@ -2,12 +2,32 @@
 #
 # Part of 'hiss' the asynchronous notification library
 
+import os
+import time
 import uuid
+import base64
+import asyncio
+import hashlib
+from collections import OrderedDict
 
 try:
-    from urllib.request import urlopen
+    from urllib.request import urlopen, Request, url2pathname
+    from urllib.error import HTTPError
+    from urllib.parse import urlparse
 except ImportError:
-    from urllib2 import urlopen
+    from urllib2 import urlopen, Request, HTTPError
+    from urllib import url2pathname
+    from urlparse import urlparse
+
+__all__ = ['Resource', 'Icon', 'ResourceCache', 'cache', 'prefetch']
+
+# Maximum number of bytes of resource data kept in the cache
+DEFAULT_CACHE_SIZE = 16 * 1024 * 1024
+
+# Number of seconds cached data is used before checking that the source
+# has not changed.
+DEFAULT_MAX_AGE = 300.0
+
 
 class Resource(object):
     def __init__(self, source='', data=None):
@@ -16,6 +36,9 @@ class Resource(object):
         Only one of :attr:`source` or :attr:`data` should be provided.
         If both used :attr:`data` will override :attr:`source`.
 
+        Data for a :attr:`source` is shared between resources using the
+        process wide :data:`cache`.
+
         :param source:   URI of the data.
         :type source:    string
         :param data:     Data to use
@@ -25,18 +48,93 @@ class Resource(object):
         self.uid = str(uuid.uuid4())
         self.source = source
         self._data = data
+        self._loaded = None
+        self._load_failed = False
+
+        # Encoded forms of the data and the data they were encoded from
+        self._encoded = {}
+        self._encoded_from = None
 
     @property
     def data(self):
-        if self._data is None:
-            if self.source[0] == '!':
-                self._data = self.source
-            else:
-                f = urlopen(self.source)
-                self._data = f.read(-1)
-                f.close()
+        """The resource data.
+
+        Handlers call :meth:`load` before a request is marshalled so the
+        source is only read here if the resource is used outside an event
+        loop. If :meth:`load` failed to read the source this is ``None`` so
+        that the request is sent without the resource.
+        """
+        if self._data is not None:
+            return self._data
+
+        if self.source[0] == '!':
+            return self.source
+
+        data = cache.get(self.source)
+        if data is None:
+            data = self._loaded
+
+        if data is None:
+            if self._load_failed:
+                return None
+
+            data = cache.fetch(self.source)
+
+        self._loaded = data
+        return data
+
+    @asyncio.coroutine
+    def load(self):
+        """Read the data from the source, or check that the cached data is
+        still current, without blocking the event loop."""
+
+        if self._data is None and self.source[:1] != '!':
+            try:
+                self._loaded = yield from cache.load(self.source)
+            except Exception:
+                self._load_failed = True
+                raise
+
+            self._load_failed = False
+
+        return self.data
+
+    def encoded(self, name, encoder):
+        """Return ``encoder(data)`` caching the result under ``name`` so that
+        the data is only encoded once however many requests it is sent in.
+
+        The cached forms are discarded when the data changes. ``None`` is
+        returned when there is no data.
+
+        :param name:    Name of the encoding e.g. ``'snp64'``
+        :type name:     str
+        :param encoder: Callable which encodes the data.
+        :type encoder:  callable
+        """
+        data = self.data
+        if data is None:
+            return None
+
+        if data is not self._encoded_from:
+            self._encoded = {}
+            self._encoded_from = data
+
+        value = self._encoded.get(name)
+        if value is None:
+            value = encoder(data)
+            self._encoded[name] = value
 
-        return self._data
+        return value
+
+    @property
+    def base64(self):
+        """The data encoded as base64 bytes"""
+        return self.encoded('base64', base64.b64encode)
+
+    @property
+    def hash(self):
+        """The SHA256 hex digest of the data"""
+        return self.encoded('hash', _sha256)
 
     def __len__(self):
         if self._data is not None:
@@ -49,3 +147,207 @@ class Resource(object):
 
 class Icon(Resource):
     pass
+
+
+class ResourceCache(object):
+    """Least recently used cache of resource data keyed by source URI.
+
+    Sources are read in the event loop's executor and concurrent loads of the
+    same source share a single read. Once the data is older than ``max_age``
+    it is revalidated using the ETag for HTTP sources or the modification
+    time for files.
+
+    :param max_bytes: Maximum number of bytes of data to keep.
+    :type max_bytes:  int
+    :param max_age:   Number of seconds before data is revalidated.
+    :type max_age:    float
+    :param loop:      :mod:`asyncio` event loop to use.
+    :type loop:       :class:`asyncio.BaseEventLoop`
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE, max_age=DEFAULT_MAX_AGE,
+                 loop=None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.loop = loop
+        self.size = 0
+        """The number of bytes of data in the cache"""
+
+        self._entries = OrderedDict()
+        self._pending = {}
+
+    def get(self, source):
+        """Return the cached data for ``source`` or ``None``"""
+
+        entry = self._entries.get(source)
+        if entry is None:
+            return None
+
+        self._entries.move_to_end(source)
+        return entry.data
+
+    def put(self, source, data, etag=None, mtime=None):
+        """Add data for ``source`` to the cache."""
+
+        self.discard(source)
+
+        size = len(data)
+        if size > self.max_bytes:
+            return
+
+        self._entries[source] = _CacheEntry(data, etag, mtime, time.monotonic())
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _source, entry = self._entries.popitem(last=False)
+            self.size -= len(entry.data)
+
+    def discard(self, source):
+        """Remove ``source`` from the cache."""
+
+        entry = self._entries.pop(source, None)
+        if entry is not None:
+            self.size -= len(entry.data)
+
+    @asyncio.coroutine
+    def load(self, source):
+        """Return the data for ``source`` reading it if it is not cached or
+        has changed."""
+
+        entry = self._entries.get(source)
+        if entry is not None and not self._expired(entry):
+            self._entries.move_to_end(source)
+            return entry.data
+
+        future = self._pending.get(source)
+        if future is None:
+            if self.loop is None:
+                self.loop = asyncio.get_event_loop()
+
+            future = asyncio.async(self._read(source, entry), loop=self.loop)
+            future.add_done_callback(lambda f: self._pending.pop(source, None))
+            self._pending[source] = future
+
+        # Shielded so that a cancelled caller does not cancel the read for
+        # the other callers waiting on it.
+        data = yield from asyncio.shield(future)
+        return data
+
+    def prefetch(self, sources):
+        """Start loading each of ``sources`` in the background.
+
+        :returns: :class:`asyncio.Future` which completes when all the sources
+                  have been loaded.
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        loads = [asyncio.async(self.load(source), loop=self.loop)
+                 for source in sources]
+        return asyncio.gather(*loads, return_exceptions=True)
+
+    def fetch(self, source):
+        """Return the data for ``source`` reading it in the calling thread if
+        it is not cached."""
+
+        entry = self._entries.get(source)
+        if entry is not None and not self._expired(entry):
+            self._entries.move_to_end(source)
+            return entry.data
+
+        return self._update(source, entry, _read_source(source, entry))
+
+    def __len__(self):
+        return len(self._entries)
+
+    @asyncio.coroutine
+    def _read(self, source, entry):
+        result = yield from self.loop.run_in_executor(None, _read_source,
+                                                      source, entry)
+        return self._update(source, entry, result)
+
+    def _update(self, source, entry, result):
+        if result is None:
+            # Unchanged since it was cached
+            entry.validated = time.monotonic()
+            if source not in self._entries:
+                self.put(source, entry.data, entry.etag, entry.mtime)
+
+            return entry.data
+
+        data, etag, mtime = result
+        self.put(source, data, etag, mtime)
+        return data
+
+    def _expired(self, entry):
+        return time.monotonic() - entry.validated > self.max_age
+
+
+class _CacheEntry(object):
+    __slots__ = ('data', 'etag', 'mtime', 'validated')
+
+    def __init__(self, data, etag, mtime, validated):
+        self.data = data
+        self.etag = etag
+        self.mtime = mtime
+        self.validated = validated
+
+
+def _read_source(source, entry):
+    """Read ``source`` returning a ``(data, etag, mtime)`` tuple or ``None``
+    if it has not changed since ``entry`` was cached."""
+
+    parsed = urlparse(source)
+    if parsed.scheme == 'file':
+        path = url2pathname(parsed.path)
+        mtime = os.stat(path).st_mtime
+        if entry is not None and entry.mtime == mtime:
+            return None
+
+        with open(path, 'rb') as fp:
+            return (fp.read(), None, mtime)
+
+    request = Request(source)
+    if entry is not None and entry.etag is not None:
+        request.add_header('If-None-Match', entry.etag)
+
+    try:
+        response = urlopen(request)
+    except HTTPError as exc:
+        if exc.code == 304 and entry is not None:
+            return None
+        raise
+
+    try:
+        data = response.read(-1)
+        etag = response.headers.get('ETag')
+    finally:
+        response.close()
+
+    return (data, etag, None)
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def prefetch(resources):
+    """Start loading the data for a list of resources or source URIs in the
+    background so that it is cached before it is needed.
+
+    :returns: :class:`asyncio.Future` which completes when all the sources
+              have been loaded.
+    """
+    sources = []
+    for resource in resources:
+        if isinstance(resource, Resource):
+            if resource._data is None and resource.source[:1] != '!':
+                sources.append(resource.source)
+        else:
+            sources.append(resource)
+
+    return cache.prefetch(sources)
+
+
+cache = ResourceCache()
+"""The process wide :class:`ResourceCache`"""
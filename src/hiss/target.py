@@ -79,6 +79,7 @@ class Target(object):
 
         self.handler = None
         self.protocol_version = ''
+        self._remote = None
 
     @property
     def address(self):
@@ -97,7 +98,13 @@ class Target(object):
     def is_remote(self):
         """Return True if host is on a remote machine."""
 
-        return self.host not in hiss.utility.local_hosts()
+        # The result is kept until the host or the set of local hosts changes
+        hosts = hiss.utility.local_hosts()
+        if self._remote is None or self._remote[0] is not hosts or \
+                self._remote[1] != self.host:
+            self._remote = (hosts, self.host, self.host not in hosts)
+
+        return self._remote[2]
 
     def __repr__(self):
         if self.scheme in hiss.schemes.URL_SCHEMES:
@@ -108,5 +115,14 @@ class Target(object):
     def __eq__(self, other):
         """Tests that 2 targets are equal ignoring the username/password."""
 
+        if not isinstance(other, Target):
+            return NotImplemented
+
         return (self.scheme, self.host, self.port) == \
                (other.scheme, other.host, other.port)
+
+    def __hash__(self):
+        # Handlers fill in the default port when they connect to a target so
+        # the port is left out of the hash to keep it stable. Targets which
+        # differ only by port still compare unequal.
+        return hash((self.scheme, self.host))
@@ -2,7 +2,9 @@
 #
 # Part of 'hiss' the asynchronous notification library
 
+import time
 import socket
+import asyncio
 import logging
 from datetime import datetime
 
@@ -12,7 +14,13 @@ DATETIME_FORMATS = ['%d %b %Y %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%m-%d-%Y %H:%M:%S
 __all__ = ['find_local_address', 'xpl_format_source', 'xap_format_source',
     'format_ip_address', 'indent_text', 'indent_print', 'find_open_port',
     'ip_to_int', 'int_to_ip', 'find_broadcast', 'netmask_valid', 'guess_broadcast',
-    'parse_datetime']
+    'parse_datetime', 'local_hosts', 'refresh_local_hosts',
+    'prime_local_hosts']
+
+# Number of seconds before the cached local host addresses are refreshed
+LOCAL_HOSTS_TTL = 300.0
+
+LOOPBACK_HOSTS = frozenset(['127.0.0.1', 'localhost'])
 
 def indent_text(text, indent=4):
     out = ''
@@ -31,9 +39,95 @@ def find_local_address():
     return socket.gethostbyname(socket.gethostname())
 
 def local_hosts():
-    local_hosts = ['127.0.0.1', 'localhost']
-    local_hosts.extend(socket.gethostbyname_ex(socket.gethostname())[2])
-    return local_hosts
+    """Return a frozenset of the host names and addresses of this machine.
+
+    The addresses are cached for :data:`LOCAL_HOSTS_TTL` seconds. When called
+    from a running event loop the DNS lookup is performed in the loop's
+    executor and the previous addresses, or only the loopback addresses if
+    there are none yet, are returned until it completes.
+    """
+    return _local_hosts.get()
+
+def refresh_local_hosts(loop=None):
+    """Look up the addresses of this machine in ``loop``'s executor.
+
+    :returns: :class:`asyncio.Future` which completes when the cache has been
+              updated.
+    """
+    return _local_hosts.refresh(loop)
+
+@asyncio.coroutine
+def prime_local_hosts(loop=None):
+    """Wait for the addresses of this machine to be looked up if they are not
+    known yet so that targets on this machine are not classified as remote
+    using only the loopback addresses."""
+
+    if _local_hosts.hosts is None:
+        yield from _local_hosts.refresh(loop)
+
+
+class _LocalHosts(object):
+    def __init__(self):
+        self.hosts = None
+        self.updated = 0
+        self._refreshing = None
+
+    def get(self):
+        if self.hosts is None or \
+                time.monotonic() - self.updated > LOCAL_HOSTS_TTL:
+            loop = _running_loop()
+            if loop is None:
+                self._update(self._lookup())
+            else:
+                self.refresh(loop)
+
+        if self.hosts is None:
+            return LOOPBACK_HOSTS
+        else:
+            return self.hosts
+
+    def refresh(self, loop=None):
+        if self._refreshing is None:
+            if loop is None:
+                loop = asyncio.get_event_loop()
+
+            self._refreshing = loop.run_in_executor(None, self._lookup)
+            self._refreshing.add_done_callback(self._refreshed)
+
+        return self._refreshing
+
+    def _refreshed(self, future):
+        self._refreshing = None
+        if not future.cancelled() and future.exception() is None:
+            self._update(future.result())
+
+    def _update(self, hosts):
+        self.hosts = hosts
+        self.updated = time.monotonic()
+
+    def _lookup(self):
+        hosts = set(LOOPBACK_HOSTS)
+        try:
+            hosts.update(socket.gethostbyname_ex(socket.gethostname())[2])
+        except OSError:
+            logging.debug('local_hosts: Unable to look up local addresses')
+
+        return frozenset(hosts)
+
+
+def _running_loop():
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        return None
+
+    if loop.is_running():
+        return loop
+    else:
+        return None
+
+
+_local_hosts = _LocalHosts()
 
 def find_open_port(from_port, interface='0.0.0.0'):
     UDPSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+
+import pytest
+
+from hiss.target import Target
+from hiss.exception import MarshalError
+from hiss.handler.aio import AIOHandler
+from hiss.handler.pool import ConnectionPool
+
+
+class FakeProtocol(object):
+    def __init__(self, target):
+        self.target = target
+        self.is_connected = True
+        self.reusable = True
+        self.connection_lost_handler = None
+
+    def close(self):
+        self.is_connected = False
+
+    def lose_connection(self):
+        self.is_connected = False
+        if self.connection_lost_handler is not None:
+            self.connection_lost_handler(self)
+
+
+@pytest.fixture
+def connections():
+    return []
+
+
+@pytest.fixture
+def pool(connections):
+    @asyncio.coroutine
+    def connect(target):
+        protocol = FakeProtocol(target)
+        connections.append(protocol)
+        return protocol
+
+    return ConnectionPool(connect, max_idle=2,
+                          loop=asyncio.get_event_loop())
+
+
+def test_ConnectionPool_Reuse(pool, connections):
+    loop = asyncio.get_event_loop()
+    target = Target('snp://192.168.1.1')
+
+    p1 = loop.run_until_complete(pool.acquire(target))
+    pool.release(p1)
+    p2 = loop.run_until_complete(pool.acquire(Target('snp://192.168.1.1')))
+
+    assert p1 is p2
+    assert len(connections) == 1
+
+
+def test_ConnectionPool_KeyedByAddress(pool, connections):
+    loop = asyncio.get_event_loop()
+
+    p1 = loop.run_until_complete(pool.acquire(Target('snp://192.168.1.1')))
+    pool.release(p1)
+    p2 = loop.run_until_complete(pool.acquire(Target('snp://192.168.1.2')))
+
+    assert p1 is not p2
+    assert len(connections) == 2
+
+
+def test_ConnectionPool_UnhealthyNotReused(pool, connections):
+    loop = asyncio.get_event_loop()
+    target = Target('snp://192.168.1.1')
+
+    p1 = loop.run_until_complete(pool.acquire(target))
+    pool.release(p1)
+    p1.lose_connection()
+    assert len(pool) == 0
+
+    p2 = loop.run_until_complete(pool.acquire(target))
+    assert p1 is not p2
+
+
+def test_ConnectionPool_MaxIdle(pool, connections):
+    loop = asyncio.get_event_loop()
+    target = Target('snp://192.168.1.1')
+
+    protocols = [loop.run_until_complete(pool.connect(target))
+                 for _ in range(3)]
+    for p in protocols:
+        pool.release(p)
+
+    assert len(pool) == 2
+    assert not protocols[2].is_connected
+
+
+def test_ConnectionPool_Evict(pool, connections):
+    loop = asyncio.get_event_loop()
+    target = Target('snp://192.168.1.1')
+    pool.idle_timeout = 0
+
+    p1 = loop.run_until_complete(pool.acquire(target))
+    pool.release(p1)
+    pool.evict()
+
+    assert len(pool) == 0
+    assert not p1.is_connected
+    pool.close()
+
+
+class FailingHandler(AIOHandler):
+    __name__ = 'Failing'
+
+    def __init__(self, connections, errors):
+        super().__init__(loop=asyncio.get_event_loop())
+        self.port = 0
+        self.connections = connections
+        self.errors = errors
+        self.use_pool()
+
+    @asyncio.coroutine
+    def connect(self, target, factory=None):
+        protocol = FakeProtocol(target)
+        protocol.notify = self.notify_failing
+        self.connections.append(protocol)
+        return protocol
+
+    @asyncio.coroutine
+    def notify_failing(self, *args):
+        raise self.errors.pop(0)
+
+
+def test_AIOHandler_FailedRequestClosed(connections):
+    loop = asyncio.get_event_loop()
+    handler = FailingHandler(connections, [MarshalError('Invalid')])
+    target = Target('snp://127.0.0.1')
+
+    with pytest.raises(MarshalError):
+        loop.run_until_complete(handler._send(target, 'notify'))
+
+    assert not connections[0].is_connected
+    assert len(handler.pool) == 0
+
+
+def test_AIOHandler_RetryFails(connections):
+    loop = asyncio.get_event_loop()
+    handler = FailingHandler(connections, [ConnectionError('Lost'),
+                                           ConnectionError('Lost')])
+    target = Target('snp://127.0.0.1')
+
+    response = loop.run_until_complete(handler._send(target, 'notify'))
+    assert response['status'] == 'ERROR'
+    assert len(connections) == 2
+    assert not any(p.is_connected for p in connections)
+    assert len(handler.pool) == 0
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from hiss.notifier import Notifier
+from hiss.dedupe import Deduplicator
+
+
+@pytest.fixture
+def notifier():
+    n = Notifier('A Notifier', '0b57469a-c9dd-451b-8d86-f82ce11ad09f')
+    n.add_notification('Disk', 'Disk full')
+    n.add_notification('Other', 'Something else')
+    return n
+
+
+def test_Deduplicator_DropsRepeats(notifier):
+    d = Deduplicator(window=60)
+
+    batch = [notifier.create_notification(name='Disk') for _ in range(5)]
+    batch.append(notifier.create_notification(name='Other'))
+
+    accepted = d.filter(batch)
+    assert len(accepted) == 2
+    assert d.repeats(batch[0]) == 4
+
+    assert d.filter([notifier.create_notification(name='Disk')]) == []
+
+
+def test_Deduplicator_Annotate(notifier, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('hiss.dedupe.time.monotonic', lambda: now[0])
+    d = Deduplicator(window=60, annotate=True)
+
+    batch = [notifier.create_notification(name='Disk') for _ in range(3)]
+    d.filter(batch)
+
+    now[0] += 61
+    accepted = d.filter([notifier.create_notification(name='Disk')])
+    assert len(accepted) == 1
+    assert accepted[0].title == 'Disk full (×3)'
+    assert batch[0].title == 'Disk full'
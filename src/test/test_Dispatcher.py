@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+from functools import partial
+
+from hiss.target import Target
+from hiss.dispatch import Dispatcher
+from hiss.notification import NotificationPriority
+
+
+class Counter(object):
+    def __init__(self):
+        self.created = 0
+        self.running = 0
+        self.max_running = 0
+
+    @asyncio.coroutine
+    def job(self, value):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        yield from asyncio.sleep(0.001)
+        self.running -= 1
+        return value
+
+    def jobs(self, targets, count, priority=NotificationPriority.normal):
+        for idx in range(count):
+            self.created += 1
+            yield (targets[idx % len(targets)], partial(self.job, idx),
+                   priority)
+
+
+def test_Dispatcher_Limit():
+    loop = asyncio.get_event_loop()
+    counter = Counter()
+    targets = [Target('snp://192.168.1.%d' % idx) for idx in range(1, 11)]
+
+    d = Dispatcher(limit=5, target_limit=None)
+    results = loop.run_until_complete(d.run(counter.jobs(targets, 100)))
+
+    assert sorted(results) == list(range(100))
+    assert counter.max_running == 5
+
+
+def test_Dispatcher_TargetLimit():
+    loop = asyncio.get_event_loop()
+    counter = Counter()
+    targets = [Target('snp://192.168.1.1')]
+
+    d = Dispatcher(limit=10, target_limit=2)
+    results = loop.run_until_complete(d.run(counter.jobs(targets, 20)))
+
+    assert len(results) == 20
+    assert counter.max_running == 2
+
+
+def test_Dispatcher_SchemeLimit():
+    loop = asyncio.get_event_loop()
+    counter = Counter()
+    targets = [Target('gntp://192.168.1.%d' % idx) for idx in range(1, 11)]
+
+    d = Dispatcher(limit=10, target_limit=None, scheme_limits={'gntp': 3})
+    results = loop.run_until_complete(d.run(counter.jobs(targets, 30)))
+
+    assert len(results) == 30
+    assert counter.max_running == 3
+
+
+def test_Dispatcher_Lazy():
+    loop = asyncio.get_event_loop()
+    counter = Counter()
+    targets = [Target('snp://192.168.1.1')]
+    seen = []
+
+    def result_handler(result):
+        seen.append(result)
+        assert counter.created <= len(seen) + 2 * d.limit
+
+    d = Dispatcher(limit=2, target_limit=None)
+    loop.run_until_complete(d.run(counter.jobs(targets, 50), result_handler))
+    assert len(seen) == 50
+
+
+def test_Dispatcher_Priority():
+    loop = asyncio.get_event_loop()
+    counter = Counter()
+    targets = [Target('snp://192.168.1.1')]
+    order = []
+
+    d = Dispatcher(limit=1, target_limit=None)
+
+    @asyncio.coroutine
+    def coro():
+        low = asyncio.async(d.run(counter.jobs(targets, 10,
+                                               NotificationPriority.very_low),
+                                  order.append))
+        yield from asyncio.sleep(0)
+
+        jobs = [(targets[0], partial(counter.job, 'emergency'),
+                 NotificationPriority.emergency)]
+        yield from d.run(jobs, order.append)
+        yield from low
+
+    loop.run_until_complete(coro())
+    assert order.index('emergency') <= 1
+
+
+def test_Dispatcher_Starvation():
+    loop = asyncio.get_event_loop()
+    targets = [Target('snp://192.168.1.1')]
+
+    @asyncio.coroutine
+    def coro(d, order):
+        counter = Counter()
+        low = asyncio.async(d.run(counter.jobs(targets, 3,
+                                               NotificationPriority.very_low),
+                                  order.append))
+        yield from asyncio.sleep(0)
+
+        jobs = [(targets[0], partial(counter.job, 'high'),
+                 NotificationPriority.high)]
+        yield from d.run(jobs, order.append)
+        yield from low
+
+    order = []
+    d = Dispatcher(limit=2, target_limit=1, starvation_timeout=60)
+    loop.run_until_complete(coro(d, order))
+    assert order == [0, 'high', 1, 2]
+
+    order = []
+    d = Dispatcher(limit=2, target_limit=1, starvation_timeout=0)
+    loop.run_until_complete(coro(d, order))
+    assert order == [0, 1, 'high', 2]
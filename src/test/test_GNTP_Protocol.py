@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import re
+import asyncio
+
+import pytest
+
+from hiss.target import Target
+from hiss.resource import Icon
+from hiss.notifier import Notifier
+from hiss.registration import RegistrationCache
+from hiss.handler.gntp.async import (GNTPHandler, GNTPProtocol,
+                                     DeliveredResources)
+from hiss.handler.gntp.message import Request
+
+OK_RESPONSE = (b'GNTP/1.0 -OK NONE\r\n'
+               b'Response-Action: NOTIFY\r\n'
+               b'Notification-ID: %s\r\n'
+               b'X-Timestamp: 2014-06-01 10:00:00Z\r\n'
+               b'\r\n')
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def writelines(self, segments):
+        self.write(b''.join(segments))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def protocol():
+    p = GNTPProtocol()
+    p.connection_made(FakeTransport())
+    p.target = Target('gntp://127.0.0.1')
+    return p
+
+
+def notify_request(nid):
+    request = Request()
+    request.command = 'NOTIFY'
+    request.body['Notification-ID'] = nid
+    return request
+
+
+def test_GNTP_Protocol_ResponseByNotificationID(protocol):
+    loop = asyncio.get_event_loop()
+
+    first = protocol.send_request(notify_request('1'), protocol.target)
+    second = protocol.send_request(notify_request('2'), protocol.target)
+
+    protocol.data_received(OK_RESPONSE % b'2')
+    assert second.done()
+    assert not first.done()
+
+    protocol.data_received(OK_RESPONSE % b'1')
+    assert first.done()
+
+    result = loop.run_until_complete(first)
+    assert result['status'] == 'OK'
+
+
+def test_GNTP_Protocol_ResponseWithoutID(protocol):
+    notify = protocol.send_request(notify_request('1'), protocol.target)
+
+    register = Request()
+    register.command = 'REGISTER'
+    register = protocol.send_request(register, protocol.target)
+
+    protocol.data_received(b'GNTP/1.0 -OK NONE\r\n'
+                           b'Response-Action: REGISTER\r\n'
+                           b'X-Timestamp: 2014-06-01 10:00:00Z\r\n\r\n')
+    assert register.done()
+    assert register.result()['command'] == 'register'
+    assert not notify.done()
+    assert protocol.in_flight == 1
+
+
+ERROR_RESPONSE = (b'GNTP/1.0 -ERROR NONE\r\n'
+                  b'Response-Action: NOTIFY\r\n'
+                  b'Error-Code: 402\r\n'
+                  b'Error-Description: Unknown notification\r\n'
+                  b'\r\n')
+
+
+def test_GNTP_Protocol_ErrorWithoutID(protocol):
+    loop = asyncio.get_event_loop()
+
+    register = Request()
+    register.command = 'REGISTER'
+    register = protocol.send_request(register, protocol.target)
+    notify = protocol.send_request(notify_request('1'), protocol.target)
+
+    protocol.data_received(ERROR_RESPONSE)
+    assert notify.done()
+    assert not register.done()
+
+    result = loop.run_until_complete(notify)
+    assert result['status'] == 'ERROR'
+    assert result['status_code'] == 402
+
+
+def test_GNTP_Protocol_ResponseTimeout(protocol):
+    loop = asyncio.get_event_loop()
+    protocol.response_timeout = 0.01
+
+    waiter = protocol.send_request(notify_request('1'), protocol.target)
+    with pytest.raises(asyncio.TimeoutError):
+        loop.run_until_complete(waiter)
+
+    assert protocol.in_flight == 0
+
+
+def test_GNTP_Protocol_PendingCallbacksBounded(protocol, monkeypatch):
+    module = sys.modules[GNTPProtocol.__module__]
+    monkeypatch.setattr(module, 'MAX_PENDING_CALLBACKS', 2)
+    notifier = Notifier('A Notifier', '0b57469a-c9dd-451b-8d86-f82ce11ad09f')
+    notifier.add_notification('New', 'New email received.')
+
+    for _idx in range(3):
+        notification = notifier.create_notification(name='New', title='Title')
+        notification.callback = 'http://localhost/'
+        asyncio.async(protocol.notify(notification, notifier))
+
+    asyncio.get_event_loop().run_until_complete(asyncio.sleep(0))
+    assert len(protocol._callback_notifiers) == 2
+
+
+def test_GNTP_Protocol_InvalidResponse(protocol):
+    waiter = protocol.send_request(notify_request('1'), protocol.target)
+
+    protocol.data_received(b'GNTP/1.0 -OK NONE\r\nInvalid\r\n\r\n')
+    assert protocol._transport.closed
+    assert len(protocol._parser) == 0
+    assert not waiter.done()
+
+
+def test_GNTP_Protocol_ConnectionLost(protocol):
+    loop = asyncio.get_event_loop()
+
+    waiter = protocol.send_request(notify_request('1'), protocol.target)
+    protocol.connection_lost(None)
+
+    with pytest.raises(ConnectionError):
+        loop.run_until_complete(waiter)
+
+
+CALLBACK_RESPONSE = (b'GNTP/1.0 -CALLBACK NONE\r\n'
+                     b'Response-Action: NOTIFY\r\n'
+                     b'Notification-ID: %s\r\n'
+                     b'Notification-Callback-Result: CLICKED\r\n'
+                     b'Notification-Callback-Timestamp: 2014-06-01 10:00:05Z\r\n'
+                     b'\r\n')
+
+
+def test_GNTP_Protocol_PipelinedResponses(protocol):
+    first = protocol.send_request(notify_request('1'), protocol.target)
+    second = protocol.send_request(notify_request('2'), protocol.target)
+    assert len(protocol._transport.written) == 2
+    assert protocol.in_flight == 2
+
+    protocol.data_received((OK_RESPONSE % b'2') + (OK_RESPONSE % b'1')[:20])
+    assert second.done()
+    assert not first.done()
+
+    protocol.data_received((OK_RESPONSE % b'1')[20:])
+    assert first.done()
+    assert protocol.in_flight == 0
+
+
+def test_GNTP_Protocol_CallbackDemultiplexed(protocol):
+    loop = asyncio.get_event_loop()
+    events = []
+
+    @asyncio.coroutine
+    def events_received(received):
+        events.extend(received)
+
+    notifier = Notifier('GNTP Notifier', 'application/x-vnd.sffjunkie.hiss',
+                        handlers=(None, events_received))
+    notifier.add_notification('New', 'New email received.')
+    notification = notifier.create_notification(name='New')
+    notification.add_callback('http://www.google.com')
+
+    protocol.pipelined = True
+    task = asyncio.async(protocol.notify(notification, notifier))
+    loop.run_until_complete(asyncio.sleep(0))
+    nid = notification.uid.encode('UTF-8')
+
+    protocol.data_received(OK_RESPONSE % nid)
+    result = loop.run_until_complete(task)
+    assert 'callback' not in result
+    assert protocol.reusable
+
+    protocol.data_received(CALLBACK_RESPONSE % nid)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert len(events) == 1
+    assert events[0]['nid'] == notification.uid
+    assert events[0]['status'] == 'CLICKED'
+
+
+def test_GNTP_Handler_Pipelining():
+    loop = asyncio.get_event_loop()
+    connections = []
+
+    class RespondingTransport(FakeTransport):
+        def write(self, data):
+            super().write(data)
+            nid = re.search(b'Notification-ID: (.*)\r\n', data).group(1)
+            loop.call_soon(self.protocol.data_received, OK_RESPONSE % nid)
+
+    @asyncio.coroutine
+    def connect(target, factory=None):
+        p = GNTPProtocol()
+        p.connection_made(RespondingTransport())
+        p._transport.protocol = p
+        p.target = target
+        connections.append(p)
+        return p
+
+    notifier = Notifier('GNTP Notifier', 'application/x-vnd.sffjunkie.hiss')
+    notifier.add_notification('New', 'New email received.')
+    h = GNTPHandler(loop=loop)
+    h.use_pipelining(depth=8)
+    h.connect = connect
+
+    target = Target('gntp://127.0.0.1')
+    notifications = [notifier.create_notification(name='New')
+                     for _idx in range(4)]
+    for n in notifications:
+        n.notifier = notifier
+
+    tasks = [h.notify(n, target) for n in notifications]
+    results = loop.run_until_complete(asyncio.gather(*tasks))
+
+    assert len(connections) == 1
+    assert len(connections[0]._transport.written) == 4
+    assert all(r['status'] == 'OK' for r in results)
+
+
+def test_GNTP_Protocol_DeliveredResources(protocol):
+    loop = asyncio.get_event_loop()
+    protocol.delivered_resources = DeliveredResources()
+
+    notifier = Notifier('GNTP Notifier', 'application/x-vnd.sffjunkie.hiss')
+    notifier.add_notification('New', 'New email received.',
+                              icon=Icon(data=b'\x89PNG' * 16))
+
+    for expected in (1, 0):
+        notification = notifier.create_notification(name='New')
+        task = asyncio.async(protocol.notify(notification, notifier))
+        loop.run_until_complete(asyncio.sleep(0))
+
+        sent = protocol._transport.written[-1]
+        assert sent.count(b'Identifier:') == expected
+
+        nid = notification.uid.encode('UTF-8')
+        protocol.data_received(OK_RESPONSE % nid)
+        loop.run_until_complete(task)
+
+
+def test_GNTP_Handler_ReregisterOnUnknownNotification():
+    loop = asyncio.get_event_loop()
+    requests = []
+
+    class GrowlTransport(FakeTransport):
+        """Replies as Growl does after it has been restarted and has
+        forgotten the registration."""
+
+        registered = False
+
+        def write(self, data):
+            super().write(data)
+            command = data.split(b'\r\n', 1)[0].split()[1]
+            requests.append(command)
+
+            if command == b'REGISTER':
+                GrowlTransport.registered = True
+                reply = (b'GNTP/1.0 -OK NONE\r\n'
+                         b'Response-Action: REGISTER\r\n\r\n')
+            elif GrowlTransport.registered:
+                nid = re.search(b'Notification-ID: (.*)\r\n', data).group(1)
+                reply = OK_RESPONSE % nid
+            else:
+                reply = ERROR_RESPONSE
+
+            loop.call_soon(self.protocol.data_received, reply)
+
+    @asyncio.coroutine
+    def connect(target, factory=None):
+        p = GNTPProtocol()
+        p.connection_made(GrowlTransport())
+        p._transport.protocol = p
+        p.target = target
+        return p
+
+    h = GNTPHandler(loop=loop)
+    h.connect = connect
+    h.use_pool()
+
+    target = Target('gntp://127.0.0.1')
+    target.handler = h
+
+    notifier = Notifier('GNTP Notifier', 'application/x-vnd.sffjunkie.hiss',
+                        registration_cache=RegistrationCache())
+    notifier.add_notification('New', 'New email received.')
+    notifier.targets.append(target)
+
+    # The cache says the notifier is registered but Growl has forgotten it
+    notifier.registration_cache.record(target, notifier)
+
+    notification = notifier.create_notification(name='New')
+    response = loop.run_until_complete(notifier.notify(notification))
+
+    assert response['status'] == 'OK'
+    assert requests == [b'NOTIFY', b'REGISTER', b'NOTIFY']
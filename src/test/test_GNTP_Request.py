@@ -9,6 +9,7 @@ sys.path.insert(0,
                 os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from hiss.hash import generate_hash
+from hiss.resource import Icon
 from hiss.handler.gntp.message import Request
 
 
@@ -91,3 +92,33 @@ def test_GNTPRequest_Unmarshal_WithHash():
 	assert r.version == '1.0'
 	assert r.command == 'REGISTER'
 	assert r._hash == hash_
+
+
+def test_GNTPRequest_MarshalSegments():
+	data = b'\x89PNG' * 1024
+
+	r = Request()
+	r.command = 'NOTIFY'
+	r.body['Notification-Icon'] = 'x-growl-resource://abcd'
+	r.identifiers.append({'Identifier': 'abcd', 'Data': data})
+
+	segments = r.marshal_segments()
+	views = [s for s in segments if isinstance(s, memoryview)]
+	assert len(views) == 1
+	assert views[0].obj is data
+	assert b''.join(segments) == r.marshal()
+
+
+def test_GNTPRequest_ResourceIdentifiers():
+	first = Icon(data=b'\x89PNG' * 16)
+	second = Icon(data=b'\x89PNG' * 16)
+
+	r = Request()
+	r._add_resource('Application-Icon', first)
+	r._add_resource('Notification-Icon', second)
+
+	assert r.body['Application-Icon'] == r.body['Notification-Icon']
+	assert len(r.identifiers) == 1
+
+	r.omit_identifiers = frozenset([r.identifiers[0]['Identifier']])
+	assert b'Identifier:' not in r.marshal()
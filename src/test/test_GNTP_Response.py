@@ -8,7 +8,12 @@ import sys
 sys.path.insert(0,
                 os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from hiss.handler.gntp.message import Response
+from datetime import datetime
+
+import pytest
+
+from hiss.exception import MarshalError
+from hiss.handler.gntp.message import Response, ResponseParser
 
 
 def test_GNTPResponse_Create():
@@ -34,3 +39,68 @@ def test_GNTPResponse_Unmarshal():
 
     assert r.status == 'OK'
     assert r.command == 'register'
+
+
+def test_GNTPResponseParser_Partial():
+    msg = (b'GNTP/1.0 -OK NONE\r\nResponse-Action: REGISTER\r\n'
+           b'Origin-Machine-Name: OURAGAN\r\n\r\n')
+
+    parser = ResponseParser()
+    responses = []
+    for idx in range(len(msg)):
+        responses.extend(parser.feed(msg[idx:idx + 1]))
+        if idx < len(msg) - 1:
+            assert responses == []
+
+    assert len(responses) == 1
+    assert responses[0].command == 'register'
+    assert len(parser) == 0
+
+
+def test_GNTPResponseParser_BackToBack():
+    msg = (b'GNTP/1.0 -OK NONE\r\nResponse-Action: NOTIFY\r\n'
+           b'Notification-ID: 1\r\n\r\n'
+           b'GNTP/1.0 -CALLBACK NONE\r\nResponse-Action: NOTIFY\r\n'
+           b'Notification-ID: 1\r\n'
+           b'Notification-Callback-Result: CLICKED\r\n\r\n'
+           b'GNTP/1.0 -OK NONE\r\nResponse-Action: NOTIFY\r\n')
+
+    parser = ResponseParser()
+    responses = parser.feed(msg[:40])
+    responses.extend(parser.feed(msg[40:]))
+
+    assert [r.status for r in responses] == ['OK', 'CALLBACK']
+    assert len(parser) == len(b'GNTP/1.0 -OK NONE\r\n'
+                              b'Response-Action: NOTIFY\r\n')
+
+    responses = parser.feed(b'Notification-ID: 2\r\n\r\n')
+    assert len(responses) == 1
+    assert responses[0].nid == '2'
+    assert len(parser) == 0
+
+
+def test_GNTPResponse_UnmarshalLazy():
+    r = Response()
+    msg = (b'GNTP/1.0 -ERROR NONE\r\nResponse-Action: NOTIFY\r\n'
+           b'Error-Code: 303\r\nError-Description: Unknown notification\r\n'
+           b'X-Timestamp: 2014-03-01 12:30:45Z\r\n'
+           b'X-Extra: 1\r\nX-Extra: 2\r\n')
+    r.unmarshal(msg)
+
+    assert 'reason' not in r.__dict__
+    assert r.status == 'ERROR'
+    assert r.status_code == 303
+    assert r.reason == 'Unknown notification'
+    assert r.timestamp == datetime(2014, 3, 1, 12, 30, 45)
+    assert r.body == {'X-Extra': ['1', '2']}
+    assert not hasattr(r, 'nid')
+
+
+def test_GNTPResponseParser_Invalid():
+    parser = ResponseParser()
+    with pytest.raises(MarshalError):
+        parser.feed(b'GNTP/1.0 -OK NONE\r\nInvalid\r\n\r\nGNTP/1.0 -OK')
+
+    assert len(parser) == len(b'GNTP/1.0 -OK')
+    responses = parser.feed(b' NONE\r\nResponse-Action: NOTIFY\r\n\r\n')
+    assert [r.command for r in responses] == ['notify']
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import asyncio
+
+import pytest
+
+from hiss.target import Target
+from hiss.notifier import Notifier
+from hiss.handler.kodi import KodiHandler, KodiProtocol
+from hiss.handler.kodi.jsonrpc.message import (RPCBatch, RPCRequest,
+                                               RPCResponse, RPCRequestError)
+
+
+@pytest.fixture
+def notifier():
+    n = Notifier('Kodi Notifier', '0b57469a-c9dd-451b-8d86-f82ce11ad09f')
+    n.add_notification('New', 'New email received.')
+    return n
+
+
+def results_for(data, status='OK'):
+    requests = json.loads(data.decode('UTF-8'))
+    return [{'jsonrpc': '2.0', 'id': r['id'], 'result': status}
+            for r in requests]
+
+
+def test_RPCBatch_Marshal():
+    requests = [RPCRequest('JSONRPC.Ping'),
+                RPCRequest('GUI.ShowNotification', notification=True)]
+    batch = RPCBatch(requests)
+
+    data = json.loads(batch.marshal().decode('UTF-8'))
+    assert [r['method'] for r in data] == ['JSONRPC.Ping',
+                                           'GUI.ShowNotification']
+    assert data[0]['id'] == requests[0].uid
+    assert 'id' not in data[1]
+
+
+def test_RPCBatch_Unmarshal():
+    requests = [RPCRequest('JSONRPC.Ping') for _idx in range(3)]
+    batch = RPCBatch(requests)
+
+    data = [
+        {'jsonrpc': '2.0', 'id': requests[2].uid, 'result': 'pong 2'},
+        {'jsonrpc': '2.0', 'id': requests[0].uid,
+         'error': {'code': -32601, 'message': 'Method not found.'}},
+    ]
+    responses = batch.unmarshal(json.dumps(data).encode('UTF-8'))
+
+    assert isinstance(responses[0], RPCRequestError)
+    assert responses[0].code == -32601
+    assert responses[1] is None
+    assert isinstance(responses[2], RPCResponse)
+    assert responses[2].result == 'pong 2'
+
+
+def test_Kodi_NotifyBatch(notifier, monkeypatch):
+    loop = asyncio.get_event_loop()
+    posts = []
+
+    notifications = [notifier.create_notification(name='New', title='Title')
+                     for _idx in range(3)]
+    failing = notifications[1].uid
+
+    @asyncio.coroutine
+    def post(self, data, target):
+        posts.append(data)
+        results = results_for(data)
+        for result in results:
+            if result['id'] == failing:
+                result['result'] = 'Failed'
+        return 'OK', json.dumps(results).encode('UTF-8')
+
+    monkeypatch.setattr(KodiProtocol, '_post', post)
+
+    handler = KodiHandler(loop=loop)
+    handler.use_batching(window=0.01, size=8)
+    target = Target('kodi://127.0.0.1')
+    tasks = [handler.notify(n, target) for n in notifications]
+    results = loop.run_until_complete(asyncio.gather(*tasks))
+
+    assert len(posts) == 1
+    statuses = dict((n.uid, r['status'])
+                    for n, r in zip(notifications, results))
+    assert statuses == {notifications[0].uid: 'OK',
+                        failing: 'Failed',
+                        notifications[2].uid: 'OK'}
+    assert all(r['handler'] == 'Kodi' for r in results)
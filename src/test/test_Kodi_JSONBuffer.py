@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+
+from hiss.handler.kodi.jsonrpc.buffer import JSONBuffer
+
+MESSAGES = [
+    b'{"jsonrpc":"2.0","method":"Player.OnPlay","params":{"data":{"item":{"id":1,"type":"song"},"player":{"playerid":0,"speed":1}},"sender":"xbmc"}}',
+    b'{"id":"1","jsonrpc":"2.0","result":"OK"}',
+    '{"jsonrpc":"2.0","method":"GUI.OnScreensaverActivated","params":{"data":{"title":"Café {\\"q\\"} }"},"sender":"xbmc"}}'.encode('UTF-8'),
+]
+
+
+DECODED = [json.loads(m.decode('UTF-8')) for m in MESSAGES]
+
+
+def test_JSONBuffer_Whole():
+    b = JSONBuffer()
+    b.append(b'\n'.join(MESSAGES))
+
+    assert b.messages == DECODED
+    assert len(b) == 0
+
+
+def test_JSONBuffer_ByteByByte():
+    data = b''.join(MESSAGES)
+
+    b = JSONBuffer()
+    for idx in range(len(data)):
+        b.append(data[idx:idx + 1])
+
+    assert b.messages == DECODED
+    assert b.messages[2]['params']['data']['title'] == 'Café {"q"} }'
+
+
+def test_JSONBuffer_Partial():
+    b = JSONBuffer()
+    b.append(MESSAGES[0] + MESSAGES[1][:10])
+    assert b.messages == DECODED[:1]
+    assert len(b) == 10
+
+    b.append(MESSAGES[1][10:].decode('UTF-8'))
+    assert b.messages == DECODED[:2]
+    assert len(b) == 0
+
+
+def test_JSONBuffer_Invalid():
+    b = JSONBuffer()
+    b.append(b'{"id": 1, "result": ]}{"id": 2, "res')
+    b.append(b'ult": "OK"}')
+
+    assert b.messages == [{'id': 2, 'result': 'OK'}]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import asyncio
+
+import pytest
+
+from hiss.handler.kodi.jsonrpc.client import RPCClient
+from hiss.handler.kodi.jsonrpc.message import RPCRequest
+
+
+class FakeTransport(object):
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.written = []
+
+    def write(self, data):
+        self.written.append(json.loads(data.decode('UTF-8')))
+
+    def close(self):
+        self.protocol.connection_lost(None)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    loop = asyncio.get_event_loop()
+    c = RPCClient('127.0.0.1', port=9090, method='tcp')
+    c.connections = []
+
+    @asyncio.coroutine
+    def create_connection(factory, host, port):
+        protocol = factory()
+        transport = FakeTransport(protocol)
+        protocol.connection_made(transport)
+        c.connections.append(transport)
+        return transport, protocol
+
+    monkeypatch.setattr(loop, 'create_connection', create_connection)
+    return c
+
+
+def respond(protocol, uid, result):
+    data = json.dumps({'jsonrpc': '2.0', 'id': uid, 'result': result})
+    protocol.data_received(data.encode('UTF-8'))
+
+
+def test_RPCClient_Multiplexed(client):
+    loop = asyncio.get_event_loop()
+
+    requests = [RPCRequest('JSONRPC.Ping') for _idx in range(3)]
+    tasks = [asyncio.async(client.request(r)) for r in requests]
+    loop.run_until_complete(asyncio.sleep(0.01))
+
+    assert len(client.connections) == 1
+    transport = client.connections[0]
+    assert [m['id'] for m in transport.written] == [r.uid for r in requests]
+
+    protocol = transport.protocol
+    assert protocol.in_flight == 3
+    for request in reversed(requests):
+        respond(protocol, request.uid, 'pong %s' % request.uid)
+
+    responses = loop.run_until_complete(asyncio.gather(*tasks))
+    assert [r.result for r in responses] == \
+        ['pong %s' % r.uid for r in requests]
+    assert protocol.in_flight == 0
+
+
+def test_RPCClient_Notification(client):
+    loop = asyncio.get_event_loop()
+    notifications = []
+
+    @asyncio.coroutine
+    def handler(notification):
+        notifications.append(notification)
+
+    client.notification_handler = handler
+    protocol = loop.run_until_complete(client.connect())
+    protocol.data_received(b'{"jsonrpc":"2.0","method":"Player.OnPlay",'
+                           b'"params":{"sender":"xbmc"}}')
+    loop.run_until_complete(asyncio.sleep(0))
+
+    assert [n.method for n in notifications] == ['Player.OnPlay']
+    client.close()
+
+
+def test_RPCClient_ConnectionLost(client):
+    loop = asyncio.get_event_loop()
+
+    task = asyncio.async(client.request(RPCRequest('JSONRPC.Ping')))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    client.connections[0].close()
+
+    with pytest.raises(ConnectionError):
+        loop.run_until_complete(task)
+
+    request = RPCRequest('JSONRPC.Ping')
+    task = asyncio.async(client.request(request))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    assert len(client.connections) == 2
+
+    respond(client.connections[1].protocol, request.uid, 'pong')
+    assert loop.run_until_complete(task).result == 'pong'
+
+
+def test_RPCClient_Batch(client):
+    loop = asyncio.get_event_loop()
+
+    requests = [RPCRequest('JSONRPC.Ping') for _idx in range(2)]
+    requests.append(RPCRequest('GUI.ShowNotification', notification=True))
+    task = asyncio.async(client.batch(requests))
+    loop.run_until_complete(asyncio.sleep(0.01))
+
+    transport = client.connections[0]
+    assert len(transport.written) == 1
+    assert len(transport.written[0]) == 3
+
+    data = json.dumps([{'jsonrpc': '2.0', 'id': r.uid, 'result': r.uid}
+                       for r in reversed(requests[:2])])
+    transport.protocol.data_received(data.encode('UTF-8'))
+
+    responses = loop.run_until_complete(task)
+    assert [r.result for r in responses[:2]] == [r.uid for r in requests[:2]]
+    assert responses[2] is None
@@ -13,6 +13,7 @@ import asyncio
 import pytest
 
 from hiss.notifier import Notifier
+from hiss.exception import NotifierError
 from hiss.target import Target
 
 asyncio.log.logger.setLevel(asyncio.log.logging.INFO)
@@ -123,3 +124,71 @@ def test_Notifier_Subscribe(async_notifier):
 
     c = coro()
     loop.run_until_complete(c)
+
+
+class DelayHandler(object):
+    __name__ = 'Delay'
+
+    @asyncio.coroutine
+    def notify(self, notification, target):
+        yield from asyncio.sleep(target.port / 1000)
+        return {'status': 'OK', 'target': str(target)}
+
+
+def test_Notifier_NotifyIter(async_notifier):
+    loop = asyncio.get_event_loop()
+
+    handler = DelayHandler()
+    for port in (30, 1, 10):
+        target = Target('snp://192.168.1.1:%d' % port)
+        target.handler = handler
+        async_notifier.targets.append(target)
+
+    @asyncio.coroutine
+    def coro():
+        notification = async_notifier.create_notification(name='Old')
+
+        received = []
+        for next_response in async_notifier.notify_iter(notification):
+            response = yield from next_response
+            received.append(response['target'])
+
+        return received
+
+    received = loop.run_until_complete(coro())
+    assert received == ['snp://192.168.1.1:1', 'snp://192.168.1.1:10',
+                        'snp://192.168.1.1:30']
+
+
+def test_Notifier_NotificationRegistry():
+    n = Notifier('A Notifier', '0b57469a-c9dd-451b-8d86-f82ce11ad09f')
+    ids = [n.add_notification('Class %d' % idx, 'Title', 'Text')
+           for idx in range(1000)]
+    assert ids == list(range(1, 1001))
+
+    notification = n.create_notification(name='Class 500')
+    assert notification.class_id == 501
+    assert notification.name == 'Class 500'
+
+    del n.notification_classes[1000]
+    assert n.add_notification('Another') == 1001
+    assert n.add_notification('Clash', class_id=5) == 1002
+    assert n.notification_classes[5].name == 'Class 4'
+    assert len(n.notification_classes) == 1001
+
+    with pytest.raises(NotifierError):
+        n.find_notification('Class 999')
+
+
+def test_Notifier_NotificationRegistry_Replace():
+    n = Notifier('A Notifier', '0b57469a-c9dd-451b-8d86-f82ce11ad09f')
+    first = n.add_notification('New', 'First')
+    second = n.add_notification('New', 'Second')
+
+    registry = n.notification_classes
+    registry[first] = registry[first]._replace(title='Replaced')
+    assert registry.find_id('New') == first
+
+    registry[first] = registry[first]._replace(name='Old')
+    assert registry.find_id('New') == second
+    assert registry.find_id('Old') == first
@@ -17,9 +17,36 @@ def testTargetList_Append():
     assert len(t.targets) == 1
 
 
-def testTargetList_Append():
+def testTargetList_Remove():
     t = TargetList()
     kt = Target('kodi://192.168.1.1')
-    t.targets.append(kt)
+    t.append(kt)
     t.remove(kt)
     assert len(t.targets) == 0
+
+
+def testTargetList_Contains():
+    t = TargetList()
+    t.append(Target('snp://192.168.1.1'))
+    t.append(Target('snp://192.168.1.1'))
+    assert len(t) == 1
+    assert Target('snp://192.168.1.1') in t
+    assert Target('snp://192.168.1.1:9000') not in t
+    assert Target('gntp://192.168.1.1') not in t
+
+
+def testTargetList_Groups():
+    t = TargetList()
+    targets = [Target('snp://192.168.1.%d' % idx) for idx in range(1, 5)]
+    for idx, target in enumerate(targets):
+        t.append(target, 'even' if idx % 2 == 0 else 'odd')
+    t.tag(targets[0], ['office'])
+
+    assert t.valid_targets('even') == [targets[0], targets[2]]
+    assert t.valid_targets('office') == [targets[0]]
+    assert t.valid_targets('unknown') == []
+
+    t.remove(targets[0])
+    assert t.valid_targets('even') == [targets[2]]
+    assert t.valid_targets('office') == []
+    assert t.valid_targets([targets[0], targets[1]]) == [targets[1]]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+
+import pytest
+
+from hiss.target import Target
+from hiss.handler.ratelimit import RateLimiter, TokenBucket, FLOODING_RATE
+
+
+class FakeLoop(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def loop():
+    return FakeLoop()
+
+
+def test_TokenBucket_Unlimited(loop):
+    b = TokenBucket(loop=loop)
+    assert b.reserve() == 0
+    assert b.reserve() == 0
+
+
+def test_TokenBucket_Rate(loop):
+    b = TokenBucket(rate=2, burst=1, loop=loop)
+    assert b.reserve() == 0
+    assert b.reserve() == pytest.approx(0.5)
+    assert b.reserve() == pytest.approx(1.0)
+
+    loop.now += 10
+    assert b.reserve() == 0
+
+
+def test_TokenBucket_Throttle(loop):
+    b = TokenBucket(loop=loop)
+    b.throttle()
+    assert b.rate == FLOODING_RATE
+    assert b.reserve() > 0
+
+    b.throttle()
+    assert b.rate == FLOODING_RATE / 2
+
+    for _ in range(100):
+        b.recover()
+    assert b.rate is None
+
+
+def test_RateLimiter_Quota(loop):
+    limiter = RateLimiter(loop=loop)
+    target = Target('prowl://apikey')
+
+    limiter.quota(target, 0, time.time() + 60)
+    assert limiter.bucket(target).reserve() == pytest.approx(60, abs=1)
+
+    other = Target('prowl://otherkey')
+    limiter.quota(other, 100, time.time() + 100)
+    assert limiter.bucket(other).rate == pytest.approx(1, rel=0.1)
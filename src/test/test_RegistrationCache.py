@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+
+import pytest
+
+from hiss.target import Target
+from hiss.notifier import Notifier
+from hiss.registration import RegistrationCache
+
+
+class CountingHandler(object):
+    __name__ = 'Counting'
+
+    def __init__(self):
+        self.registered = 0
+
+    @asyncio.coroutine
+    def register(self, notifier, target):
+        self.registered += 1
+        return {'handler': self.__name__, 'status': 'OK'}
+
+    @asyncio.coroutine
+    def notify(self, notification, target):
+        # The registration is lost when the receiver restarts
+        if self.registered < 2:
+            return {'handler': self.__name__, 'status': 'ERROR',
+                    'status_code': 202}
+
+        return {'handler': self.__name__, 'status': 'OK'}
+
+    def not_registered(self, response):
+        return response.get('status_code') == 202
+
+
+@pytest.fixture
+def notifier():
+    n = Notifier('A Notifier', '0b57469a-c9dd-451b-8d86-f82ce11ad09f')
+    n.add_notification('New', 'New email received.')
+    return n
+
+
+def test_RegistrationCache_Fingerprint(notifier):
+    target = Target('snp://192.168.1.1')
+    cache = RegistrationCache()
+
+    assert not cache.is_registered(target, notifier)
+    cache.record(target, notifier)
+    assert cache.is_registered(target, notifier)
+    assert not cache.is_registered(Target('snp://192.168.1.2'), notifier)
+
+    notifier.add_notification('Old', 'Old as an old thing.')
+    assert not cache.is_registered(target, notifier)
+
+
+def test_RegistrationCache_Persist(notifier, tmpdir):
+    path = str(tmpdir.join('registrations.json'))
+    target = Target('snp://192.168.1.1')
+
+    cache = RegistrationCache(path)
+    cache.record(target, notifier)
+    cache.save()
+
+    cache = RegistrationCache(path)
+    assert cache.is_registered(target, notifier)
+
+    cache.forget(target, notifier.signature)
+    cache.save()
+    assert not RegistrationCache(path).is_registered(target, notifier)
+
+
+def test_RegistrationCache_SkipsRegister(notifier):
+    loop = asyncio.get_event_loop()
+    handler = CountingHandler()
+    target = Target('snp://192.168.1.1')
+    target.handler = handler
+
+    notifier.registration_cache = RegistrationCache()
+    notifier.targets.append(target)
+
+    first = loop.run_until_complete(notifier.register())
+    second = loop.run_until_complete(notifier.register())
+    assert handler.registered == 1
+    assert 'cached' not in first
+    assert second['cached']
+
+    loop.run_until_complete(notifier.register(force=True))
+    assert handler.registered == 2
+
+
+def test_RegistrationCache_ReregisterWhenNotRegistered(notifier):
+    loop = asyncio.get_event_loop()
+    handler = CountingHandler()
+    target = Target('snp://192.168.1.1')
+    target.handler = handler
+
+    notifier.registration_cache = RegistrationCache()
+    notifier.targets.append(target)
+    loop.run_until_complete(notifier.register())
+
+    notification = notifier.create_notification(name='New')
+    response = loop.run_until_complete(notifier.notify(notification))
+    assert response['status'] == 'OK'
+    assert handler.registered == 2
+    assert notifier.registration_cache.is_registered(target, notifier)
+
+
+def test_RegistrationCache_Flush(notifier, tmpdir):
+    loop = asyncio.get_event_loop()
+    path = str(tmpdir.join('registrations.json'))
+    target = Target('snp://192.168.1.1')
+
+    cache = RegistrationCache(path, loop=loop)
+    cache.record(target, notifier)
+    notifier.registration_cache = cache
+    notifier.close()
+
+    assert RegistrationCache(path).is_registered(target, notifier)
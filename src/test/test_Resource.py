@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+
+import pytest
+
+import hiss.resource
+from hiss.resource import Icon, ResourceCache, prefetch
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    monkeypatch.setattr(hiss.resource, 'cache', ResourceCache())
+
+    reads = []
+    read_source = hiss.resource._read_source
+
+    def counting_read(source, entry):
+        reads.append(source)
+        return read_source(source, entry)
+
+    monkeypatch.setattr(hiss.resource, '_read_source', counting_read)
+    return reads
+
+
+def file_url(tmpdir, name, data):
+    path = tmpdir.join(name)
+    path.write_binary(data)
+    return 'file://%s' % path
+
+
+def test_Resource_LoadShared(tmpdir, reads):
+    loop = asyncio.get_event_loop()
+    url = file_url(tmpdir, 'icon.png', b'PNG')
+    icons = [Icon(url) for _idx in range(5)]
+
+    results = loop.run_until_complete(
+        asyncio.gather(*[icon.load() for icon in icons]))
+
+    assert results == [b'PNG'] * 5
+    assert reads == [url]
+
+    # Data is available without reading the source again
+    assert Icon(url).data == b'PNG'
+    assert len(reads) == 1
+
+
+def test_Resource_Prefetch(tmpdir, reads):
+    loop = asyncio.get_event_loop()
+    urls = [file_url(tmpdir, 'icon%d.png' % idx, b'PNG') for idx in range(3)]
+
+    loop.run_until_complete(prefetch([Icon(urls[0]), urls[1], urls[2],
+                                      Icon(data=b'inline')]))
+    assert sorted(reads) == sorted(urls)
+    assert len(hiss.resource.cache) == 3
+
+
+def test_Resource_Revalidate(tmpdir, reads):
+    loop = asyncio.get_event_loop()
+    hiss.resource.cache.max_age = -1
+
+    url = file_url(tmpdir, 'icon.png', b'PNG')
+    icon = Icon(url)
+    assert loop.run_until_complete(icon.load()) == b'PNG'
+    assert loop.run_until_complete(icon.load()) == b'PNG'
+    assert len(reads) == 2
+
+    path = tmpdir.join('icon.png')
+    path.write_binary(b'GIF')
+    path.setmtime(path.mtime() + 10)
+    assert loop.run_until_complete(icon.load()) == b'GIF'
+
+
+def test_ResourceCache_MaxBytes():
+    cache = ResourceCache(max_bytes=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    cache.get('a')
+    cache.put('c', b'123')
+
+    assert cache.get('a') == b'12345'
+    assert cache.get('b') is None
+    assert cache.size == 8
+
+    cache.put('d', b'12345678901')
+    assert cache.get('d') is None
+    assert cache.size == 8
+
+
+def test_Resource_EncodedOnce():
+    calls = []
+
+    def encoder(data):
+        calls.append(data)
+        return data.upper()
+
+    icon = Icon(data=b'png')
+    assert icon.encoded('upper', encoder) == b'PNG'
+    assert icon.encoded('upper', encoder) == b'PNG'
+    assert icon.base64 == b'cG5n'
+    assert len(calls) == 1
+
+    icon._data = b'gif'
+    assert icon.encoded('upper', encoder) == b'GIF'
+    assert icon.base64 == b'Z2lm'
+    assert len(calls) == 2
+
+
+def test_Resource_LoadFailed(tmpdir, reads):
+    loop = asyncio.get_event_loop()
+    icon = Icon('file://%s' % tmpdir.join('missing.png'))
+
+    with pytest.raises(OSError):
+        loop.run_until_complete(icon.load())
+
+    # The source is not read again, blocking the loop, when the data is used
+    assert icon.data is None
+    assert icon.base64 is None
+    assert len(reads) == 1
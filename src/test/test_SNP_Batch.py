@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+
+import pytest
+
+from hiss.target import Target
+from hiss.notifier import Notifier
+from hiss.handler.snp import SNPHandler, SNPProtocol, Request
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def notifier():
+    n = Notifier('SNP Notifier', '0b57469a-c9dd-451b-8d86-f82ce11ad09f')
+    n.add_notification('New', 'New email received.')
+    return n
+
+
+@pytest.fixture
+def protocol():
+    p = SNPProtocol()
+    p.connection_made(FakeTransport())
+    p.target = Target('snp://127.0.0.1')
+    p.target.protocol_version = '3.0'
+    return p
+
+
+def test_SNP_Batch_SingleRequest(protocol, notifier):
+    loop = asyncio.get_event_loop()
+    notifications = [notifier.create_notification(name='New')
+                     for _idx in range(3)]
+
+    task = asyncio.async(protocol.notify_batch(notifications))
+    loop.run_until_complete(asyncio.sleep(0))
+
+    assert len(protocol._transport.written) == 1
+    request = Request()
+    request.unmarshal(protocol._transport.written[0])
+    assert [c.name for c in request.commands] == [b'notify'] * 3
+
+    protocol.data_received(b'SNP/3.0 OK\r\n'
+                           b'result: notify 0 OK\r\n'
+                           b'result: notify 208 Flooding\r\n'
+                           b'result: notify 0 OK\r\n'
+                           b'END\r\n')
+
+    result = loop.run_until_complete(task)
+    assert result['status_code'] == 208
+    assert [r['status'] for r in result['results']] == ['OK', 'ERROR', 'OK']
+    assert result['results'][1]['reason'] == 'Flooding'
+
+
+def test_SNP_Batch_Handler(notifier):
+    loop = asyncio.get_event_loop()
+    batches = []
+
+    class FakeProtocol(object):
+        @asyncio.coroutine
+        def notify_batch(self, notifications):
+            batches.append(len(notifications))
+            results = [{'status': 'OK', 'status_code': 0, 'uid': n.uid}
+                       for n in notifications]
+            return {'status': 'OK', 'status_code': 0, 'results': results}
+
+    h = SNPHandler(loop=loop)
+    h.use_batching(window=0.01, size=4)
+
+    @asyncio.coroutine
+    def acquire(target):
+        return FakeProtocol()
+
+    h.acquire = acquire
+    h.release = lambda protocol: None
+
+    target = Target('snp://127.0.0.1')
+    notifications = [notifier.create_notification(name='New')
+                     for _idx in range(6)]
+    tasks = [h.notify(n, target) for n in notifications]
+    results = loop.run_until_complete(asyncio.gather(*tasks))
+
+    assert batches == [4, 2]
+    assert [r['uid'] for r in results] == [n.uid for n in notifications]
+    assert all(r['handler'] == 'SNP' for r in results)
@@ -9,7 +9,7 @@ sys.path.insert(0,
                 os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from hiss.hash import HashInfo
-from hiss.handler.snp import Request
+from hiss.handler.snp import Request, snp64
 
 
 def test_SNP_Request_Create():
@@ -79,3 +79,23 @@ def test_SNP_Request_Unmarshal3():
 	assert request._hash == HashInfo('md5',
 						    'b7c903901cab976ee5db15792eb15a03',
 						    '1A2B3C4D5E6F')
+
+
+def test_SNP_snp64():
+    assert snp64(b'png') == b'cG5n'
+    assert snp64(b'pn') == b'cG4%'
+    assert snp64(b'p') == b'cA%%'
+
+
+def test_SNP_Request_marshal3_Multiple():
+	m = Request(version='3.0')
+	m.append('notify', uid='1', title='a=b&c\r\nd', class_id=['x', ('y', 2)])
+	m.append('notify', icon=b'aWNvbg', uid='2')
+	m.append('version')
+
+	cmd = m.marshal()
+	assert cmd == (b'SNP/3.0 NONE\r\n'
+	               b'notify?class_id=x&class_id=y,2&title=a==b&&c\\nd&uid=1\r\n'
+	               b'notify?icon=aWNvbg&uid=2\r\n'
+	               b'version\r\n'
+	               b'END\r\n')
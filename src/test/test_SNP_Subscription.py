@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+
+import pytest
+
+from hiss.exception import MarshalError
+from hiss.target import Target
+from hiss.handler.snp import ResponseParser, SNPSubscriptionProtocol
+
+EVENT = (b'SNP/3.0 CALLBACK\r\n'
+         b'event-code: 303\r\n'
+         b'notification-uid: 1\r\n'
+         b'END\r\n')
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.closed = False
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_SNP_ResponseParser_Partial():
+    parser = ResponseParser()
+    frames = []
+    for idx in range(len(EVENT)):
+        frames.extend(parser.feed(EVENT[idx:idx + 1]))
+        if idx < len(EVENT) - 1:
+            assert frames == []
+
+    assert frames == [EVENT[:-2]]
+    assert len(parser) == 0
+
+
+def test_SNP_ResponseParser_BackToBack():
+    parser = ResponseParser()
+    frames = parser.feed(EVENT * 3 + EVENT[:10])
+    assert frames == [EVENT[:-2]] * 3
+    assert len(parser) == 10
+
+    assert parser.feed(EVENT[10:]) == [EVENT[:-2]]
+    assert len(parser) == 0
+
+    assert parser.feed(b'SNP/2.0/0/OK\r\nSNP/2', '2.0') == [b'SNP/2.0/0/OK']
+    assert len(parser) == 5
+
+
+def test_SNP_ResponseParser_MaxSize():
+    parser = ResponseParser(max_size=64)
+    parser.feed(EVENT * 10)
+
+    with pytest.raises(MarshalError):
+        parser.feed(b'x' * 65)
+
+
+def test_SNP_Subscription_DispatchEvents():
+    loop = asyncio.get_event_loop()
+    delivered = []
+
+    @asyncio.coroutine
+    def handler(events):
+        delivered.append(events)
+
+    protocol = SNPSubscriptionProtocol()
+    protocol.connection_made(FakeTransport())
+    protocol.target = Target('snp://127.0.0.1')
+    protocol.target.protocol_version = '3.0'
+    protocol._async_handler = handler
+
+    protocol.data_received(EVENT[:20])
+    protocol.data_received(EVENT[20:] + EVENT)
+    loop.run_until_complete(asyncio.sleep(0))
+    assert len(delivered) == 1
+    assert len(delivered[0]) == 2
+
+    protocol.data_received(b'x' * (protocol._parser.max_size + 1))
+    assert protocol._transport.closed
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2014, Simon Kennedy, sffjunkie+code@gmail.com
+#
+# Part of 'hiss' the asynchronous notification library
+
+import os
+import sys
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+
+import pytest
+
+import hiss.handler.snp
+from hiss.target import Target
+from hiss.handler.snp import SNPHandler, BAD_PACKET, UNKNOWN_COMMAND
+
+
+class VersionProtocol(object):
+    requests = 0
+
+    class VersionResponse(object):
+        result = b'44'
+        max_version = '3.0'
+
+    @asyncio.coroutine
+    def get_version(self):
+        VersionProtocol.requests += 1
+        return self.VersionResponse()
+
+
+@pytest.fixture(autouse=True)
+def version_cache(monkeypatch):
+    VersionProtocol.requests = 0
+    monkeypatch.setattr(hiss.handler.snp, '_version_cache',
+                        hiss.handler.snp._VersionCache())
+
+
+def get_version(handler, target):
+    loop = asyncio.get_event_loop()
+    target.port = handler.port
+    loop.run_until_complete(handler._get_version(VersionProtocol(), target))
+
+
+def test_SNP_Version_SharedBetweenTargets():
+    h1 = SNPHandler()
+    h2 = SNPHandler()
+
+    first = Target('snp://192.168.1.1')
+    get_version(h1, first)
+    assert first.api_version == 44
+    assert first.protocol_version == '3.0'
+
+    second = Target('snp://192.168.1.1')
+    get_version(h2, second)
+    assert second.api_version == 44
+    assert VersionProtocol.requests == 1
+
+    get_version(h1, Target('snp://192.168.1.2'))
+    assert VersionProtocol.requests == 2
+
+
+def test_SNP_Version_InvalidatedOnBadPacket():
+    h = SNPHandler()
+    target = Target('snp://192.168.1.1')
+    get_version(h, target)
+
+    h._feedback(target, {'status': 'ERROR', 'status_code': BAD_PACKET})
+    assert not hasattr(target, 'api_version')
+    assert target.protocol_version == ''
+    assert hiss.handler.snp._version_cache.get(target.address) is None
+
+    get_version(h, Target('snp://192.168.1.1'))
+    assert VersionProtocol.requests == 2
+
+
+def test_SNP_Version_Expires(monkeypatch):
+    monkeypatch.setattr(hiss.handler.snp._version_cache, 'ttl', -1)
+
+    h = SNPHandler()
+    get_version(h, Target('snp://192.168.1.1'))
+    get_version(h, Target('snp://192.168.1.1'))
+    assert VersionProtocol.requests == 2
+
+
+def test_SNP_Version_InvalidatedOnUnknownCommand():
+    h = SNPHandler()
+    target = Target('snp://192.168.1.1')
+    get_version(h, target)
+
+    h._feedback(target, {'status': 'ERROR', 'status_code': UNKNOWN_COMMAND})
+    assert target.protocol_version == ''
+
+    get_version(h, target)
+    assert target.api_version == 44
+    assert VersionProtocol.requests == 2
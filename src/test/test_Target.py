@@ -8,7 +8,11 @@ import sys
 sys.path.insert(0,
                 os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import asyncio
+import threading
+
 import pytest
+import hiss.utility
 from hiss.target import Target
 from hiss.exception import TargetError
 
@@ -84,6 +88,49 @@ def test_Target_IsRemote():
     t = Target('snp://wally@192.168.1.1:9000')
     assert t.is_remote
 
+def test_Target_IsRemote_Cached(monkeypatch):
+    lookups = []
+
+    def gethostbyname_ex(name):
+        lookups.append(threading.current_thread())
+        return (name, [], ['192.168.1.50'])
+
+    monkeypatch.setattr(hiss.utility.socket, 'gethostbyname_ex',
+                        gethostbyname_ex)
+    monkeypatch.setattr(hiss.utility, '_local_hosts',
+                        hiss.utility._LocalHosts())
+
+    loop = asyncio.get_event_loop()
+    t = Target('snp://192.168.1.50')
+
+    @asyncio.coroutine
+    def coro():
+        # Only the loopback addresses are known until the lookup completes
+        assert t.is_remote
+        yield from hiss.utility.refresh_local_hosts()
+        assert not t.is_remote
+
+    loop.run_until_complete(coro())
+    assert not t.is_remote
+    assert len(lookups) == 1
+    assert lookups[0] is not threading.current_thread()
+
+def test_Target_IsRemote_Primed(monkeypatch):
+    monkeypatch.setattr(hiss.utility.socket, 'gethostbyname_ex',
+                        lambda name: (name, [], ['192.168.1.50']))
+    monkeypatch.setattr(hiss.utility, '_local_hosts',
+                        hiss.utility._LocalHosts())
+
+    loop = asyncio.get_event_loop()
+    t = Target('snp://192.168.1.50')
+
+    @asyncio.coroutine
+    def coro():
+        yield from hiss.utility.prime_local_hosts()
+        assert not t.is_remote
+
+    loop.run_until_complete(coro())
+
 def test_BadProtocol():
     with pytest.raises(TargetError):
         t = Target('wally')
@@ -102,3 +149,9 @@ def test_PushbulletTarget_Init():
     t = Target('pb://adkhkahs')
     assert t.scheme == 'pb'
     assert t.host == 'adkhkahs'
+
+def test_Target_Hash():
+    targets = {Target('snp://192.168.1.1'): 1}
+    assert Target('snp://wally@192.168.1.1') in targets
+    assert Target('snp://192.168.1.1:9000') not in targets
+    assert Target('gntp://192.168.1.1') not in targets